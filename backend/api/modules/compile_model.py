@@ -1,35 +1,72 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Callable, Iterator, Optional
+from contextlib import contextmanager
 import sys
 from pathlib import Path
+import asyncio
 import io
+import json
+import os
 import zipfile
+import numpy as np
 
 # add services
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
-from services.compile_model import compile_model, CompiledModel
-from api.modules.load_model import get_loaded_model, get_loaded_model_info
+from services.compile_model import compile_model, emit_model, safe_model_name, CompiledModel
+from services.compile_cache import CompileCache, compile_cache_key
+from services.executor import work_executor, ExecutorSaturated
+from services.compile_jobs import CompileJobManager, CompileJob, JOB_DONE, JOB_FAILED
+from services.chunk_stream import ChunkStream, STREAM_CHUNK_SIZE
+from services.quantize_model import quantize_model, QuantizedModel
+from services.benchmark import benchmark_compiled, benchmark_to_dict, DEFAULT_OPT_LEVELS
+from services.parity import check_parity, parity_to_dict
+from services.reference import golden_vectors, GoldenVectors
+from services.instrumentation import instrumented, stage
+from api.modules.load_model import get_stored_model, model_store
+from services.model_store import StoredModel
 
 router = APIRouter(prefix="/compile-model", tags=["compile-model"])
 
-# caching for most recent compilation
-cached_compiled_model: Optional[CompiledModel] = None
-cached_model_name: Optional[str] = None
-cached_target_chip: Optional[str] = None
+# content-addressed compile cache (memory LRU, optional on-disk tier)
+compile_cache = CompileCache(
+    max_bytes=int(os.environ.get("SILICON_COMPILE_CACHE_BYTES", 64 * 1024 * 1024)),
+    disk_dir=os.environ.get("SILICON_COMPILE_CACHE_DIR") or None,
+    disk_max_bytes=int(os.environ.get("SILICON_COMPILE_CACHE_DISK_BYTES", 1024 * 1024 * 1024))
+)
 
-# clears compilation cache (call when a new model is uploaded)
+# background compile jobs, identical in-flight requests share one job
+compile_jobs = CompileJobManager(
+    work_executor,
+    max_jobs=int(os.environ.get("SILICON_COMPILE_JOBS", 256)),
+    max_bytes=int(os.environ.get("SILICON_COMPILE_JOBS_BYTES", 64 * 1024 * 1024)),
+    result_size=lambda result: result[0].nbytes
+)
+
+# golden vectors are embedded in the source, keep the file size bounded
+MAX_GOLDEN_VECTORS = 64
+
+# clears the in-memory compilation cache
 def invalidate_cache():
-    global cached_compiled_model, cached_model_name, cached_target_chip
-    cached_compiled_model = None
-    cached_model_name = None
-    cached_target_chip = None
+    compile_cache.clear()
 
 # model information validation
 class CompileRequest(BaseModel):
+    model_id: Optional[str] = None # from /load-model/upload, may be omitted while only one model is loaded
     model_name: str = "model"
     target_chip: str = "STM32F401" # placeholder target chip for now
+    weights_mode: str = "inline" # "inline" C initializers or "blob" (weights.bin + .incbin stub)
+    quantized: bool = False # int8 code, the model must be calibrated through /compile-model/calibrate first
+    optimize: bool = True # run the graph optimizer (fusion, BatchNorm and constant folding) before codegen
+    golden_vectors: int = 0 # embed this many reference input/output pairs in the ENABLE_INFERENCE_TEST harness
+
+# host benchmark of the generated code, compiled with the same options as /compile
+class BenchmarkRequest(CompileRequest):
+    opt_levels: list[str] = list(DEFAULT_OPT_LEVELS) # host compiler flags, e.g. "-O2"
+    iterations: int = 1000 # timed forward calls per optimization level
+    warmup: int = 50
+    compiler: Optional[str] = None # "gcc", "clang" or "cc", defaults to the first one installed
 
 # model compilation validation
 class CompileResponse(BaseModel):
@@ -38,88 +75,452 @@ class CompileResponse(BaseModel):
     source_code: Optional[str] = None
     header_code: Optional[str] = None
     model_name: Optional[str] = None
+    timings: Optional[dict[str, float]] = None
+    weights_stub: Optional[str] = None
+    weights_size: Optional[int] = None
+    cached: bool = False
+
+# calibration result
+class CalibrationResponse(BaseModel):
+    success: bool
+    error: Optional[str] = None
+    model_id: Optional[str] = None
+    tensors: Optional[int] = None # activations with int8 parameters
+    layers: Optional[int] = None # dense and Conv layers with int8 weights
+    fingerprint: Optional[str] = None
+
+# numeric check of the generated code against the reference executor, golden_vectors is the sample count
+class ParityRequest(CompileRequest):
+    golden_vectors: int = 4
+    opt_level: str = "-O2"
+    compiler: Optional[str] = None
+
+# parity result (see services.parity.ParityReport)
+class ParityResponse(BaseModel):
+    success: bool
+    error: Optional[str] = None
+    passed: Optional[bool] = None
+    report: Optional[dict] = None
+
+# host benchmark result (see services.benchmark.BenchmarkReport)
+class BenchmarkResponse(BaseModel):
+    success: bool
+    error: Optional[str] = None
+    report: Optional[dict] = None
+    cached: bool = False # the generated code came from the compile cache
+
+# compile job state
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    stage: Optional[str] = None
+    progress: float = 0.0
+    error: Optional[str] = None
+    expired: bool = False # result released to bound memory, submit the job again
+    deduplicated: bool = False
+
+# quantization parameters to compile with, None for float code
+def _quantization(entry: StoredModel, request: CompileRequest) -> Optional[QuantizedModel]:
+    if not request.quantized:
+        return None
+    if not _is_calibrated(entry, request):
+        raise ValueError(_missing_calibration_error())
+    return entry.quantization[request.optimize]
+
+# calibration must have run against the graph the request compiles
+def _is_calibrated(entry: StoredModel, request: CompileRequest) -> bool:
+    return request.optimize in entry.quantization
+
+# cache key for compiling a stored model with the request's options (the model is identified by content)
+def _cache_key(entry: StoredModel, request: CompileRequest) -> str:
+    # only compile options key the cache (a BenchmarkRequest carries more)
+    options = request.model_dump(include=set(CompileRequest.model_fields) - {"model_id"})
+    quantization = _quantization(entry, request)
+    if quantization is not None:
+        options["quantization"] = quantization.fingerprint
+    return compile_cache_key(entry.fingerprint, **options)
 
-# gets the cached model or compiles a new one
-def _get_or_compile(request: CompileRequest):
-    global cached_compiled_model, cached_model_name, cached_target_chip
+# reference vectors for the graph a request compiles, None unless the request asks for them
+def _golden(entry: StoredModel, request: CompileRequest) -> Optional[GoldenVectors]:
+    if request.golden_vectors <= 0:
+        return None
+    if request.golden_vectors > MAX_GOLDEN_VECTORS:
+        raise ValueError(f"At most {MAX_GOLDEN_VECTORS} golden vectors can be embedded")
+    graph = entry.graph(request.optimize)
+    quantization = _quantization(entry, request)
+    output_scale = None
+    if quantization is not None:
+        output_scale = quantization.activations[graph.model.graph.output[0].name].scale
+    return golden_vectors(graph, request.golden_vectors, output_scale=output_scale)
+
+# gets the cached model or compiles a new one, returns (compiled, cache hit)
+def _get_or_compile(
+    entry: StoredModel,
+    request: CompileRequest,
+    progress: Optional[Callable[[str], None]] = None
+) -> tuple[CompiledModel, bool]:
+    with stage("compile.cache_lookup"):
+        key = _cache_key(entry, request)
+        compiled = compile_cache.get(key)
+    if compiled is not None:
+        return compiled, True
     
-    if cached_compiled_model and cached_model_name == request.model_name and cached_target_chip == request.target_chip:
-        return cached_compiled_model
+    compiled = compile_model(
+        model=entry.model,
+        model_info=entry.info,
+        model_name=request.model_name,
+        target_chip=request.target_chip,
+        weights_mode=request.weights_mode,
+        index=entry.graph(request.optimize),
+        progress=progress,
+        quantization=_quantization(entry, request),
+        optimize=request.optimize,
+        golden=_golden(entry, request)
+    )
+    compile_cache.put(key, compiled)
+    return compiled, False
+
+
+# adds one file to a zip in slices, so large contents are never encoded or compressed in one piece
+def _write_member(zip_file: zipfile.ZipFile, name: str, data) -> None:
+    with zip_file.open(name, 'w') as member:
+        for start in range(0, len(data), STREAM_CHUNK_SIZE):
+            chunk = data[start:start + STREAM_CHUNK_SIZE]
+            member.write(chunk.encode() if isinstance(chunk, str) else chunk)
+
+
+# packs the generated files into an in-memory zip
+@instrumented("compile.zip")
+def _build_zip(compiled: CompiledModel) -> io.BytesIO:
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for name, data in compiled.files():
+            _write_member(zip_file, name, data)
+    zip_buffer.seek(0)
+    return zip_buffer
+
+
+class _TeeWriter:
+    """Write-only stream that forwards every write to several streams."""
+
+    def __init__(self, *targets):
+        self.targets = targets
+
+    def write(self, data) -> int:
+        for target in self.targets:
+            target.write(data)
+        return len(data)
+
+
+# writes the model's zip into sink as files are generated, runs in the worker pool
+def _stream_zip(entry: StoredModel, request: CompileRequest, sink: ChunkStream) -> None:
+    try:
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            key = _cache_key(entry, request)
+            compiled = compile_cache.get(key)
+            if compiled is not None:
+                for name, data in compiled.files():
+                    _write_member(zip_file, name, data)
+            else:
+                # generated files go straight into the archive, a copy is kept for the cache
+                files = {}
+
+                @contextmanager
+                def open_member(name: str, binary: bool):
+                    copy = io.BytesIO() if binary else io.StringIO()
+                    with zip_file.open(name, 'w') as member:
+                        if binary:
+                            yield _TeeWriter(member, copy)
+                        else:
+                            with io.TextIOWrapper(member, encoding="utf-8", newline="") as text:
+                                yield _TeeWriter(text, copy)
+                    files[name] = copy.getvalue()
+
+                timings = emit_model(
+                    lambda name: open_member(name, False),
+                    lambda name: open_member(name, True),
+                    entry.model, entry.info, request.model_name, request.target_chip,
+                    request.weights_mode, entry.graph(request.optimize),
+                    quantization=_quantization(entry, request), optimize=request.optimize,
+                    golden=_golden(entry, request)
+                )
+                compile_cache.put(key, CompiledModel.from_files(files, request.model_name, request.weights_mode, timings))
+    except BaseException as e:
+        sink.finish(e)
     else:
-        compiled = compile_model(
-            model=get_loaded_model(),
-            model_info=get_loaded_model_info(),
-            model_name=request.model_name,
-            target_chip=request.target_chip
-        )
-        cached_compiled_model = compiled
-        cached_model_name = request.model_name
-        cached_target_chip = request.target_chip
-        return compiled
+        sink.finish()
+
+
+def _iter_chunks(data: bytes) -> Iterator[bytes]:
+    for start in range(0, len(data), STREAM_CHUNK_SIZE):
+        yield data[start:start + STREAM_CHUNK_SIZE]
+
+
+# body of a background compile job, result is (compiled, cache hit); the zip is built when downloaded
+def _run_compile_job(entry: StoredModel, request: CompileRequest, progress: Callable[[str], None]):
+    return _get_or_compile(entry, request, progress)
+
+
+def _compile_response(compiled: CompiledModel, cached: bool) -> CompileResponse:
+    return CompileResponse(
+        success=True,
+        source_code=compiled.source_code,
+        header_code=compiled.header_code,
+        model_name=compiled.model_name,
+        timings=compiled.timings,
+        weights_stub=compiled.weights_stub,
+        weights_size=len(compiled.weights_blob) if compiled.weights_blob is not None else None,
+        cached=cached
+    )
+
+
+def _zip_response(model_name: str, content) -> StreamingResponse:
+    return StreamingResponse(
+        content,
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename={model_name}_c_code.zip"
+        }
+    )
+
+
+# error message when the requested model is not in the store
+def _missing_model_error(request: CompileRequest) -> str:
+    if request.model_id is not None:
+        return f"Unknown or expired model_id '{request.model_id}'. Please upload the model again."
+    if model_store.stats()["models"] > 1:
+        return "Several models are loaded. Pass the model_id returned by /load-model/upload."
+    return "No model loaded. Please upload an ONNX model first."
+
+
+def _missing_calibration_error() -> str:
+    return ("Model has not been calibrated. Upload calibration data to /compile-model/calibrate first, "
+            "with the same optimize setting as the compile request.")
+
+
+# stacked calibration samples from an .npy array or every array of an .npz archive
+def _load_calibration_data(raw: bytes) -> np.ndarray:
+    data = np.load(io.BytesIO(raw), allow_pickle=False)
+    if isinstance(data, np.lib.npyio.NpzFile):
+        with data:
+            arrays = [np.asarray(data[name], dtype=np.float32).reshape(-1) for name in data.files]
+        if not arrays:
+            raise ValueError("Calibration archive contains no arrays")
+        return np.concatenate(arrays)
+    return data
+
+
+def _calibrate(entry: StoredModel, raw: bytes, per_channel: bool, optimize: bool) -> QuantizedModel:
+    return quantize_model(entry.graph(optimize), _load_calibration_data(raw), per_channel)
 
 
 # posts generated C files -  compiles modle to C code, ensures request is valid and model is loaded
 @router.post("/compile", response_model=CompileResponse)
 async def compile_to_c(request: CompileRequest):
-    model = get_loaded_model()
-    model_info = get_loaded_model_info()
+    entry = get_stored_model(request.model_id)
     
     # conditionals to verify model is loaded and formatted correctly
-    if model is None or model_info is None:
+    if entry is None:
         return CompileResponse(
             success=False,
-            error="No model loaded. Please upload an ONNX model first."
+            error=_missing_model_error(request)
         )
     
-    # compiles the model to C code
+    # compiles the model to C code in the worker pool
     try:
-        compiled = _get_or_compile(request)
+        compiled, cached = await work_executor.run(_get_or_compile, entry, request)
         
         # returns a valid CompileResponse Object
-        return CompileResponse(
-            success=True,
-            source_code=compiled.source_code,
-            header_code=compiled.header_code,
-            model_name=compiled.model_name
-        )
+        return _compile_response(compiled, cached)
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         return CompileResponse(
             success=False,
             error=f"Compilation failed: {str(e)}"
         )
 
-# posts zip files for download
+# compiles with golden vectors, then runs the C on the host and compares it with the reference
+def _run_parity(entry: StoredModel, request: ParityRequest) -> dict:
+    if request.golden_vectors <= 0:
+        raise ValueError("Parity needs at least one golden vector")
+    compiled, _ = _get_or_compile(entry, request)
+    report = check_parity(compiled, _golden(entry, request), request.compiler, request.opt_level)
+    return parity_to_dict(report)
+
+@router.post("/parity", response_model=ParityResponse)
+async def check_model_parity(request: ParityRequest):
+    entry = get_stored_model(request.model_id)
+    if entry is None:
+        return ParityResponse(success=False, error=_missing_model_error(request))
+
+    try:
+        report = await work_executor.run(_run_parity, entry, request)
+        return ParityResponse(success=True, passed=report["passed"], report=report)
+    except ExecutorSaturated:
+        raise
+    except Exception as e:
+        return ParityResponse(success=False, error=f"Parity check failed: {str(e)}")
+
+# builds the generated code on the host and times it, at each requested optimization level
+def _run_benchmark(entry: StoredModel, request: BenchmarkRequest) -> tuple[dict, bool]:
+    compiled, cached = _get_or_compile(entry, request)
+    report = benchmark_compiled(
+        compiled, tuple(request.opt_levels), request.iterations, request.warmup, request.compiler
+    )
+    return benchmark_to_dict(report), cached
+
+@router.post("/benchmark", response_model=BenchmarkResponse)
+async def benchmark_model(request: BenchmarkRequest):
+    entry = get_stored_model(request.model_id)
+    if entry is None:
+        return BenchmarkResponse(success=False, error=_missing_model_error(request))
+
+    try:
+        report, cached = await work_executor.run(_run_benchmark, entry, request)
+        return BenchmarkResponse(success=True, report=report, cached=cached)
+    except ExecutorSaturated:
+        raise
+    except Exception as e:
+        return BenchmarkResponse(success=False, error=f"Benchmark failed: {str(e)}")
+
+# quantizes a stored model from calibration samples, later compiles with quantized=True use the result
+@router.post("/calibrate", response_model=CalibrationResponse)
+async def calibrate_model(
+    file: UploadFile = File(...), # .npy array of samples (leading axis) or .npz of arrays
+    model_id: Optional[str] = None,
+    per_channel: bool = True,
+    optimize: bool = True # calibrate the optimized graph, compiles must use the same setting
+):
+    entry = get_stored_model(model_id)
+    if entry is None:
+        return CalibrationResponse(
+            success=False,
+            error=_missing_model_error(CompileRequest(model_id=model_id))
+        )
+    if not file.filename or not file.filename.endswith(('.npy', '.npz')):
+        raise HTTPException(status_code=400, detail="Calibration data must be .npy or .npz")
+    
+    # runs the reference executor over every sample in the worker pool
+    try:
+        raw = await file.read()
+        quantization = await work_executor.run(_calibrate, entry, raw, per_channel, optimize)
+    except ExecutorSaturated:
+        raise
+    except Exception as e:
+        return CalibrationResponse(
+            success=False,
+            error=f"Calibration failed: {str(e)}"
+        )
+    
+    entry.quantization[optimize] = quantization
+    return CalibrationResponse(
+        success=True,
+        model_id=entry.model_id,
+        tensors=len(quantization.activations),
+        layers=len(quantization.layers),
+        fingerprint=quantization.fingerprint
+    )
+
+# posts zip files for download, streamed while the code is generated
 @router.post("/download")
 async def download_c_files(request: CompileRequest):
-    model = get_loaded_model()
-    model_info = get_loaded_model_info()
+    entry = get_stored_model(request.model_id)
     
-    if model is None or model_info is None:
+    if entry is None:
         raise HTTPException(
-            status_code=400,
-            detail="No model loaded. Please upload an ONNX model first."
+            status_code=400 if request.model_id is None else 404,
+            detail=_missing_model_error(request)
         )
     
+    if request.quantized and not _is_calibrated(entry, request):
+        raise HTTPException(status_code=400, detail=_missing_calibration_error())
+    
+    stream = ChunkStream(asyncio.get_running_loop())
+    work_executor.submit(_stream_zip, entry, request, stream)
+    
+    # errors raised before any output (e.g. unsupported operators) still get a proper status
     try:
-        compiled = _get_or_compile(request)
-        
-        # Create zip file in memory
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            zip_file.writestr(f"{compiled.model_name}.c", compiled.source_code)
-            zip_file.writestr(f"{compiled.model_name}.h", compiled.header_code)
-        
-        zip_buffer.seek(0)
-        
-        return StreamingResponse(
-            zip_buffer,
-            media_type="application/zip",
-            headers={
-                "Content-Disposition": f"attachment; filename={compiled.model_name}_c_code.zip"
-            }
-        )
+        await stream.first()
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Failed to generate C code: {str(e)}"
         )
+    return _zip_response(safe_model_name(request.model_name), stream)
+
+
+# starts a background compile and returns its job id, identical in-flight requests share a job
+@router.post("/jobs", response_model=JobResponse)
+async def create_compile_job(request: CompileRequest):
+    entry = get_stored_model(request.model_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=_missing_model_error(request))
+    if request.quantized and not _is_calibrated(entry, request):
+        raise HTTPException(status_code=400, detail=_missing_calibration_error())
+    
+    # hashing the model reads every weight, keep it off the event loop
+    key = await work_executor.run(_cache_key, entry, request)
+    job, deduplicated = compile_jobs.submit(key, lambda progress: _run_compile_job(entry, request, progress))
+    return JobResponse(**job.snapshot(), deduplicated=deduplicated)
+
+
+def _get_job(job_id: str) -> CompileJob:
+    job = compile_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job_id '{job_id}'")
+    return job
+
+
+# (compiled, cache hit) of a finished job, read once since the manager may release it at any time
+def _job_result(job_id: str) -> tuple[CompiledModel, bool]:
+    job = _get_job(job_id)
+    if job.status != JOB_DONE:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}" + (f": {job.error}" if job.error else ""))
+    result = job.result
+    if result is None:
+        raise HTTPException(status_code=410, detail="Job result has expired. Please submit the job again.")
+    return result
+
+
+# current status, stage and progress of a job
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_compile_job(job_id: str):
+    return JobResponse(**_get_job(job_id).snapshot())
+
+
+# server-sent events with a job snapshot on every stage change, ends when the job finishes
+@router.get("/jobs/{job_id}/events")
+async def stream_compile_job(job_id: str):
+    job = _get_job(job_id)
+    
+    async def events():
+        queue = compile_jobs.subscribe(job)
+        try:
+            while True:
+                snapshot = await queue.get()
+                yield f"event: progress\ndata: {json.dumps(snapshot)}\n\n"
+                if snapshot["status"] in (JOB_DONE, JOB_FAILED):
+                    break
+        finally:
+            compile_jobs.unsubscribe(job, queue)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+# generated code of a finished job
+@router.get("/jobs/{job_id}/result", response_model=CompileResponse)
+async def get_compile_job_result(job_id: str):
+    job = _get_job(job_id)
+    if job.status == JOB_FAILED:
+        return CompileResponse(success=False, error=f"Compilation failed: {job.error}")
+    compiled, cached = _job_result(job_id)
+    return _compile_response(compiled, cached)
+
+
+# zip archive of a finished job
+@router.get("/jobs/{job_id}/download")
+async def download_compile_job(job_id: str):
+    compiled, _ = _job_result(job_id)
+    archive = await work_executor.run(_build_zip, compiled)
+    return _zip_response(compiled.model_name, _iter_chunks(archive.getvalue()))
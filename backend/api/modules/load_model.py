@@ -2,22 +2,38 @@ from fastapi import APIRouter, UploadFile, File, HTTPException
 from pydantic import BaseModel
 from typing import Optional
 import sys
+import os
+import atexit
+import shutil
+import tempfile
 from pathlib import Path
 import onnx
 
 # add services
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 from services.load_model import (
-    verify_onnx_with_data, 
+    load_onnx_mapped,
+    build_graph_index,
     extract_model_info,
     ModelInfo,
+    GraphIndex,
 )
+from services.model_store import ModelStore, StoredModel
+from services.optimize_graph import simplify_graph
+from services.executor import work_executor
+from services.instrumentation import stage
 
 router = APIRouter(prefix="/load-model", tags=["load-model"])
 
-# Global storage for loaded model (reused by compile_model)
-_loaded_model: Optional[onnx.ModelProto] = None
-_loaded_model_info: Optional[dict] = None
+# uploaded models addressed by model_id (shared with compile_model and profile_model)
+model_store = ModelStore(
+    max_models=int(os.environ.get("SILICON_MODEL_STORE_MODELS", 8)),
+    max_bytes=int(os.environ.get("SILICON_MODEL_STORE_BYTES", 1024 * 1024 * 1024))
+)
+atexit.register(model_store.clear)
+
+# uploads are streamed to disk in chunks of this size, never held in memory whole
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 
 class UploadResponse(BaseModel):
@@ -51,6 +67,7 @@ class ReactFlowEdge(BaseModel):
 class ImportResponse(BaseModel):
     valid: bool
     error: Optional[str] = None
+    model_id: Optional[str] = None
     nodes: Optional[list[ReactFlowNode]] = None
     edges: Optional[list[ReactFlowEdge]] = None
     model_info: Optional[dict] = None
@@ -75,6 +92,14 @@ OP_DISPLAY_NAMES = {
     'Reshape': 'Reshape',
 }
 
+# streams an upload into a file chunk by chunk
+async def _save_upload(upload: UploadFile, path: str) -> None:
+    with open(path, 'wb') as f:
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            f.write(chunk)
+
+
+# returns (valid, model, info, workdir, error), the workdir holds the mapped weights and is owned by the caller
 async def _validate_and_load(file: UploadFile, data_file: Optional[UploadFile]):
     if not file.filename or not file.filename.endswith('.onnx'):
         raise HTTPException(status_code=400, detail="Model file must be .onnx")
@@ -82,23 +107,38 @@ async def _validate_and_load(file: UploadFile, data_file: Optional[UploadFile]):
     if data_file and data_file.filename and not data_file.filename.endswith('.data'):
         raise HTTPException(status_code=400, detail="Data file must be .data")
     
+    workdir = tempfile.mkdtemp(prefix="silicon-model-", dir=os.environ.get("SILICON_MODEL_STORE_DIR") or None)
+    onnx_path = os.path.join(workdir, "model.onnx")
+    data_path = os.path.join(workdir, "model.data") if data_file else None
     try:
-        onnx_bytes = await file.read()
-        data_bytes = await data_file.read() if data_file else None
-        data_filename = data_file.filename if data_file else None
+        with stage("upload.receive"):
+            await _save_upload(file, onnx_path)
+            if data_file:
+                await _save_upload(data_file, data_path)
     except Exception as e:
+        shutil.rmtree(workdir, ignore_errors=True)
         raise HTTPException(status_code=500, detail=f"Failed to read files: {e}")
     
-    if not data_bytes:
-        return False, None, None, "Data file is required for models with external data"
-    
-    # validate uploaded model
-    is_valid, model, error = verify_onnx_with_data(onnx_bytes, data_bytes, data_filename)
+    # parsing and indexing are CPU bound, run them off the event loop
+    try:
+        is_valid, model, info, error = await work_executor.run(_load_saved_model, onnx_path, data_path)
+    except BaseException:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise
+    if not is_valid:
+        shutil.rmtree(workdir, ignore_errors=True)
+        return False, None, None, None, error
+    return True, model, info, workdir, None
+
+
+# validates the saved files and extracts model info, weights stay on disk and are memory mapped
+def _load_saved_model(onnx_path: str, data_path: Optional[str]):
+    is_valid, model, external_data, error = load_onnx_mapped(onnx_path, data_path)
     if not is_valid:
         return False, None, None, error
-    
-    # extract model info and return both model and info
-    return True, model, extract_model_info(model), None
+    # dead subgraphs, no-ops and constant subexpressions are gone before anything is measured
+    index = simplify_graph(build_graph_index(model, external_data=external_data))
+    return True, index.model, extract_model_info(index.model, index), None
 
 # map model info to dict
 def _model_info_to_dict(info: ModelInfo):
@@ -111,7 +151,8 @@ def _model_info_to_dict(info: ModelInfo):
         "ir_version": info.ir_version,
         "producer_name": info.producer_name,
         "model_version": info.model_version,
-        "total_parameters": info.total_parameters
+        "total_parameters": info.total_parameters,
+        "simplification": info.index.simplification.to_dict() if info.index is not None and info.index.simplification is not None else None
     }
 
 # build react flow graph
@@ -126,12 +167,14 @@ def _build_react_flow_graph(info: ModelInfo) -> tuple[list[ReactFlowNode], list[
         nodes.append(ReactFlowNode(id="input-0", type="inputNode", position=NodePosition(x=100, y=200), label="Input", op_type="Input", shape=shape_str or None))
     
     # layer nodes - calculate params per layer
+    weight_map = info.index.weights if info.index else {w.name: w for w in info.weights}
     for i, layer in enumerate(info.layers):
         # Find params for this layer
         layer_params = 0
         layer_shape = "N/A"
-        for weight in info.weights:
-            if weight.name in layer.inputs:
+        for name in layer.inputs:
+            weight = weight_map.get(name)
+            if weight is not None:
                 layer_params += weight.size
                 if len(weight.shape) >= 2:
                     layer_shape = "x".join(str(d) for d in weight.shape)
@@ -160,32 +203,55 @@ def _build_react_flow_graph(info: ModelInfo) -> tuple[list[ReactFlowNode], list[
 
 @router.post("/upload", response_model=ImportResponse)
 async def upload_onnx(file: UploadFile = File(...), data_file: Optional[UploadFile] = File(None)):
-    global _loaded_model, _loaded_model_info
-    
-    valid, model, info, error = await _validate_and_load(file, data_file)
+    valid, model, info, workdir, error = await _validate_and_load(file, data_file)
     if not valid:
         return ImportResponse(valid=False, error=error)
     
-    # Store model for use by compile_model
-    _loaded_model = model
-    _loaded_model_info = _model_info_to_dict(info)
-    
-    # Generate graph data
-    nodes, edges = _build_react_flow_graph(info)
+    # Store model for use by compile_model and profile_model, the store owns workdir from here on
+    with stage("load.serialize"):
+        entry = model_store.add(model, _model_info_to_dict(info), info.index, workdir)
+        
+        # Generate graph data
+        nodes, edges = _build_react_flow_graph(info)
     
     # Return everything
     return ImportResponse(
         valid=True, 
+        model_id=entry.model_id,
         nodes=nodes, 
         edges=edges, 
-        model_info=_loaded_model_info
+        model_info=entry.info
     )
 
 
-# Getter functions for compile_model module
-def get_loaded_model() -> Optional[onnx.ModelProto]:
-    return _loaded_model
+# releases an uploaded model before it is evicted
+@router.delete("/{model_id}")
+async def delete_model(model_id: str):
+    if not model_store.remove(model_id):
+        raise HTTPException(status_code=404, detail="Unknown model_id")
+    return {"deleted": model_id}
+
+
+# Getter functions for compile_model and profile_model, model_id None means the only stored model
+def get_stored_model(model_id: Optional[str] = None) -> Optional[StoredModel]:
+    return model_store.get(model_id)
+
+
+def get_loaded_model(model_id: Optional[str] = None) -> Optional[onnx.ModelProto]:
+    entry = model_store.get(model_id)
+    return entry.model if entry else None
+
+
+def get_loaded_model_info(model_id: Optional[str] = None) -> Optional[dict]:
+    entry = model_store.get(model_id)
+    return entry.info if entry else None
+
+
+def get_loaded_model_index(model_id: Optional[str] = None) -> Optional[GraphIndex]:
+    entry = model_store.get(model_id)
+    return entry.index if entry else None
 
 
-def get_loaded_model_info() -> Optional[dict]:
-    return _loaded_model_info
+def get_loaded_model_hash(model_id: Optional[str] = None) -> Optional[str]:
+    entry = model_store.get(model_id)
+    return entry.fingerprint if entry else None
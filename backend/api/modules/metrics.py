@@ -0,0 +1,132 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+import sys
+import time
+from pathlib import Path
+
+# add services
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from services.instrumentation import (
+    registry,
+    start_trace,
+    finish_trace,
+    get_trace,
+    set_memory_tracking,
+    memory_tracking_enabled,
+)
+from services.executor import work_executor
+from api.modules.load_model import model_store
+from api.modules.compile_model import compile_cache, compile_jobs
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# request header that turns on the Chrome trace of one request, the response carries TRACE_ID_HEADER
+TRACE_HEADER = "x-silicon-trace"
+TRACE_ID_HEADER = "x-silicon-trace-id"
+
+
+class MemoryTrackingResponse(BaseModel):
+    memory_tracking: bool
+
+
+# stats that count events since startup, exported as counters; every other stat is a gauge
+COUNTER_STATS = {"completed", "rejected", "hits", "misses"}
+
+
+# one sample per stat of a component, counters get the _total suffix
+def _stat_samples(prefix: str, description: str, stats: dict):
+    for key, value in stats.items():
+        text = f"{description} {key.replace('_', ' ')}"
+        if key in COUNTER_STATS:
+            yield f"{prefix}_{key}_total", "counter", text, {}, value
+        else:
+            yield f"{prefix}_{key}", "gauge", text, {}, value
+
+
+# stats of the shared worker pool, model store, compile cache and compile jobs
+def _component_stats():
+    yield from _stat_samples("silicon_executor", "Worker pool", work_executor.stats())
+    yield from _stat_samples("silicon_model_store", "Model store", model_store.stats())
+    yield from _stat_samples("silicon_compile_cache", "Compile cache", compile_cache.stats())
+    yield from _stat_samples("silicon_compile_jobs", "Compile jobs", compile_jobs.stats())
+
+
+registry.add_collector(_component_stats)
+
+
+class InstrumentationMiddleware:
+    """
+    ASGI middleware timing every request and recording opt-in Chrome traces.
+
+    Requests are counted and timed by route template (not raw path, so ids
+    do not explode the label set) until the last body chunk is sent. A
+    request sent with the x-silicon-trace: 1 header collects every stage it
+    runs, including work handed to the worker pool, into a trace whose id
+    comes back in x-silicon-trace-id; fetch it from /metrics/traces/{id}.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        traced = headers.get(TRACE_HEADER.encode(), b"").lower() in (b"1", b"true")
+        trace = token = None
+        if traced:
+            trace, token = start_trace(f"{scope['method']} {scope['path']}")
+        status = 500
+        start = time.perf_counter_ns()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if trace is not None:
+                    message["headers"] = list(message.get("headers", [])) + [(TRACE_ID_HEADER.encode(), trace.trace_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end = time.perf_counter_ns()
+            route = scope.get("route")
+            labels = {"method": scope["method"], "route": getattr(route, "path", "unmatched")}
+            registry.observe("silicon_http_request_seconds", labels, (end - start) / 1e9)
+            registry.inc("silicon_http_requests_total", {**labels, "status": str(status)})
+            if trace is not None:
+                trace.add(f"{scope['method']} {labels['route']}", "http", start, end, {"status": status})
+                finish_trace(token)
+
+
+# every metric in the Prometheus text format
+@router.get("", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+# Chrome trace JSON of a request sent with x-silicon-trace: 1 (load in chrome://tracing or ui.perfetto.dev)
+@router.get("/traces/{trace_id}")
+async def get_request_trace(trace_id: str):
+    trace = get_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired trace_id '{trace_id}'")
+    return trace.to_chrome()
+
+
+@router.get("/memory-tracking", response_model=MemoryTrackingResponse)
+async def get_memory_tracking():
+    return MemoryTrackingResponse(memory_tracking=memory_tracking_enabled())
+
+
+# turns tracemalloc high-water marks per stage on or off, tracing slows allocation-heavy stages down
+@router.put("/memory-tracking", response_model=MemoryTrackingResponse)
+async def update_memory_tracking(enabled: bool):
+    set_memory_tracking(enabled)
+    return MemoryTrackingResponse(memory_tracking=memory_tracking_enabled())
@@ -10,8 +10,15 @@ sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 from services.profile_model import (
     profile_model as service_profile_model,
     profile_to_dict,
+    latency_to_dict,
+    estimate_model_latency,
 )
-from services.load_model import verify_onnx_with_data
+from services.latency_model import fit_calibration, set_calibration, reset_calibration
+from services.load_model import load_onnx_metadata
+from services.executor import work_executor, ExecutorSaturated
+from services.instrumentation import stage
+from services.model_store import StoredModel
+from api.modules.load_model import get_stored_model
 
 router = APIRouter(prefix="/profile-model", tags=["profile-model"])
 
@@ -20,33 +27,102 @@ class ProfileResponse(BaseModel):
     error: Optional[str] = None
     model_info: Optional[dict] = None
 
+# latencies measured on a board, fed back to calibrate the estimator
+class LatencyCalibrationRequest(BaseModel):
+    model_id: str # model from /load-model/upload that was measured
+    board_name: str = "STM32F401"
+    quantized: bool = False
+    batch_size: int = 1
+    optimize: bool = True
+    measured_total_ms: Optional[float] = None # whole inference
+    measured_layers: dict[str, float] = {} # layer name -> ms, as named in the profile
+
+class LatencyCalibrationResponse(BaseModel):
+    success: bool
+    error: Optional[str] = None
+    factors: Optional[dict[str, float]] = None # kernel class -> measured / estimated
+    latency: Optional[dict] = None # calibrated estimate for the measured model
+
 @router.post("/profile", response_model=ProfileResponse)
 async def profile_onnx_model(
-    file: UploadFile = File(...), 
+    file: Optional[UploadFile] = File(None), 
     data_file: Optional[UploadFile] = File(None),
+    model_id: Optional[str] = None, # profile a model from /load-model/upload instead of uploading again
+    data_size: Optional[int] = None, # size of the .data file when it is not uploaded, used for validation
     board_name: str = "STM32F401", # hardcoded for now
     quantized: bool = False,
-    batch_size: int = 1
+    batch_size: int = 1,
+    optimize: bool = True, # profile the graph as the compiler emits it, with before/after metrics
+    deadline_ms: Optional[float] = None # latency budget, reported as meets_deadline
 ):
+    if file is None and model_id is None:
+        raise HTTPException(status_code=400, detail="Either a model file or a model_id is required")
+
     try:
-        # Read file contents
-        onnx_bytes = await file.read()
-        data_bytes = await data_file.read() if data_file else b''
-        data_filename = data_file.filename if data_file else ""
+        index = None
+        if model_id is not None:
+            entry = get_stored_model(model_id)
+            if entry is None:
+                return ProfileResponse(valid=False, error=f"Unknown or expired model_id '{model_id}'")
+            # the stored index has the mapped weights, so optimization folds what the compiler folds
+            model, index = entry.model, entry.index
+        else:
+            # Read the graph only, profiling needs weight shapes and dtypes but never their values
+            onnx_bytes = await file.read()
+            if data_file is not None and data_file.size is not None:
+                data_size = data_file.size
 
-        # Verify and load model
-        valid, model, error = verify_onnx_with_data(onnx_bytes, data_bytes, data_filename)
-        
-        if not valid or model is None:
-            return ProfileResponse(valid=False, error=error or "Failed to load model")
+            # Verify and load model metadata
+            valid, model, error = await work_executor.run(load_onnx_metadata, onnx_bytes, data_size)
+            
+            if not valid or model is None:
+                return ProfileResponse(valid=False, error=error or "Failed to load model")
         
-        # Profile the model
-        profile = service_profile_model(model, board_name=board_name, quantized=quantized, batch_size=batch_size)
+        # Profile the model in the worker pool
+        profile = await work_executor.run(
+            service_profile_model, model, board_name=board_name, quantized=quantized,
+            batch_size=batch_size, optimize=optimize, deadline_ms=deadline_ms, index=index
+        )
         
         # Return profile info as ProfileResponse object
+        with stage("profile.serialize"):
+            model_info = profile_to_dict(profile)
         return ProfileResponse(
             valid=True, 
-            model_info=profile_to_dict(profile)
+            model_info=model_info
         )
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         return ProfileResponse(valid=False, error=str(e))
+
+
+# fits per-kernel latency factors for a board from measurements of a profiled model
+def _calibrate_latency(entry: StoredModel, request: LatencyCalibrationRequest) -> tuple[dict[str, float], dict]:
+    options = dict(
+        board_name=request.board_name, quantized=request.quantized,
+        batch_size=request.batch_size, optimize=request.optimize, index=entry.index
+    )
+    raw = estimate_model_latency(entry.model, calibrated=False, **options)
+    factors = fit_calibration(raw, request.measured_layers, request.measured_total_ms)
+    set_calibration(request.board_name, request.quantized, factors)
+    return factors, latency_to_dict(estimate_model_latency(entry.model, **options))
+
+@router.post("/calibrate-latency", response_model=LatencyCalibrationResponse)
+async def calibrate_latency(request: LatencyCalibrationRequest):
+    entry = get_stored_model(request.model_id)
+    if entry is None:
+        return LatencyCalibrationResponse(success=False, error=f"Unknown or expired model_id '{request.model_id}'")
+    try:
+        factors, latency = await work_executor.run(_calibrate_latency, entry, request)
+        return LatencyCalibrationResponse(success=True, factors=factors, latency=latency)
+    except ExecutorSaturated:
+        raise
+    except Exception as e:
+        return LatencyCalibrationResponse(success=False, error=str(e))
+
+# forgets the calibration of a board (or of every board), estimates fall back to the board database
+@router.delete("/calibrate-latency")
+async def clear_latency_calibration(board_name: Optional[str] = None):
+    reset_calibration(board_name)
+    return {"success": True}
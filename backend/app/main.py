@@ -1,5 +1,6 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 import sys
 from pathlib import Path
 
@@ -8,6 +9,8 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from api.modules.load_model import router as load_model_router
 from api.modules.compile_model import router as compile_model_router
 from api.modules.profile_model import router as profile_model_router
+from api.modules.metrics import router as metrics_router, InstrumentationMiddleware, TRACE_ID_HEADER
+from services.executor import ExecutorSaturated
 
 app = FastAPI(
     title="Silicon API",
@@ -22,9 +25,20 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[TRACE_ID_HEADER],
 )
 
+# request timing and opt-in per-request traces, outermost so it sees every response
+app.add_middleware(InstrumentationMiddleware)
+
+
+# worker pool is full: ask the client to back off instead of queueing unbounded work
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request: Request, exc: ExecutorSaturated):
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
 
 app.include_router(load_model_router)
 app.include_router(compile_model_router)
 app.include_router(profile_model_router)
+app.include_router(metrics_router)
@@ -0,0 +1,420 @@
+from dataclasses import dataclass, field, asdict
+from typing import Callable, Optional
+import gc
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import onnx
+
+from benchmarks.synthetic_models import SyntheticModel, save_synthetic_model, params_label
+
+
+STAGES = ("verify", "extract", "profile", "compile")
+
+# size grids: every combination of params x depth x external data is one case
+GRIDS = {
+    'quick': {
+        'params': (1_000, 100_000, 1_000_000),
+        'depth': (3, 100, 1000),
+        'external_data': (False, True),
+    },
+    'full': {
+        'params': (1_000, 100_000, 1_000_000, 10_000_000, 50_000_000),
+        'depth': (3, 50, 500, 5000),
+        'external_data': (False, True),
+    },
+}
+
+# models at or above this many parameters are compiled with weights_mode="blob"
+BLOB_PARAMS = 1_000_000
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# a metric regresses when it grows by more than the tolerance and by more than the floor
+TIME_TOLERANCE = 0.25
+MEMORY_TOLERANCE = 0.10
+TIME_FLOOR_S = 0.005
+MEMORY_FLOOR_BYTES = 1024 * 1024
+
+# seconds one worker (one case, one stage) may take
+WORKER_TIMEOUT = 3600
+
+# pinned so numpy and BLAS timings do not depend on the machine's core count
+WORKER_ENV = {
+    'OMP_NUM_THREADS': '1',
+    'OPENBLAS_NUM_THREADS': '1',
+    'MKL_NUM_THREADS': '1',
+    'PYTHONHASHSEED': '0',
+}
+
+
+@dataclass
+class StageResult:
+    """Cost of one backend stage on one synthetic model."""
+    case: str
+    stage: str
+    params: int
+    nodes: int
+    external_data: bool
+    wall_s: Optional[float] = None          # fastest of the repeats
+    wall_median_s: Optional[float] = None
+    peak_rss_bytes: Optional[int] = None    # process high-water mark during the first timed run
+    rss_growth_bytes: Optional[int] = None  # peak over the resident size before the stage started
+    alloc_peak_bytes: Optional[int] = None  # peak of Python and NumPy allocations (tracemalloc)
+    error: Optional[str] = None
+
+
+@dataclass
+class Regression:
+    """A metric that got worse than the baseline allows."""
+    case: str
+    stage: str
+    metric: str
+    baseline: Optional[float]
+    current: Optional[float]
+    ratio: Optional[float] = None
+
+
+@dataclass
+class SuiteResults:
+    """Machine-readable output of one benchmark run."""
+    grid: str
+    repeats: int
+    environment: dict
+    results: list[StageResult] = field(default_factory=list)
+
+
+# case id used as the baseline key: p{params}-d{depth}-{inline|ext}
+def case_id(params: int, depth: int, external_data: bool) -> str:
+    return f"p{params_label(params)}-d{depth}-{'ext' if external_data else 'inline'}"
+
+
+def environment() -> dict:
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'onnx': onnx.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+# resident set size and its high-water mark in bytes, from /proc when available
+def _rss() -> tuple[Optional[int], int]:
+    current = None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    current = int(line.split()[1]) * 1024
+                elif line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return current, peak
+
+
+# resets the high-water mark so it only covers what runs next (Linux >= 4.0)
+def _reset_peak_rss() -> None:
+    try:
+        with open("/proc/self/clear_refs", "w") as out:
+            out.write("5")
+    except OSError:
+        pass
+
+
+# the call a stage times, with everything it needs loaded beforehand
+def _stage_call(stage: str, model: SyntheticModel) -> Callable[[], object]:
+    from services.load_model import verify_onnx_with_data, extract_model_info, build_graph_index
+
+    if stage == "verify":
+        with open(model.onnx_path, "rb") as f:
+            onnx_bytes = f.read()
+        data_bytes, data_filename = b"", ""
+        if model.data_path:
+            with open(model.data_path, "rb") as f:
+                data_bytes = f.read()
+            data_filename = os.path.basename(model.data_path)
+
+        def verify():
+            ok, _, error = verify_onnx_with_data(onnx_bytes, data_bytes, data_filename)
+            if not ok:
+                raise ValueError(error)
+        return verify
+
+    proto = onnx.load(model.onnx_path)
+    if stage == "extract":
+        return lambda: extract_model_info(proto)
+    if stage == "profile":
+        from services.profile_model import profile_model
+        return lambda: profile_model(proto)
+    if stage == "compile":
+        from services.compile_model import compile_model
+        model_info = extract_model_info(proto, build_graph_index(proto)).__dict__
+        weights_mode = "blob" if model.params >= BLOB_PARAMS else "inline"
+        return lambda: compile_model(proto, model_info, "bench", weights_mode=weights_mode)
+    raise ValueError(f"Unknown stage '{stage}', expected one of {STAGES}")
+
+
+# measures one stage in this process, run by the parent in a fresh interpreter per stage
+def measure_stage(stage: str, model: SyntheticModel, repeats: int) -> dict:
+    call = _stage_call(stage, model)
+    # one untimed run so lazy imports and first-use setup are not measured
+    call()
+    gc.collect()
+    rss_before, _ = _rss()
+    _reset_peak_rss()
+
+    times = []
+    start = time.perf_counter()
+    call()
+    times.append(time.perf_counter() - start)
+    _, peak = _rss()
+    for _ in range(repeats - 1):
+        start = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - start)
+
+    # allocations are traced on a separate run, tracing slows the stage down
+    gc.collect()
+    tracemalloc.start()
+    try:
+        call()
+        _, alloc_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'wall_s': min(times),
+        'wall_median_s': float(np.median(times)),
+        'peak_rss_bytes': peak,
+        'rss_growth_bytes': max(0, peak - rss_before) if rss_before is not None else None,
+        'alloc_peak_bytes': alloc_peak,
+    }
+
+
+# runs measure_stage in a child interpreter so peak RSS and caches are per stage
+def _run_worker(stage: str, model: SyntheticModel, repeats: int, timeout: int) -> dict:
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command = [
+        sys.executable, "-m", "benchmarks.pipeline", "--worker", stage, model.onnx_path,
+        "--params", str(model.params), "--repeats", str(repeats)
+    ]
+    if model.data_path:
+        command += ["--data", model.data_path]
+    try:
+        result = subprocess.run(
+            command, cwd=backend_dir, capture_output=True, text=True, timeout=timeout,
+            env={**os.environ, **WORKER_ENV}
+        )
+    except subprocess.TimeoutExpired:
+        return {'error': f"timed out after {timeout}s"}
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        detail = (result.stderr or result.stdout).strip().splitlines()
+        return {'error': detail[-1] if detail else f"worker exited with {result.returncode}"}
+    return json.loads(lines[-1])
+
+
+def run_suite(
+    grid: str = "quick",
+    stages: tuple[str, ...] = STAGES,
+    repeats: int = 3,
+    workdir: Optional[str] = None,
+    params: Optional[tuple[int, ...]] = None,
+    depths: Optional[tuple[int, ...]] = None,
+    timeout: int = WORKER_TIMEOUT,
+    progress: Optional[Callable[[str], None]] = None
+) -> SuiteResults:
+    """
+    Measure the backend stages on every synthetic model of a size grid.
+
+    Each (case, stage) runs in a fresh interpreter with one BLAS thread:
+    the inputs are loaded and the stage run once untimed, then it runs
+    repeats times
+    (fastest and median wall time, peak RSS of the first run) and once
+    more under tracemalloc for the allocation peak. Models are generated
+    deterministically into workdir and reused when already there.
+
+    Args:
+        grid: Key of GRIDS
+        stages: Stages to measure, each one of STAGES
+        repeats: Timed runs per case and stage
+        workdir: Where to keep the generated models, a temporary directory by default
+        params: Parameter counts overriding the grid's
+        depths: Depths overriding the grid's
+        timeout: Seconds one case and stage may take
+        progress: Called with a line of text as each measurement finishes
+
+    Returns:
+        SuiteResults with one StageResult per case and stage
+    """
+    if grid not in GRIDS:
+        raise ValueError(f"Unknown grid '{grid}', expected one of {tuple(GRIDS)}")
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown or not stages:
+        raise ValueError(f"Stages must be among {STAGES}, got {list(stages)}")
+    if repeats < 1:
+        raise ValueError(f"repeats must be at least 1, got {repeats}")
+
+    sizes = GRIDS[grid]
+    suite = SuiteResults(grid=grid, repeats=repeats, environment=environment())
+    with tempfile.TemporaryDirectory(prefix="silicon_pipeline_") as tmpdir:
+        directory = workdir or tmpdir
+        for n_params in params or sizes['params']:
+            for depth in depths or sizes['depth']:
+                for external_data in sizes['external_data']:
+                    model = save_synthetic_model(directory, n_params, depth, external_data)
+                    case = case_id(n_params, depth, external_data)
+                    for stage in stages:
+                        result = StageResult(
+                            case=case, stage=stage, params=model.params, nodes=model.nodes, external_data=external_data,
+                            **_run_worker(stage, model, repeats, timeout)
+                        )
+                        suite.results.append(result)
+                        if progress:
+                            progress(_format_result(result))
+    return suite
+
+
+def _format_result(result: StageResult) -> str:
+    if result.error:
+        return f"{result.case:<24} {result.stage:<8} ERROR {result.error}"
+    rss = f"{result.rss_growth_bytes / 2**20:9.1f} MiB" if result.rss_growth_bytes is not None else "        n/a"
+    return (
+        f"{result.case:<24} {result.stage:<8} {result.wall_s * 1000:10.2f} ms"
+        f" rss +{rss} alloc {result.alloc_peak_bytes / 2**20:9.1f} MiB"
+    )
+
+
+def compare_to_baseline(
+    current: SuiteResults,
+    baseline: dict,
+    time_tolerance: float = TIME_TOLERANCE,
+    memory_tolerance: float = MEMORY_TOLERANCE
+) -> list[Regression]:
+    """
+    Find metrics that regressed against a stored baseline.
+
+    Wall time regresses when it grows by more than time_tolerance (as a
+    fraction) and by more than TIME_FLOOR_S; RSS growth and the allocation
+    peak when they grow by more than memory_tolerance and MEMORY_FLOOR_BYTES.
+    A stage that fails now but did not in the baseline is a regression.
+    Cases missing from the baseline are not compared.
+
+    Args:
+        current: Results of this run
+        baseline: A results dict written by an earlier run (suite_to_dict)
+        time_tolerance: Allowed relative growth of wall time
+        memory_tolerance: Allowed relative growth of memory
+
+    Returns:
+        One Regression per metric that got worse
+    """
+    previous = {(entry['case'], entry['stage']): entry for entry in baseline.get('results', [])}
+    checks = (
+        ('wall_s', time_tolerance, TIME_FLOOR_S),
+        ('rss_growth_bytes', memory_tolerance, MEMORY_FLOOR_BYTES),
+        ('alloc_peak_bytes', memory_tolerance, MEMORY_FLOOR_BYTES),
+    )
+    regressions = []
+    for result in current.results:
+        before = previous.get((result.case, result.stage))
+        if before is None:
+            continue
+        if result.error:
+            if not before.get('error'):
+                regressions.append(Regression(result.case, result.stage, 'error', None, None))
+            continue
+        for metric, tolerance, floor in checks:
+            old, new = before.get(metric), getattr(result, metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + tolerance) and new - old > floor:
+                regressions.append(Regression(
+                    result.case, result.stage, metric, old, new, new / old if old else None
+                ))
+    return regressions
+
+
+def suite_to_dict(suite: SuiteResults) -> dict:
+    return asdict(suite)
+
+
+# command line: python -m benchmarks.pipeline [options], run from backend/
+def main() -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark load, profile and compile on synthetic ONNX models")
+    parser.add_argument("--grid", choices=tuple(GRIDS), default="quick")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--params", nargs="+", type=int, help="parameter counts, overrides the grid's")
+    parser.add_argument("--depth", nargs="+", type=int, help="node counts, overrides the grid's")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--workdir", help="keep generated models here and reuse them across runs")
+    parser.add_argument("--timeout", type=int, default=WORKER_TIMEOUT, help="seconds per case and stage")
+    parser.add_argument("--output", help="write the JSON results here")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--time-tolerance", type=float, default=TIME_TOLERANCE)
+    parser.add_argument("--memory-tolerance", type=float, default=MEMORY_TOLERANCE)
+    # internal: measure one stage of one model and print the result as JSON
+    parser.add_argument("--worker", nargs=2, metavar=("STAGE", "MODEL"), help=argparse.SUPPRESS)
+    parser.add_argument("--data", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        stage, onnx_path = args.worker
+        name = os.path.splitext(os.path.basename(onnx_path))[0]
+        model = SyntheticModel(name, onnx_path, args.data, args.params[0] if args.params else 0, 0, 0, 0)
+        print(json.dumps(measure_stage(stage, model, args.repeats)))
+        return 0
+
+    suite = run_suite(
+        args.grid, tuple(args.stages), args.repeats, args.workdir,
+        tuple(args.params) if args.params else None, tuple(args.depth) if args.depth else None,
+        args.timeout, progress=lambda line: print(line, file=sys.stderr)
+    )
+    result = suite_to_dict(suite)
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(result, out, indent=2)
+            out.write("\n")
+    else:
+        print(json.dumps(result, indent=2))
+
+    failed = [r for r in suite.results if r.error]
+    if args.save_baseline:
+        with open(args.baseline, "w") as out:
+            json.dump(result, out, indent=2)
+            out.write("\n")
+        print(f"Baseline written to {args.baseline}", file=sys.stderr)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(suite, baseline, args.time_tolerance, args.memory_tolerance)
+        for r in regressions:
+            if r.metric == 'error':
+                change = "now fails"
+            else:
+                change = f"{r.baseline:.6g} -> {r.current:.6g}" + (f" ({r.ratio:.2f}x)" if r.ratio else "")
+            print(f"REGRESSION {r.case} {r.stage} {r.metric}: {change}", file=sys.stderr)
+        if regressions:
+            return 1
+    else:
+        print(f"No baseline at {args.baseline}, nothing compared (store one with --save-baseline)", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+from dataclasses import dataclass
+from typing import Optional
+import math
+import os
+import numpy as np
+import onnx
+from onnx import helper, numpy_helper, TensorProto
+
+
+# activations between the Gemm layers, cycled so consecutive nodes differ
+FILLER_OPS = ("Relu", "Sigmoid", "Tanh")
+
+# smallest Gemm the generator emits (8x8 weights and bias)
+MIN_GEMM_PARAMS = 72
+
+OPSET = 13
+
+
+@dataclass
+class SyntheticModel:
+    """A generated ONNX model saved to disk."""
+    name: str
+    onnx_path: str
+    data_path: Optional[str]      # external data file, None when the weights are inside the .onnx
+    params: int                   # actual parameter count (the requested one rounded to the layer width)
+    nodes: int
+    width: int
+    gemm_layers: int
+
+
+# number of square Gemm layers and their width for a parameter budget and depth
+def _layout(params: int, depth: int) -> tuple[int, int]:
+    gemm_layers = max(1, min((depth + 1) // 2, params // MIN_GEMM_PARAMS))
+    # each layer holds width^2 weights and width biases
+    width = max(1, int((-1 + math.sqrt(1 + 4 * params / gemm_layers)) / 2))
+    return gemm_layers, width
+
+
+# short label for a parameter count: 1K, 100K, 50M
+def params_label(params: int) -> str:
+    for unit, scale in (("M", 1_000_000), ("K", 1_000)):
+        if params >= scale and params % scale == 0:
+            return f"{params // scale}{unit}"
+    return str(params)
+
+
+def synthetic_model(
+    params: int,
+    depth: int,
+    seed: int = 0
+) -> onnx.ModelProto:
+    """
+    Build an MLP-like chain with about params parameters and exactly depth nodes.
+
+    The chain alternates square Gemm layers (transB=1, as exported by
+    PyTorch) with runs of Relu/Sigmoid/Tanh nodes. There are as many Gemm
+    layers as the depth and parameter budget allow, at least one, so deep
+    models with few parameters are mostly activations. Weights are seeded
+    normals scaled by 1/sqrt(width), so the same arguments always give the
+    same bytes.
+
+    Args:
+        params: Target parameter count
+        depth: Number of nodes in the graph
+        seed: Seed of the weights
+
+    Returns:
+        Checked ONNX model
+    """
+    if params < 1 or depth < 1:
+        raise ValueError(f"params and depth must be positive, got {params} and {depth}")
+    gemm_layers, width = _layout(params, depth)
+    filler = depth - gemm_layers
+    rng = np.random.default_rng(seed)
+
+    nodes, initializers = [], []
+    current = "input"
+    filler_op = 0
+    for layer in range(gemm_layers):
+        weight = rng.standard_normal((width, width), dtype=np.float32) / np.float32(math.sqrt(width))
+        bias = rng.standard_normal(width, dtype=np.float32) * np.float32(0.1)
+        initializers += [
+            numpy_helper.from_array(weight, f"fc{layer}.weight"),
+            numpy_helper.from_array(bias, f"fc{layer}.bias")
+        ]
+        output = f"fc{layer}"
+        nodes.append(helper.make_node(
+            "Gemm", [current, f"fc{layer}.weight", f"fc{layer}.bias"], [output], name=output, transB=1
+        ))
+        current = output
+        # spread the activations evenly, earlier layers take the remainder
+        for step in range(filler // gemm_layers + (1 if layer < filler % gemm_layers else 0)):
+            op = FILLER_OPS[filler_op % len(FILLER_OPS)]
+            output = f"{output}_{op.lower()}{step}"
+            nodes.append(helper.make_node(op, [current], [output], name=output))
+            current = output
+            filler_op += 1
+    nodes[-1].output[0] = "output"
+
+    graph = helper.make_graph(
+        nodes,
+        f"synthetic_{params_label(params)}_{depth}",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [1, width])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, [1, width])],
+        initializers
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", OPSET)], producer_name="silicon-bench")
+    model.ir_version = 8
+    onnx.checker.check_model(model)
+    return model
+
+
+def save_synthetic_model(
+    directory: str,
+    params: int,
+    depth: int,
+    external_data: bool = False,
+    seed: int = 0
+) -> SyntheticModel:
+    """
+    Generate a synthetic model into directory, reusing an earlier file of the same case.
+
+    With external_data every initializer goes to {name}.onnx.data next to
+    the model, as large exported models are shipped.
+
+    Args:
+        directory: Where to write the model (created if missing)
+        params: Target parameter count
+        depth: Number of nodes in the graph
+        external_data: Store the weights in a separate .data file
+        seed: Seed of the weights
+
+    Returns:
+        SyntheticModel describing the files on disk
+    """
+    name = f"synthetic_p{params_label(params)}_d{depth}{'_ext' if external_data else ''}_s{seed}"
+    onnx_path = os.path.join(directory, f"{name}.onnx")
+    data_path = os.path.join(directory, f"{name}.onnx.data") if external_data else None
+    gemm_layers, width = _layout(params, depth)
+
+    if not os.path.exists(onnx_path) or (data_path and not os.path.exists(data_path)):
+        os.makedirs(directory, exist_ok=True)
+        model = synthetic_model(params, depth, seed)
+        if external_data:
+            onnx.save_model(
+                model, onnx_path, save_as_external_data=True, all_tensors_to_one_file=True,
+                location=os.path.basename(data_path), size_threshold=0
+            )
+        else:
+            onnx.save_model(model, onnx_path)
+
+    return SyntheticModel(
+        name=name,
+        onnx_path=onnx_path,
+        data_path=data_path,
+        params=gemm_layers * (width * width + width),
+        nodes=depth,
+        width=width,
+        gemm_layers=gemm_layers
+    )
@@ -0,0 +1,304 @@
+from dataclasses import dataclass, field, asdict
+from typing import Optional
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+
+# add services, so the module also runs as a script (python services/benchmark.py)
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from services.compile_model import CompiledModel
+from services.instrumentation import instrumented
+
+
+# optimization levels the harness accepts (flags are passed to the host compiler verbatim)
+OPT_LEVELS = ("-O0", "-O1", "-O2", "-O3", "-Os", "-Ofast")
+DEFAULT_OPT_LEVELS = ("-O0", "-O2", "-O3", "-Os")
+
+# host compilers tried in order when none is requested, SILICON_HOST_CC overrides
+HOST_COMPILERS = ("gcc", "clang", "cc")
+
+MAX_ITERATIONS = 1_000_000
+
+# seconds a single build or benchmark run may take
+BUILD_TIMEOUT = 300
+RUN_TIMEOUT = 600
+
+BENCH_MAIN = """#define _POSIX_C_SOURCE 199309L
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+#include "{model_name}.h"
+
+static const float bench_input[{input_size}] = {{ {input_values} }};
+static float bench_output[{output_size}];
+
+static long long now_ns(void) {{
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (long long)ts.tv_sec * 1000000000LL + ts.tv_nsec;
+}}
+
+int main(int argc, char** argv) {{
+    long warmup = argc > 1 ? atol(argv[1]) : 0;
+    long iterations = argc > 2 ? atol(argv[2]) : 1;
+    long long* samples = (long long*)malloc((size_t)iterations * sizeof(long long));
+    if (samples == NULL) return 1;
+
+    {model_name}_init();
+    for (long i = 0; i < warmup; i++) {{
+        {model_name}_forward(bench_input, bench_output);
+    }}
+    for (long i = 0; i < iterations; i++) {{
+        long long start = now_ns();
+        {model_name}_forward(bench_input, bench_output);
+        samples[i] = now_ns() - start;
+    }}
+
+    /* line 1: output of the last run, line 2: per-iteration times in ns */
+    for (size_t i = 0; i < {output_size}; i++) printf("%.9g ", (double)bench_output[i]);
+    printf("\\n");
+    for (long i = 0; i < iterations; i++) printf("%lld ", samples[i]);
+    printf("\\n");
+    free(samples);
+    return 0;
+}}
+"""
+
+
+@dataclass
+class CodeSize:
+    """Section sizes of the model's object files in bytes (harness excluded)."""
+    text: int
+    rodata: int
+    data: int
+    bss: int
+
+
+@dataclass
+class BenchmarkRun:
+    """Timing of the generated code built at one optimization level."""
+    opt_level: str
+    latency_us: dict[str, float]             # min, mean, p50, p90, p99, max, std
+    code_size: Optional[CodeSize]            # None when binutils 'size' is not available
+    build_seconds: float
+    output: list[float] = field(default_factory=list)  # model output for the benchmark input
+
+
+@dataclass
+class BenchmarkReport:
+    """Host benchmark of one compiled model across optimization levels."""
+    model_name: str
+    compiler: str
+    compiler_version: str
+    iterations: int
+    warmup: int
+    arena_bytes: Optional[int]
+    input_size: int
+    output_size: int
+    runs: list[BenchmarkRun] = field(default_factory=list)
+
+
+# path of the host C compiler to build with
+def find_host_compiler(name: Optional[str] = None) -> str:
+    candidates = [name] if name else [os.environ.get("SILICON_HOST_CC")] + list(HOST_COMPILERS)
+    for candidate in candidates:
+        if name and candidate not in HOST_COMPILERS:
+            raise ValueError(f"Unknown host compiler '{candidate}', expected one of {HOST_COMPILERS}")
+        path = shutil.which(candidate) if candidate else None
+        if path:
+            return path
+    raise ValueError(f"No host C compiler found (tried {', '.join(c for c in candidates if c)})")
+
+
+# integer value of a #define in the generated header
+def _header_define(header: str, model_name: str, suffix: str) -> Optional[int]:
+    match = re.search(rf"#define\s+{model_name.upper()}_{suffix}\s+(\d+)", header)
+    return int(match.group(1)) if match else None
+
+
+# .text/.rodata/.data/.bss of object files from 'size -A', subsections (.rodata.x, .text.y) included
+def _code_size(objects: list[str], cwd: str) -> Optional[CodeSize]:
+    size_tool = shutil.which("size")
+    if size_tool is None:
+        return None
+    totals = {"text": 0, "rodata": 0, "data": 0, "bss": 0}
+    result = subprocess.run([size_tool, "-A", *objects], cwd=cwd, capture_output=True, text=True, timeout=BUILD_TIMEOUT)
+    if result.returncode != 0:
+        return None
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        if len(parts) < 2 or not parts[0].startswith(".") or not parts[1].isdigit():
+            continue
+        section = parts[0][1:].split(".")[0]
+        if section in totals:
+            totals[section] += int(parts[1])
+    return CodeSize(**totals)
+
+
+# runs a build tool or binary, raising with the tail of its output when it fails
+def run_command(command: list[str], cwd: str, timeout: int, what: str) -> str:
+    result = subprocess.run(command, cwd=cwd, capture_output=True, text=True, timeout=timeout)
+    if result.returncode != 0:
+        detail = (result.stderr or result.stdout).strip().splitlines()[-20:]
+        raise ValueError(f"{what} failed:\n" + "\n".join(detail))
+    return result.stdout
+
+
+def _latency_stats(samples_ns: np.ndarray) -> dict[str, float]:
+    us = samples_ns / 1000.0
+    return {
+        "min": float(us.min()),
+        "mean": float(us.mean()),
+        "p50": float(np.percentile(us, 50)),
+        "p90": float(np.percentile(us, 90)),
+        "p99": float(np.percentile(us, 99)),
+        "max": float(us.max()),
+        "std": float(us.std())
+    }
+
+
+@instrumented("benchmark")
+def benchmark_compiled(
+    compiled: CompiledModel,
+    opt_levels: tuple[str, ...] = DEFAULT_OPT_LEVELS,
+    iterations: int = 1000,
+    warmup: int = 50,
+    compiler: Optional[str] = None,
+    input_data: Optional[np.ndarray] = None,
+    seed: int = 0
+) -> BenchmarkReport:
+    """
+    Build generated C with the host compiler and time {model}_forward.
+
+    Every optimization level gets a fresh build of the model, its weight
+    blob (in "blob" mode) and a harness that runs warmup untimed forwards,
+    then times each of iterations forwards with CLOCK_MONOTONIC. Code size
+    is measured on the model's object files only.
+
+    Args:
+        compiled: Output of compile_model
+        opt_levels: Compiler optimization flags, each one of OPT_LEVELS
+        iterations: Timed forward calls per optimization level
+        warmup: Untimed forward calls before timing
+        compiler: 'gcc', 'clang' or 'cc', defaults to the first one installed
+        input_data: Model input (INPUT_SIZE floats), random normal from seed by default
+        seed: Seed of the default input
+
+    Returns:
+        BenchmarkReport with one BenchmarkRun per optimization level
+    """
+    unknown = [level for level in opt_levels if level not in OPT_LEVELS]
+    if unknown or not opt_levels:
+        raise ValueError(f"Optimization levels must be among {OPT_LEVELS}, got {list(opt_levels)}")
+    if not 1 <= iterations <= MAX_ITERATIONS or not 0 <= warmup <= MAX_ITERATIONS:
+        raise ValueError(f"iterations must be in [1, {MAX_ITERATIONS}] and warmup in [0, {MAX_ITERATIONS}]")
+
+    cc = find_host_compiler(compiler)
+    name = compiled.model_name
+    input_size = _header_define(compiled.header_code, name, "INPUT_SIZE")
+    output_size = _header_define(compiled.header_code, name, "OUTPUT_SIZE")
+    if input_data is None:
+        input_data = np.random.default_rng(seed).normal(size=input_size)
+    input_data = np.asarray(input_data, dtype=np.float32).reshape(-1)
+    if input_data.size != input_size:
+        raise ValueError(f"Input has {input_data.size} values, the model takes {input_size}")
+
+    version = run_command([cc, "--version"], ".", BUILD_TIMEOUT, "Querying the compiler").splitlines()
+    report = BenchmarkReport(
+        model_name=name,
+        compiler=os.path.basename(cc),
+        compiler_version=version[0] if version else "",
+        iterations=iterations,
+        warmup=warmup,
+        arena_bytes=_header_define(compiled.header_code, name, "ARENA_SIZE"),
+        input_size=input_size,
+        output_size=output_size
+    )
+
+    with tempfile.TemporaryDirectory(prefix="silicon_bench_") as workdir:
+        for filename, data in compiled.files():
+            with open(os.path.join(workdir, filename), "wb" if isinstance(data, bytes) else "w") as out:
+                out.write(data)
+        with open(os.path.join(workdir, "bench_main.c"), "w") as out:
+            out.write(BENCH_MAIN.format(
+                model_name=name,
+                input_size=input_size,
+                output_size=output_size,
+                input_values=", ".join(f"{float(v):.9e}f" for v in input_data)
+            ))
+
+        sources = [f"{name}.c"] + ([f"{name}_weights.S"] if compiled.weights_blob is not None else [])
+        for level in opt_levels:
+            start = time.perf_counter()
+            objects = []
+            for source in sources:
+                obj = f"{os.path.splitext(source)[0]}{level}.o"
+                run_command([cc, "-std=c99", level, "-I.", "-c", source, "-o", obj], workdir, BUILD_TIMEOUT, f"Building {source} with {level}")
+                objects.append(obj)
+            binary = f"bench{level}"
+            run_command([cc, "-std=c99", level, "-I.", "bench_main.c", *objects, "-lm", "-o", binary], workdir, BUILD_TIMEOUT, f"Linking with {level}")
+            build_seconds = time.perf_counter() - start
+
+            lines = run_command([os.path.join(workdir, binary), str(warmup), str(iterations)], workdir, RUN_TIMEOUT, f"Running the {level} build").splitlines()
+            report.runs.append(BenchmarkRun(
+                opt_level=level,
+                latency_us=_latency_stats(np.array(lines[1].split(), dtype=np.float64)),
+                code_size=_code_size(objects, workdir),
+                build_seconds=build_seconds,
+                output=[float(v) for v in lines[0].split()]
+            ))
+    return report
+
+
+def benchmark_to_dict(report: BenchmarkReport) -> dict:
+    return asdict(report)
+
+
+# command line: python -m services.benchmark model.onnx [options], run from backend/
+if __name__ == "__main__":
+    import argparse
+    import json
+    import onnx
+    from services.compile_model import compile_model
+    from services.load_model import build_graph_index, extract_model_info
+    from services.optimize_graph import optimize_graph
+    from services.quantize_model import quantize_model
+
+    parser = argparse.ArgumentParser(description="Build the generated C on the host and time it")
+    parser.add_argument("model", help="ONNX model (its external data is loaded from the same directory)")
+    parser.add_argument("--name", default="model", help="model name used for the generated files")
+    parser.add_argument(
+        "--opt", nargs="+", default=[level[1:] for level in DEFAULT_OPT_LEVELS],
+        choices=[level[1:] for level in OPT_LEVELS], help="optimization levels without the dash, e.g. O2 Os"
+    )
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--compiler", choices=HOST_COMPILERS, default=None)
+    parser.add_argument("--weights-mode", choices=("inline", "blob"), default="inline")
+    parser.add_argument("--no-optimize", action="store_true", help="skip the graph optimizer")
+    parser.add_argument("--calibration", help=".npy of calibration samples, benchmarks the int8 code")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    model = onnx.load(args.model)
+    index = build_graph_index(model)
+    graph = index if args.no_optimize else optimize_graph(index)
+    quantization = quantize_model(graph, np.load(args.calibration)) if args.calibration else None
+    compiled = compile_model(
+        model, extract_model_info(model, index).__dict__, args.name, weights_mode=args.weights_mode,
+        index=graph, quantization=quantization, optimize=not args.no_optimize
+    )
+    result = json.dumps(benchmark_to_dict(benchmark_compiled(
+        compiled, tuple(f"-{level}" for level in args.opt), args.iterations, args.warmup, args.compiler
+    )), indent=2)
+    if args.output:
+        with open(args.output, "w") as out:
+            out.write(result + "\n")
+    else:
+        print(result)
@@ -0,0 +1,63 @@
+from typing import Optional
+
+
+DEFAULT_BOARD = 'STM32F401'
+
+# Hardcoded board constraints for now - replaced by agent connection to MCP
+#
+# Timing entries describe the kernels compile_model generates (plain C99 built
+# with -O2, no SIMD intrinsics), not the best case of the core:
+#   cycles_per_mac: inner-loop cycles per multiply-accumulate by kernel class,
+#       loads included, for float and int8 code
+#   cycles_per_flop: any other arithmetic op (activations, pooling, bias, ...)
+#   cycles_per_transcendental: one expf/tanhf/sqrtf call from the C library
+#   flash_wait_states: stall cycles per flash line fetched for constant data
+#   flash_line_bytes: bytes delivered per flash line fetch
+#   memory_bandwidth: sustained SRAM bandwidth in bytes per second
+#   layer_overhead_cycles: call, loop setup and pointer arithmetic per layer
+#   active_power_mw: core + SRAM + flash power while running at clock_hz
+BOARD_CONSTRAINTS = {
+    'STM32F401': {
+        'ram_total': 96 * 1024,       # 96KB SRAM
+        'flash_total': 512 * 1024,    # 512KB Flash
+        'core': 'Cortex-M4F',
+        'clock_hz': 84_000_000,
+        'fpu': True,                  # single precision
+        'dsp': True,                  # SIMD MAC instructions, unused by the generated kernels
+        'cycles_per_mac': {
+            'float': {'dense': 3.0, 'conv': 3.5, 'depthwise': 4.5},
+            'int8': {'dense': 2.0, 'conv': 2.5, 'depthwise': 3.5},
+        },
+        'cycles_per_flop': 1.5,
+        'cycles_per_transcendental': 120,
+        'flash_wait_states': 2,       # at 84 MHz, 3.3 V
+        'flash_line_bytes': 16,       # 128-bit ART accelerator line
+        'memory_bandwidth': 336_000_000,  # 32-bit bus at 84 MHz
+        'layer_overhead_cycles': 200,
+        'active_power_mw': 40.0,
+    },
+    'ESP32': {
+        'ram_total': 320 * 1024,      # 320KB SRAM
+        'flash_total': 4 * 1024 * 1024,  # 4MB Flash
+        'core': 'Xtensa LX6',
+        'clock_hz': 240_000_000,
+        'fpu': True,                  # single precision
+        'dsp': False,
+        'cycles_per_mac': {
+            'float': {'dense': 2.5, 'conv': 3.0, 'depthwise': 4.0},
+            'int8': {'dense': 2.0, 'conv': 2.5, 'depthwise': 3.5},
+        },
+        'cycles_per_flop': 1.5,
+        'cycles_per_transcendental': 100,
+        'flash_wait_states': 60,      # cache miss to external QSPI flash
+        'flash_line_bytes': 32,       # flash cache line
+        'memory_bandwidth': 960_000_000,  # 32-bit internal SRAM at 240 MHz
+        'layer_overhead_cycles': 200,
+        'active_power_mw': 160.0,     # one core active, radio off
+    },
+}
+
+
+# board entry by name, unknown boards fall back to the default board
+def get_board(board_name: Optional[str]) -> dict:
+    return BOARD_CONSTRAINTS.get(board_name, BOARD_CONSTRAINTS[DEFAULT_BOARD])
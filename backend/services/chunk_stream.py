@@ -0,0 +1,118 @@
+from typing import AsyncIterator, Optional
+import asyncio
+import threading
+
+
+# bytes collected before a chunk is handed to the event loop
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# chunks that may wait for the consumer before the writer blocks
+STREAM_MAX_CHUNKS = 8
+
+
+class StreamCancelled(Exception):
+    """Raised in the writer thread once the consumer has stopped reading."""
+
+
+class _End:
+    def __init__(self, error: Optional[BaseException] = None):
+        self.error = error
+
+
+class ChunkStream:
+    """
+    Unseekable binary sink written by a worker thread and read as an async iterator.
+
+    Writes are gathered into STREAM_CHUNK_SIZE chunks and at most max_chunks
+    of them are buffered; a writer that gets further ahead blocks until the
+    consumer catches up, so memory stays bounded however large the output is.
+    If the consumer goes away the writer's next write raises StreamCancelled.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_chunks: int = STREAM_MAX_CHUNKS):
+        self._loop = loop
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._slots = threading.Semaphore(max_chunks)
+        self._max_chunks = max_chunks
+        self._buffer = bytearray()
+        self._position = 0
+        self._cancelled = False
+        self._closed = False
+        self._peeked = None
+
+    # file-like interface for the writer thread (zipfile, tarfile, ...)
+    def write(self, data) -> int:
+        if self._cancelled:
+            raise StreamCancelled()
+        self._buffer += data
+        self._position += len(data)
+        if len(self._buffer) >= STREAM_CHUNK_SIZE:
+            self._post(bytes(self._buffer))
+            self._buffer.clear()
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        """Flush what is left and end the stream, re-raising error in the consumer"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._buffer and error is None and not self._cancelled:
+            self._post(bytes(self._buffer))
+        self._buffer.clear()
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, _End(error))
+
+    def cancel(self) -> None:
+        """Called by the consumer when it stops reading, unblocks and aborts the writer"""
+        self._cancelled = True
+        self._slots.release(self._max_chunks)
+
+    def _post(self, chunk: bytes) -> None:
+        self._slots.acquire()
+        if self._cancelled:
+            raise StreamCancelled()
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, chunk)
+
+    async def _next(self):
+        if self._peeked is not None:
+            item, self._peeked = self._peeked, None
+            return item
+        return await self._queue.get()
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        try:
+            while True:
+                item = await self._next()
+                if isinstance(item, _End):
+                    if item.error is not None:
+                        raise item.error
+                    return
+                self._slots.release()
+                yield item
+        finally:
+            self.cancel()
+
+    async def first(self) -> Optional[bytes]:
+        """
+        Wait for the first chunk without consuming it.
+
+        Returns None if the stream ended without data and raises the writer's
+        error if it failed before producing any output.
+        """
+        item = self._peeked = await self._next()
+        if isinstance(item, _End):
+            if item.error is not None:
+                raise item.error
+            return None
+        return item
@@ -0,0 +1,189 @@
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+import ast
+import hashlib
+import importlib
+import json
+import os
+import threading
+
+from services.compile_model import CompiledModel
+
+
+# source files of a services module and every services module it imports, directly or not
+def _services_sources(root: str) -> tuple[str, ...]:
+    seen = set()
+    pending = [root]
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        tree = ast.parse(Path(importlib.import_module(name).__file__).read_text())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names = [node.module]
+            elif isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            else:
+                continue
+            pending.extend(n for n in names if n.startswith("services."))
+    return tuple(sorted(importlib.import_module(name).__file__ for name in seen))
+
+
+# files whose contents determine the generated code (compile_model and its services imports); part of every cache key
+_CODEGEN_SOURCES = _services_sources("services.compile_model")
+
+
+def _codegen_fingerprint() -> str:
+    hasher = hashlib.blake2b(digest_size=16)
+    for path in _CODEGEN_SOURCES:
+        hasher.update(Path(path).read_bytes())
+    return hasher.hexdigest()
+
+
+CODEGEN_FINGERPRINT = _codegen_fingerprint()
+
+
+# cache key from a model fingerprint and every option that affects code generation
+def compile_cache_key(model_hash: str, **options) -> str:
+    payload = json.dumps({"model": model_hash, "codegen": CODEGEN_FINGERPRINT, **options}, sort_keys=True)
+    return hashlib.blake2b(payload.encode(), digest_size=32).hexdigest()
+
+
+class CompileCache:
+    """
+    Multi-entry cache of compiled models with LRU eviction under a byte budget.
+
+    Entries are keyed by compile_cache_key. When a directory is given, entries
+    are also written to disk and looked up there on a memory miss, so they
+    survive restarts. The disk tier has its own byte budget and evicts the
+    least recently used files.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, disk_dir: Optional[str] = None, disk_max_bytes: int = 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: OrderedDict[str, tuple[CompiledModel, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    def get(self, key: str) -> Optional[CompiledModel]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        compiled = self._read_disk(key)
+        with self._lock:
+            if compiled is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._insert(key, compiled)
+        return compiled
+
+    def put(self, key: str, compiled: CompiledModel) -> None:
+        with self._lock:
+            self._insert(key, compiled)
+        self._write_disk(key, compiled)
+
+    def clear(self) -> None:
+        """Drop the memory tier (the disk tier is content addressed and stays valid)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _insert(self, key: str, compiled: CompiledModel) -> None:
+        size = compiled.nbytes
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (compiled, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+
+    # disk tier: <key>.json holds code and metadata, <key>.bin the optional weight blob
+    def _read_disk(self, key: str) -> Optional[CompiledModel]:
+        if self.disk_dir is None:
+            return None
+        meta_path = self.disk_dir / f"{key}.json"
+        try:
+            meta = json.loads(meta_path.read_text())
+            blob_path = self.disk_dir / f"{key}.bin"
+            blob = blob_path.read_bytes() if meta.get("has_blob") else None
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            return None
+        return CompiledModel(
+            source_code=meta["source_code"],
+            header_code=meta["header_code"],
+            model_name=meta["model_name"],
+            timings=meta.get("timings", {}),
+            weights_mode=meta.get("weights_mode", "inline"),
+            weights_blob=blob,
+            weights_stub=meta.get("weights_stub")
+        )
+
+    def _write_disk(self, key: str, compiled: CompiledModel) -> None:
+        if self.disk_dir is None:
+            return
+        meta = {
+            "source_code": compiled.source_code,
+            "header_code": compiled.header_code,
+            "model_name": compiled.model_name,
+            "timings": compiled.timings,
+            "weights_mode": compiled.weights_mode,
+            "weights_stub": compiled.weights_stub,
+            "has_blob": compiled.weights_blob is not None,
+        }
+        try:
+            if compiled.weights_blob is not None:
+                _atomic_write(self.disk_dir / f"{key}.bin", compiled.weights_blob)
+            _atomic_write(self.disk_dir / f"{key}.json", json.dumps(meta).encode())
+            self._evict_disk()
+        except OSError:
+            pass
+
+    def _evict_disk(self) -> None:
+        entries = sorted(self.disk_dir.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        sizes = {p: p.stat().st_size + _blob_size(p) for p in entries}
+        total = sum(sizes.values())
+        for path in entries:
+            if total <= self.disk_max_bytes:
+                break
+            total -= sizes[path]
+            path.unlink(missing_ok=True)
+            path.with_suffix(".bin").unlink(missing_ok=True)
+
+
+def _blob_size(meta_path: Path) -> int:
+    blob_path = meta_path.with_suffix(".bin")
+    return blob_path.stat().st_size if blob_path.exists() else 0
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    tmp = path.with_suffix(f"{path.suffix}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
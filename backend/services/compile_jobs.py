@@ -0,0 +1,178 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+import asyncio
+import threading
+import time
+import uuid
+
+from services.executor import WorkExecutor
+
+
+# stages reported by a compile job, in order
+JOB_STAGES = ("parse", "optimize", "plan", "emit weights", "emit code")
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+@dataclass
+class CompileJob:
+    """State of one background compile, observable through snapshots and event subscriptions."""
+    job_id: str
+    key: str                            # compile cache key, identical requests share a job while in flight
+    status: str = JOB_QUEUED
+    stage: Optional[str] = None
+    error: Optional[str] = None
+    result: Any = None                  # whatever the job function returned, released once evicted
+    result_bytes: int = 0               # memory held by result, counted against the manager's budget
+    expired: bool = False               # result was dropped to stay within the byte budget
+    created: float = field(default_factory=time.time)
+    finished: Optional[float] = None
+    _subscribers: list = field(default_factory=list, repr=False)
+
+    @property
+    def progress(self) -> float:
+        """Fraction of stages started (1.0 once done)"""
+        if self.status == JOB_DONE:
+            return 1.0
+        if self.stage not in JOB_STAGES:
+            return 0.0
+        return JOB_STAGES.index(self.stage) / len(JOB_STAGES)
+
+    def snapshot(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+            "error": self.error,
+            "expired": self.expired,
+        }
+
+
+class CompileJobManager:
+    """
+    Runs compile jobs on a WorkExecutor and keeps their state for polling.
+
+    Submitting a request whose key matches a job that is still queued or
+    running returns that job instead of starting a second compile. Finished
+    jobs are kept until max_jobs is exceeded, oldest first. Their results
+    (measured by result_size) share a byte budget: once it is exceeded the
+    oldest results are released and those jobs report expired. Event subscribers
+    receive a snapshot on every status or stage change; updates are posted to
+    their event loop from the worker thread.
+    """
+
+    def __init__(
+        self,
+        executor: WorkExecutor,
+        max_jobs: int = 256,
+        max_bytes: int = 64 * 1024 * 1024,
+        result_size: Callable[[Any], int] = lambda result: 0
+    ):
+        self.executor = executor
+        self.max_jobs = max_jobs
+        self.max_bytes = max_bytes
+        self.result_size = result_size
+        self._jobs: OrderedDict[str, CompileJob] = OrderedDict()
+        self._in_flight: dict[str, CompileJob] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, fn: Callable[[Callable[[str], None]], Any]) -> tuple[CompileJob, bool]:
+        """
+        Start fn(progress) in the background unless an identical job is in flight.
+
+        Returns:
+            Tuple of (job, deduplicated)
+        """
+        with self._lock:
+            job = self._in_flight.get(key)
+            if job is not None:
+                return job, True
+            job = CompileJob(job_id=uuid.uuid4().hex, key=key)
+            # raises ExecutorSaturated before the job is registered
+            self.executor.submit(self._run, job, fn)
+            self._in_flight[key] = job
+            self._jobs[job.job_id] = job
+            self._evict_finished()
+        return job, False
+
+    def get(self, job_id: str) -> Optional[CompileJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def subscribe(self, job: CompileJob) -> asyncio.Queue:
+        """Queue on the running event loop that receives a snapshot after every update"""
+        queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            job._subscribers.append((loop, queue))
+            queue.put_nowait(job.snapshot())
+        return queue
+
+    def unsubscribe(self, job: CompileJob, queue: asyncio.Queue) -> None:
+        with self._lock:
+            job._subscribers = [(loop, q) for loop, q in job._subscribers if q is not queue]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._jobs),
+                "in_flight": len(self._in_flight),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _run(self, job: CompileJob, fn: Callable) -> None:
+        self._update(job, status=JOB_RUNNING)
+        try:
+            result = fn(lambda stage: self._update(job, stage=stage))
+        except Exception as e:
+            self._update(job, status=JOB_FAILED, error=str(e))
+        else:
+            # measured outside the lock, results can be large
+            self._update(job, status=JOB_DONE, result=result, result_bytes=self.result_size(result))
+
+    def _update(self, job: CompileJob, **changes) -> None:
+        with self._lock:
+            # stages may be reported more than once
+            if set(changes) == {"stage"} and job.stage == changes["stage"]:
+                return
+            for name, value in changes.items():
+                setattr(job, name, value)
+            if job.status in (JOB_DONE, JOB_FAILED):
+                job.finished = time.time()
+                if self._in_flight.get(job.key) is job:
+                    del self._in_flight[job.key]
+                if job.job_id in self._jobs:
+                    self._bytes += job.result_bytes
+                    self._release_results()
+            snapshot = job.snapshot()
+            subscribers = list(job._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, snapshot)
+            except RuntimeError:
+                # subscriber's loop has closed
+                pass
+
+    def _evict_finished(self) -> None:
+        if len(self._jobs) <= self.max_jobs:
+            return
+        for job_id in [j.job_id for j in self._jobs.values() if j.finished is not None]:
+            if len(self._jobs) <= self.max_jobs:
+                break
+            self._bytes -= self._jobs.pop(job_id).result_bytes
+
+    # drops the oldest finished results until the rest fit in max_bytes, the job records stay
+    def _release_results(self) -> None:
+        for job in self._jobs.values():
+            if self._bytes <= self.max_bytes:
+                break
+            if job.result is not None and job.finished is not None:
+                self._bytes -= job.result_bytes
+                job.result, job.result_bytes, job.expired = None, 0, True
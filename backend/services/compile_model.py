@@ -1,14 +1,98 @@
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, ContextManager, Optional, TextIO, Union
+import io
+import re
+import time
 import numpy as np
 import onnx
 
+from services.load_model import build_graph_index, GraphIndex
+from services.conv_geometry import Window2D, window_2d, is_depthwise
+from services.scheduler import schedule_nodes
+from services.memory_planner import MemoryPlan, BufferAllocation, ALIAS_OPS, CONSTANT_OPS, ARENA_ALIGNMENT
+from services.optimize_graph import optimize_graph
+from services.reference import GoldenVectors
+from services.instrumentation import instrumented, stage
+from services.quantize_model import QuantizedModel, QuantizedDense, QuantParams, dense_parameters, lut_table, quantize_multiplier, LUT_OPS
+
 # compiled model class
 @dataclass
 class CompiledModel:
     source_code: str
     header_code: str
     model_name: str
+    timings: dict[str, float] = field(default_factory=dict)  # stage name -> seconds
+    weights_mode: str = "inline"
+    weights_blob: Optional[bytes] = None   # raw weights, only in "blob" mode
+    weights_stub: Optional[str] = None     # assembly stub that embeds the blob
+
+    def files(self) -> list[tuple[str, Union[str, bytes]]]:
+        """Generated files as (filename, contents) in artifact_names order"""
+        files = []
+        if self.weights_blob is not None:
+            files.append((f"{self.model_name}_weights.bin", self.weights_blob))
+            files.append((f"{self.model_name}_weights.S", self.weights_stub))
+        files.append((f"{self.model_name}.h", self.header_code))
+        files.append((f"{self.model_name}.c", self.source_code))
+        return files
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the generated files"""
+        size = len(self.source_code) + len(self.header_code)
+        if self.weights_blob is not None:
+            size += len(self.weights_blob)
+        if self.weights_stub is not None:
+            size += len(self.weights_stub)
+        return size
+
+    @classmethod
+    def from_files(cls, files: dict[str, Union[str, bytes]], model_name: str, weights_mode: str, timings: dict[str, float]) -> "CompiledModel":
+        """Assemble a compiled model from the files written by emit_model"""
+        safe_name = safe_model_name(model_name)
+        return cls(
+            source_code=files[f"{safe_name}.c"],
+            header_code=files[f"{safe_name}.h"],
+            model_name=safe_name,
+            timings=timings,
+            weights_mode=weights_mode,
+            weights_blob=files.get(f"{safe_name}_weights.bin"),
+            weights_stub=files.get(f"{safe_name}_weights.S")
+        )
+
+
+# placement of one tensor inside the binary weight blob
+@dataclass
+class BlobTensor:
+    name: str
+    symbol: str
+    c_dtype: str
+    offset: int
+    count: int
+    nbytes: int
+
+
+# weight output modes: textual C initializers or one binary blob pulled in with .incbin
+WEIGHTS_MODES = ("inline", "blob")
+
+# byte alignment of every tensor inside the weight blob
+WEIGHT_BLOB_ALIGNMENT = 16
+
+
+# C type to little-endian numpy storage type (used for the binary weight blob)
+C_DTYPE_NUMPY = {
+    "float": "<f4",
+    "double": "<f8",
+    "int8_t": "i1",
+    "uint8_t": "u1",
+    "int16_t": "<i2",
+    "uint16_t": "<u2",
+    "int32_t": "<i4",
+    "uint32_t": "<u4",
+    "int64_t": "<i8",
+    "uint64_t": "<u8",
+}
 
 
 # ONNX data type to C type mapping
@@ -27,29 +111,207 @@ C_DTYPE_MAP = {
 }
 
 
-def _format_weight_array(data: np.ndarray, name: str, dtype: str = "float") -> str:
-    """Format numpy array as C array initializer"""
-    flat = data.flatten()
-    # Format values with appropriate precision
-    if dtype in ["float", "double"]:
-        values = ", ".join(f"{v:.8f}f" for v in flat)
-    else:
-        values = ", ".join(str(int(v)) for v in flat)
-    
-    shape_comment = f"// Shape: {list(data.shape)}, Size: {flat.size}"
-    return f"{shape_comment}\nstatic const {dtype} {name}[{flat.size}] = {{\n    {values}\n}};"
+# number of values per line in emitted C arrays
+WEIGHTS_PER_LINE = 8
+
+# number of values formatted and written per chunk (multiple of WEIGHTS_PER_LINE)
+WEIGHT_CHUNK_SIZE = 8192 * WEIGHTS_PER_LINE
+
+# fixed literal width: sign, d.dddddddd, e, exponent sign, 2 exponent digits, f suffix
+FLOAT32_LITERAL_WIDTH = 16
+
+
+def _format_float32_literals(values: np.ndarray) -> np.ndarray:
+    """
+    Format float32 values as fixed-width C literals in bulk.
+
+    Each value is written with 9 significant digits in scientific notation,
+    which is enough to round-trip every float32 bit pattern exactly. The
+    digits are computed with vectorized integer arithmetic instead of a
+    per-element Python format call.
+
+    Returns:
+        uint8 array of shape (n, FLOAT32_LITERAL_WIDTH) holding ASCII text
+    """
+    x = values.astype(np.float64).ravel()
+    n = x.size
+    a = np.abs(x)
+    finite = np.isfinite(a)
+    nonzero = finite & (a > 0)
+
+    # decimal exponent and 9 digit mantissa, corrected where log10 rounds badly
+    exp = np.zeros(n, dtype=np.int64)
+    exp[nonzero] = np.floor(np.log10(a[nonzero])).astype(np.int64)
+    mant = np.zeros(n, dtype=np.int64)
+    for _ in range(2):
+        mant[nonzero] = np.rint(a[nonzero] * np.power(10.0, 8 - exp[nonzero])).astype(np.int64)
+        exp += nonzero & (mant >= 1_000_000_000)
+        exp -= nonzero & (mant < 100_000_000)
+    mant[nonzero] = np.rint(a[nonzero] * np.power(10.0, 8 - exp[nonzero])).astype(np.int64)
+    overflow = mant >= 1_000_000_000
+    mant[overflow] //= 10
+    exp[overflow] += 1
+
+    out = np.empty((n, FLOAT32_LITERAL_WIDTH), dtype=np.uint8)
+    out[:, 0] = np.where(np.signbit(x), ord("-"), ord(" "))
+    for col in (10, 9, 8, 7, 6, 5, 4, 3, 1):
+        out[:, col] = ord("0") + mant % 10
+        mant //= 10
+    out[:, 2] = ord(".")
+    out[:, 11] = ord("e")
+    out[:, 12] = np.where(exp < 0, ord("-"), ord("+"))
+    abs_exp = np.abs(exp)
+    out[:, 13] = ord("0") + abs_exp // 10
+    out[:, 14] = ord("0") + abs_exp % 10
+    out[:, 15] = ord("f")
+
+    # non-finite values use the C99 <math.h> macros, right-aligned to the same width
+    if not finite.all():
+        for mask, text in (
+            (np.isnan(x), "NAN"),
+            (np.isposinf(x), "INFINITY"),
+            (np.isneginf(x), "-INFINITY"),
+        ):
+            out[mask] = np.frombuffer(text.rjust(FLOAT32_LITERAL_WIDTH).encode("ascii"), dtype=np.uint8)
+    return out
+
 
+def _format_int_literals(values: np.ndarray) -> np.ndarray:
+    """Format integer values as fixed-width (right-aligned) C literals in bulk"""
+    x = values.astype(np.int64).ravel()
+    mag = np.abs(x)
+    width = len(str(int(mag.max()))) + 1 if x.size else 2
 
-def _get_weight_data(model: onnx.ModelProto, name: str) -> Optional[np.ndarray]:
-    """Extract weight data from ONNX initializer"""
-    for init in model.graph.initializer:
-        if init.name == name:
-            return onnx.numpy_helper.to_array(init)
-    return None
+    out = np.full((x.size, width), ord(" "), dtype=np.uint8)
+    ndigits = np.zeros(x.size, dtype=np.int64)
+    for col in range(width - 1, 0, -1):
+        active = (mag > 0) | (col == width - 1)
+        out[active, col] = ord("0") + mag[active] % 10
+        ndigits += active
+        mag //= 10
+    # minus sign goes directly in front of the first digit
+    neg = np.nonzero(x < 0)[0]
+    out[neg, width - 1 - ndigits[neg]] = ord("-")
+    return out
+
+
+def _format_literal_lines(literals: np.ndarray) -> str:
+    """Lay out a (n, width) block of literals as indented lines, WEIGHTS_PER_LINE per line"""
+    n, width = literals.shape
+    if n == 0:
+        return ""
+    per_line = min(WEIGHTS_PER_LINE, n)
+    full_lines = n // per_line
+    parts = []
+
+    def _layout(block: np.ndarray, count: int) -> bytes:
+        lines = block.shape[0] // count
+        cells = np.empty((lines, count, width + 2), dtype=np.uint8)
+        cells[:, :, :width] = block.reshape(lines, count, width)
+        cells[:, :, width] = ord(",")
+        cells[:, :, width + 1] = ord(" ")
+        cells[:, -1, width + 1] = ord("\n")
+        text = np.empty((lines, 4 + count * (width + 2)), dtype=np.uint8)
+        text[:, :4] = ord(" ")
+        text[:, 4:] = cells.reshape(lines, -1)
+        return text.tobytes()
+
+    parts.append(_layout(literals[: full_lines * per_line], per_line))
+    remainder = n - full_lines * per_line
+    if remainder:
+        parts.append(_layout(literals[full_lines * per_line:], remainder))
+    return b"".join(parts).decode("ascii")
+
+
+def write_weight_array(out: TextIO, data: np.ndarray, name: str, dtype: str = "float") -> None:
+    """
+    Stream a numpy array to `out` as a C array initializer.
+
+    Values are formatted in bulk and written WEIGHT_CHUNK_SIZE at a time, so
+    the full text of a large tensor is never held in memory at once.
+    """
+    flat = data.reshape(-1)
+    out.write(f"// Shape: {list(data.shape)}, Size: {flat.size}\n")
+    out.write(f"static const {dtype} {name}[{flat.size}] = {{\n")
+
+    for start in range(0, flat.size, WEIGHT_CHUNK_SIZE):
+        chunk = flat[start:start + WEIGHT_CHUNK_SIZE]
+        if dtype == "float":
+            literals = _format_float32_literals(chunk.astype(np.float32))
+            out.write(_format_literal_lines(literals))
+        elif dtype == "double":
+            # float64 needs 17 digits, which the integer fast path cannot produce exactly
+            values = np.char.rjust(np.char.mod("%.17e", chunk.astype(np.float64)), 25)
+            literals = values.astype("S25").view(np.uint8).reshape(-1, 25)
+            out.write(_format_literal_lines(literals))
+        else:
+            out.write(_format_literal_lines(_format_int_literals(chunk)))
+
+    out.write("};")
+
+
+def _c_symbol(name: str) -> str:
+    return name.replace(".", "_").replace("/", "_")
+
+
+# streams constants into one aligned little-endian blob, returns tensor placements
+def write_weight_blob(out: BinaryIO, constants: dict[str, np.ndarray]) -> list[BlobTensor]:
+    position = 0
+    tensors = []
+    for symbol, data in constants.items():
+        c_dtype = C_DTYPE_MAP.get(data.dtype.name, "float")
+        padding = -position % WEIGHT_BLOB_ALIGNMENT
+        out.write(b"\0" * padding)
+        position += padding
+        raw = np.ascontiguousarray(data, dtype=C_DTYPE_NUMPY[c_dtype])
+        tensors.append(BlobTensor(
+            name=symbol,
+            symbol=symbol,
+            c_dtype=c_dtype,
+            offset=position,
+            count=int(raw.size),
+            nbytes=int(raw.nbytes)
+        ))
+        out.write(memoryview(raw).cast("B"))
+        position += raw.nbytes
+    return tensors
+
+
+# generates assembly stub that embeds the weight blob into .rodata
+def generate_weights_stub(model_name: str, target_chip: str) -> str:
+    return f"""/**
+ * {model_name}_weights.S - Generated Weight Blob Stub
+ * Target: {target_chip}
+ *
+ * Embeds {model_name}_weights.bin into read-only memory. Assemble with the
+ * directory containing the .bin file on the include path (-I).
+ *
+ * Auto-generated by Silicon Edge AI Compiler
+ */
+
+    .section .rodata.{model_name}_weights, "a"
+    .balign {WEIGHT_BLOB_ALIGNMENT}
+    .global {model_name}_weights
+{model_name}_weights:
+    .incbin "{model_name}_weights.bin"
+    .global {model_name}_weights_end
+{model_name}_weights_end:
+
+#if defined(__linux__) && defined(__ELF__)
+    .section .note.GNU-stack, "", %progbits
+#endif
+"""
 
 
 # generates header file
-def generate_header(model_name: str, model_info: dict, target_chip: str) -> str:
+def generate_header(
+    model_name: str,
+    model_info: dict,
+    target_chip: str,
+    blob_tensors: Optional[list[BlobTensor]] = None,
+    arena_size: Optional[int] = None,
+    quant_io: Optional[tuple[QuantParams, QuantParams]] = None
+) -> str:
     inputs = model_info.get("inputs", [])
     outputs = model_info.get("outputs", [])
     
@@ -87,7 +349,7 @@ extern "C" {{
 #define {model_name.upper()}_INPUT_SIZE  {input_size}
 #define {model_name.upper()}_OUTPUT_SIZE {output_size}
 #define {model_name.upper()}_TOTAL_PARAMS {model_info.get('total_parameters', 0)}
-
+{_arena_define(model_name, arena_size)}{_quant_defines(model_name, quant_io)}{_blob_defines(model_name, blob_tensors)}
 /* Initialize the neural network */
 void {model_name}_init(void);
 
@@ -106,161 +368,121 @@ size_t {model_name}_get_output_size(void);
 """
     return header
 
-# generates source file
-def generate_source(model_name: str, model_info: dict, model: onnx.ModelProto, target_chip: str):
-    # gets the model info from the generated dict
-    layers = model_info.get("layers", [])
-    weights_info = model_info.get("weights", [])
-    inputs = model_info.get("inputs", [])
-    outputs = model_info.get("outputs", [])
-    
-    # calculate sizes
-    input_size = 1
-    if inputs and inputs[0].get("shape"):
-        for dim in inputs[0]["shape"]:
-            if isinstance(dim, int) and dim > 0:
-                input_size *= dim
-    
-    output_size = 1
-    if outputs and outputs[0].get("shape"):
-        for dim in outputs[0]["shape"]:
-            if isinstance(dim, int) and dim > 0:
-                output_size *= dim
-    
-    # generate weight arrays
-    weight_sections = []
-    for w in weights_info:
-        data = _get_weight_data(model, w["name"])
-        if data is not None:
-            c_dtype = C_DTYPE_MAP.get(w["dtype"], "float")
-            safe_name = w["name"].replace(".", "_").replace("/", "_")
-            weight_sections.append(_format_weight_array(data, safe_name, c_dtype))
-    
-    weights_code = "\n\n".join(weight_sections) if weight_sections else "/* No weights */"
-    
-    # calculate buffer sizes for intermediate activations
-    max_buffer_size = max(input_size, output_size, 1024)  # At least 1KB
-    
-    # generate layer forward pass code
-    layer_code_lines = []
-    prev_output = "input"
-    
-    for i, layer in enumerate(layers):
-        op_type = layer.get("op_type", "Unknown")
-        layer_inputs = layer.get("inputs", [])
-        layer_outputs = layer.get("outputs", [])
-        
-        # get weight/bias names for this layer
-        weight_name = None
-        bias_name = None
-        if len(layer_inputs) > 1:
-            weight_name = layer_inputs[1].replace(".", "_").replace("/", "_")
-        if len(layer_inputs) > 2:
-            bias_name = layer_inputs[2].replace(".", "_").replace("/", "_")
-        
-        # find weight shape
-        weight_shape = None
-        for w in weights_info:
-            if w["name"] == layer_inputs[1] if len(layer_inputs) > 1 else None:
-                weight_shape = w["shape"]
-                break
-        
-        curr_output = f"layer_{i}_out"
-        
-        if op_type in ["Gemm", "MatMul"]:
-            # Dense/Fully connected layer
-            out_features = weight_shape[0] if weight_shape else 128
-            layer_code_lines.append(f"""
-    /* Layer {i}: Dense ({op_type}) */
-    static float {curr_output}[{out_features}];
-    dense_forward({prev_output}, {weight_name}, {bias_name if bias_name else "NULL"}, {curr_output}, 
-                  {input_size if i == 0 else "prev_size"}, {out_features});""")
-            prev_output = curr_output
-            
-        elif op_type == "Relu":
-            layer_code_lines.append(f"""
-    /* Layer {i}: ReLU */
-    relu_forward({prev_output}, {prev_output}, layer_size);""")
-            
-        elif op_type == "Sigmoid":
-            layer_code_lines.append(f"""
-    /* Layer {i}: Sigmoid */
-    sigmoid_forward({prev_output}, {prev_output}, layer_size);""")
-            
-        elif op_type == "Tanh":
-            layer_code_lines.append(f"""
-    /* Layer {i}: Tanh */
-    tanh_forward({prev_output}, {prev_output}, layer_size);""")
-            
-        elif op_type == "Softmax":
-            layer_code_lines.append(f"""
-    /* Layer {i}: Softmax */
-    softmax_forward({prev_output}, output, {output_size});""")
-            prev_output = "output"
-            
-        elif op_type in ["Add", "Flatten", "Reshape", "Dropout"]:
-            # Pass-through or simple operations
-            layer_code_lines.append(f"""
-    /* Layer {i}: {op_type} (pass-through) */""")
-    
-    layers_code = "\n".join(layer_code_lines) if layer_code_lines else "    /* No layers */"
-    
-    source = f"""/**
- * {model_name}.c - Generated Neural Network Implementation
- * Target: {target_chip}
- * Total Parameters: {model_info.get('total_parameters', 0):,}
- * 
- * Auto-generated by Silicon Edge AI Compiler
- */
+# static RAM needed for intermediate activations as a header macro
+def _arena_define(model_name: str, arena_size: Optional[int]) -> str:
+    if arena_size is None:
+        return ""
+    return f"""
+/* Tensor arena: static RAM for intermediate activations, in bytes */
+#define {model_name.upper()}_ARENA_SIZE {arena_size}
+"""
 
-#include "{model_name}.h"
-#include <math.h>
-#include <string.h>
 
-/* ============= Weights and Biases ============= */
+# int8 parameters of the model's input and output as header macros
+def _quant_defines(model_name: str, quant_io: Optional[tuple[QuantParams, QuantParams]]) -> str:
+    if quant_io is None:
+        return ""
+    prefix = model_name.upper()
+    input_params, output_params = quant_io
+    return f"""
+/* int8 quantized model: real = scale * (q - zero_point), float I/O is converted in forward() */
+#define {prefix}_QUANTIZED 1
+#define {prefix}_INPUT_SCALE {_c_float(input_params.scale)}
+#define {prefix}_INPUT_ZERO_POINT {input_params.zero_point}
+#define {prefix}_OUTPUT_SCALE {_c_float(output_params.scale)}
+#define {prefix}_OUTPUT_ZERO_POINT {output_params.zero_point}
+"""
 
-{weights_code}
 
-/* ============= Activation Functions ============= */
+# byte offsets of each tensor in the weight blob as header macros
+def _blob_defines(model_name: str, blob_tensors: Optional[list[BlobTensor]]) -> str:
+    if blob_tensors is None:
+        return ""
+    prefix = model_name.upper()
+    lines = [
+        "",
+        f"/* Weight blob layout ({model_name}_weights.bin, {WEIGHT_BLOB_ALIGNMENT}-byte aligned) */",
+    ]
+    for t in blob_tensors:
+        lines.append(f"#define {prefix}_WEIGHT_{t.symbol.upper()}_OFFSET {t.offset}")
+        lines.append(f"#define {prefix}_WEIGHT_{t.symbol.upper()}_COUNT {t.count}")
+    blob_size = blob_tensors[-1].offset + blob_tensors[-1].nbytes if blob_tensors else 0
+    lines.append(f"#define {prefix}_WEIGHTS_BLOB_SIZE {blob_size}")
+    return "\n".join(lines) + "\n"
 
-static void relu_forward(const float* in, float* out, size_t size) {{
-    for (size_t i = 0; i < size; i++) {{
-        out[i] = in[i] > 0.0f ? in[i] : 0.0f;
-    }}
-}}
 
-static void sigmoid_forward(const float* in, float* out, size_t size) {{
-    for (size_t i = 0; i < size; i++) {{
-        out[i] = 1.0f / (1.0f + expf(-in[i]));
-    }}
-}}
+# writes weight accessors into the blob instead of textual initializers
+def write_blob_weights(out: TextIO, model_name: str, blob_tensors: list[BlobTensor]) -> None:
+    prefix = model_name.upper()
+    out.write(f"/* Weights live in {model_name}_weights.bin, embedded by {model_name}_weights.S */\n")
+    out.write(f"extern const uint8_t {model_name}_weights[];\n")
+    # pointers rather than macros, so kernel locals with the same name as a tensor shadow them
+    for t in blob_tensors:
+        out.write(
+            f"\nstatic const {t.c_dtype}* const {t.symbol} = (const {t.c_dtype}*)({model_name}_weights + "
+            f"{prefix}_WEIGHT_{t.symbol.upper()}_OFFSET);"
+        )
+    if not blob_tensors:
+        out.write("/* No weights */")
+
+
+# writes the weight arrays section of the source file to a stream
+def write_weights(out: TextIO, constants: dict[str, np.ndarray]) -> None:
+    for k, (symbol, data) in enumerate(constants.items()):
+        if k:
+            out.write("\n\n")
+        write_weight_array(out, data, symbol, C_DTYPE_MAP.get(data.dtype.name, "float"))
+
+    if not constants:
+        out.write("/* No weights */")
 
-static void tanh_forward(const float* in, float* out, size_t size) {{
-    for (size_t i = 0; i < size; i++) {{
-        out[i] = tanhf(in[i]);
-    }}
-}}
 
-static void softmax_forward(const float* in, float* out, size_t size) {{
+# ============= Lowering: ONNX graph -> kernel calls over a planned arena =============
+
+ACTIVATION_KERNELS = {
+    "relu": """static void relu_forward(const float* in, float* out, size_t size) {
+    for (size_t i = 0; i < size; i++) {
+        out[i] = in[i] > 0.0f ? in[i] : 0.0f;
+    }
+}""",
+    "sigmoid": """static void sigmoid_forward(const float* in, float* out, size_t size) {
+    for (size_t i = 0; i < size; i++) {
+        out[i] = 1.0f / (1.0f + expf(-in[i]));
+    }
+}""",
+    "tanh": """static void tanh_forward(const float* in, float* out, size_t size) {
+    for (size_t i = 0; i < size; i++) {
+        out[i] = tanhf(in[i]);
+    }
+}""",
+    "softmax": """static void softmax_forward(const float* in, float* out, size_t size) {
     float max_val = in[0];
-    for (size_t i = 1; i < size; i++) {{
+    for (size_t i = 1; i < size; i++) {
         if (in[i] > max_val) max_val = in[i];
-    }}
+    }
     
     float sum = 0.0f;
-    for (size_t i = 0; i < size; i++) {{
+    for (size_t i = 0; i < size; i++) {
         out[i] = expf(in[i] - max_val);
         sum += out[i];
-    }}
+    }
     
-    for (size_t i = 0; i < size; i++) {{
+    for (size_t i = 0; i < size; i++) {
         out[i] /= sum;
-    }}
-}}
+    }
+}""",
+}
 
-/* ============= Layer Functions ============= */
+# activation applied to a float value `v` by kernels with a fused activation (see optimize_graph)
+FUSED_ACTIVATIONS = {
+    "Relu": "v > 0.0f ? v : 0.0f",
+    "Sigmoid": "1.0f / (1.0f + expf(-v))",
+    "Tanh": "tanhf(v)",
+}
 
-static void dense_forward(
+
+def _dense_kernel(name: str, store: str) -> str:
+    return f"""static void {name}_forward(
     const float* input, 
     const float* weights,
     const float* bias,
@@ -273,9 +495,1334 @@ static void dense_forward(
         for (size_t i = 0; i < in_features; i++) {{
             sum += input[i] * weights[o * in_features + i];
         }}
-        output[o] = sum;
+        {store}
     }}
-}}
+}}"""
+
+
+# output rows a tiled dense kernel computes per pass over the input, largest first (empty: plain kernels only)
+DENSE_TILE_ROWS = (4, 2)
+
+
+# rows per tile for a dense layer: the largest tile it fills at least once, 1 for the plain row-by-row kernel
+def dense_tile(out_features: int) -> int:
+    return next((rows for rows in DENSE_TILE_ROWS if out_features >= rows), 1)
+
+
+def pack_dense_rows(weight: np.ndarray, rows: int) -> np.ndarray:
+    """
+    Reorder [out, in] dense weights for a kernel that computes rows outputs at a time.
+
+    Each block of rows output rows is stored input-major ([in, rows]), so
+    the kernel reads one input value and the rows weights it multiplies
+    from consecutive addresses; rows left over after the last full block
+    stay row-major at the end.
+
+    Returns:
+        Flat array with the same number of elements as weight
+    """
+    out_features, in_features = weight.shape
+    full = out_features // rows * rows
+    blocks = weight[:full].reshape(-1, rows, in_features).transpose(0, 2, 1)
+    return np.concatenate([blocks.reshape(-1), weight[full:].reshape(-1)])
+
+
+# dense kernel over pack_dense_rows weights: one accumulator per output row of a tile, each summed in input order
+def _tiled_dense_kernel(name: str, rows: int, expression: Optional[str]) -> str:
+    def store(target: str, value: str) -> str:
+        return f"{target} = {value};" if expression is None else f"{{ float v = {value}; {target} = {expression}; }}"
+
+    init = "\n".join(f"        float s{r} = bias ? bias[o + {r}] : 0.0f;" for r in range(rows))
+    accumulate = "\n".join(f"            s{r} += x * w[{r}];" for r in range(rows))
+    stores = "\n".join(f"        {store(f'output[o + {r}]', f's{r}')}" for r in range(rows))
+    return f"""static void {name}_forward(
+    const float* input,
+    const float* weights,
+    const float* bias,
+    float* output,
+    size_t in_features,
+    size_t out_features
+) {{
+    /* blocks of {rows} rows interleaved per input, then the leftover rows one by one */
+    const float* w = weights;
+    size_t o = 0;
+    for (; o + {rows} <= out_features; o += {rows}) {{
+{init}
+        for (size_t i = 0; i < in_features; i++) {{
+            float x = input[i];
+{accumulate}
+            w += {rows};
+        }}
+{stores}
+    }}
+    for (; o < out_features; o++, w += in_features) {{
+        float sum = bias ? bias[o] : 0.0f;
+        for (size_t i = 0; i < in_features; i++) {{
+            sum += input[i] * w[i];
+        }}
+        {store("output[o]", "sum")}
+    }}
+}}"""
+
+
+LAYER_KERNELS = {
+    "dense": _dense_kernel("dense", "output[o] = sum;"),
+    **{f"dense_x{rows}": _tiled_dense_kernel(f"dense_x{rows}", rows, None) for rows in DENSE_TILE_ROWS},
+}
+
+for _activation, _expression in FUSED_ACTIVATIONS.items():
+    LAYER_KERNELS[f"dense_{_activation.lower()}"] = _dense_kernel(
+        f"dense_{_activation.lower()}",
+        f"float v = sum;\n        output[o] = {_expression};"
+    )
+    for _rows in DENSE_TILE_ROWS:
+        LAYER_KERNELS[f"dense_x{_rows}_{_activation.lower()}"] = _tiled_dense_kernel(
+            f"dense_x{_rows}_{_activation.lower()}", _rows, _expression
+        )
+
+# elementwise binary ops: ONNX op -> (kernel prefix, C operator)
+BINARY_OPS = {"Add": ("add", "+"), "Sub": ("sub", "-"), "Mul": ("mul", "*")}
+
+for _prefix, _operator in BINARY_OPS.values():
+    LAYER_KERNELS[_prefix] = f"""static void {_prefix}_forward(const float* a, const float* b, float* out, size_t size) {{
+    for (size_t i = 0; i < size; i++) {{
+        out[i] = a[i] {_operator} b[i];
+    }}
+}}"""
+    LAYER_KERNELS[f"{_prefix}_broadcast"] = f"""static void {_prefix}_broadcast_forward(const float* a, const float* b, float* out, size_t outer, size_t inner) {{
+    for (size_t o = 0; o < outer; o++) {{
+        for (size_t i = 0; i < inner; i++) {{
+            out[o * inner + i] = a[o * inner + i] {_operator} b[i];
+        }}
+    }}
+}}"""
+
+
+# Conv and pooling kernels work on ONNX's NCHW layout, one [H, W] plane per channel
+WINDOW_STRUCT = """/* geometry of a Conv/pool window over one [H, W] plane (1D ops use H = 1) */
+typedef struct {
+    int32_t in_h, in_w, out_h, out_w;
+    int32_t kernel_h, kernel_w, stride_h, stride_w;
+    int32_t pad_top, pad_left, pad_bottom, pad_right;
+    int32_t dilation_h, dilation_w;
+} window2d_t;"""
+
+
+# direct Conv: the receptive field of each output pixel is gathered into patch (zero padded),
+# so every output channel is a contiguous dot product against its [in/group, kh, kw] weights
+def _conv_kernel(name: str, store: str) -> str:
+    return f"""static void {name}_forward(
+    const float* input,
+    const float* weights,
+    const float* bias,
+    float* output,
+    float* patch,
+    size_t in_channels,
+    size_t out_channels,
+    size_t groups,
+    const window2d_t* win
+) {{
+    const size_t group_in = in_channels / groups, group_out = out_channels / groups;
+    const size_t patch_size = group_in * (size_t)(win->kernel_h * win->kernel_w);
+    const size_t plane = (size_t)(win->in_h * win->in_w), out_plane = (size_t)(win->out_h * win->out_w);
+    for (size_t g = 0; g < groups; g++) {{
+        const float* x = input + g * group_in * plane;
+        for (int32_t oy = 0; oy < win->out_h; oy++) {{
+            for (int32_t ox = 0; ox < win->out_w; ox++) {{
+                float* p = patch;
+                for (size_t c = 0; c < group_in; c++) {{
+                    const float* xc = x + c * plane;
+                    for (int32_t ky = 0; ky < win->kernel_h; ky++) {{
+                        int32_t iy = oy * win->stride_h + ky * win->dilation_h - win->pad_top;
+                        for (int32_t kx = 0; kx < win->kernel_w; kx++) {{
+                            int32_t ix = ox * win->stride_w + kx * win->dilation_w - win->pad_left;
+                            *p++ = (iy >= 0 && iy < win->in_h && ix >= 0 && ix < win->in_w) ? xc[iy * win->in_w + ix] : 0.0f;
+                        }}
+                    }}
+                }}
+                size_t pos = (size_t)(oy * win->out_w + ox);
+                for (size_t o = g * group_out; o < (g + 1) * group_out; o++) {{
+                    const float* w = weights + o * patch_size;
+                    float sum = bias ? bias[o] : 0.0f;
+                    for (size_t k = 0; k < patch_size; k++) {{
+                        sum += patch[k] * w[k];
+                    }}
+                    {store.format(target="output[o * out_plane + pos]", indent=" " * 20)}
+                }}
+            }}
+        }}
+    }}
+}}"""
+
+
+# depthwise Conv (one input channel per group): small per-channel windows need no scratch
+def _depthwise_kernel(name: str, store: str) -> str:
+    return f"""static void {name}_forward(
+    const float* input,
+    const float* weights,
+    const float* bias,
+    float* output,
+    size_t in_channels,
+    size_t depth_multiplier,
+    const window2d_t* win
+) {{
+    const size_t taps = (size_t)(win->kernel_h * win->kernel_w);
+    const size_t plane = (size_t)(win->in_h * win->in_w), out_plane = (size_t)(win->out_h * win->out_w);
+    for (size_t o = 0; o < in_channels * depth_multiplier; o++) {{
+        const float* x = input + (o / depth_multiplier) * plane;
+        const float* w = weights + o * taps;
+        float* y = output + o * out_plane;
+        for (int32_t oy = 0; oy < win->out_h; oy++) {{
+            for (int32_t ox = 0; ox < win->out_w; ox++) {{
+                float sum = bias ? bias[o] : 0.0f;
+                for (int32_t ky = 0; ky < win->kernel_h; ky++) {{
+                    int32_t iy = oy * win->stride_h + ky * win->dilation_h - win->pad_top;
+                    if (iy < 0 || iy >= win->in_h) continue;
+                    for (int32_t kx = 0; kx < win->kernel_w; kx++) {{
+                        int32_t ix = ox * win->stride_w + kx * win->dilation_w - win->pad_left;
+                        if (ix < 0 || ix >= win->in_w) continue;
+                        sum += x[iy * win->in_w + ix] * w[ky * win->kernel_w + kx];
+                    }}
+                }}
+                {store.format(target="y[oy * win->out_w + ox]", indent=" " * 16)}
+            }}
+        }}
+    }}
+}}"""
+
+
+LAYER_KERNELS["window2d"] = WINDOW_STRUCT
+
+for _activation, _expression in (("", None), *FUSED_ACTIVATIONS.items()):
+    _suffix = f"_{_activation.lower()}" if _activation else ""
+    _store = f"float v = sum;\n{{indent}}{{target}} = {_expression};" if _expression else "{target} = sum;"
+    LAYER_KERNELS[f"conv2d{_suffix}"] = _conv_kernel(f"conv2d{_suffix}", _store)
+    LAYER_KERNELS[f"depthwise_conv2d{_suffix}"] = _depthwise_kernel(f"depthwise_conv2d{_suffix}", _store)
+
+def _maxpool_kernel(name: str, c_type: str, lowest: str) -> str:
+    return f"""static void {name}_forward(const {c_type}* input, {c_type}* output, size_t channels, const window2d_t* win) {{
+    const size_t plane = (size_t)(win->in_h * win->in_w), out_plane = (size_t)(win->out_h * win->out_w);
+    for (size_t c = 0; c < channels; c++) {{
+        const {c_type}* x = input + c * plane;
+        {c_type}* y = output + c * out_plane;
+        for (int32_t oy = 0; oy < win->out_h; oy++) {{
+            for (int32_t ox = 0; ox < win->out_w; ox++) {{
+                {c_type} best = {lowest};
+                for (int32_t ky = 0; ky < win->kernel_h; ky++) {{
+                    int32_t iy = oy * win->stride_h + ky * win->dilation_h - win->pad_top;
+                    if (iy < 0 || iy >= win->in_h) continue;
+                    for (int32_t kx = 0; kx < win->kernel_w; kx++) {{
+                        int32_t ix = ox * win->stride_w + kx * win->dilation_w - win->pad_left;
+                        if (ix < 0 || ix >= win->in_w) continue;
+                        if (x[iy * win->in_w + ix] > best) best = x[iy * win->in_w + ix];
+                    }}
+                }}
+                y[oy * win->out_w + ox] = best;
+            }}
+        }}
+    }}
+}}"""
+
+
+def _global_maxpool_kernel(name: str, c_type: str) -> str:
+    return f"""static void {name}_forward(const {c_type}* input, {c_type}* output, size_t channels, size_t size) {{
+    for (size_t c = 0; c < channels; c++) {{
+        {c_type} best = input[c * size];
+        for (size_t i = 1; i < size; i++) {{
+            if (input[c * size + i] > best) best = input[c * size + i];
+        }}
+        output[c] = best;
+    }}
+}}"""
+
+
+LAYER_KERNELS["maxpool2d"] = _maxpool_kernel("maxpool2d", "float", "-INFINITY")
+
+# the divisor counts taps inside the input, or inside input and padding with count_include_pad
+LAYER_KERNELS["avgpool2d"] = """static void avgpool2d_forward(const float* input, float* output, size_t channels, const window2d_t* win, int count_include_pad) {
+    const size_t plane = (size_t)(win->in_h * win->in_w), out_plane = (size_t)(win->out_h * win->out_w);
+    for (size_t c = 0; c < channels; c++) {
+        const float* x = input + c * plane;
+        float* y = output + c * out_plane;
+        for (int32_t oy = 0; oy < win->out_h; oy++) {
+            for (int32_t ox = 0; ox < win->out_w; ox++) {
+                float sum = 0.0f;
+                int32_t count = 0, padded = 0;
+                for (int32_t ky = 0; ky < win->kernel_h; ky++) {
+                    int32_t iy = oy * win->stride_h + ky * win->dilation_h - win->pad_top;
+                    if (iy < -win->pad_top || iy >= win->in_h + win->pad_bottom) continue;
+                    for (int32_t kx = 0; kx < win->kernel_w; kx++) {
+                        int32_t ix = ox * win->stride_w + kx * win->dilation_w - win->pad_left;
+                        if (ix < -win->pad_left || ix >= win->in_w + win->pad_right) continue;
+                        padded++;
+                        if (iy < 0 || iy >= win->in_h || ix < 0 || ix >= win->in_w) continue;
+                        sum += x[iy * win->in_w + ix];
+                        count++;
+                    }
+                }
+                int32_t divisor = count_include_pad ? padded : count;
+                y[oy * win->out_w + ox] = divisor ? sum / (float)divisor : 0.0f;
+            }
+        }
+    }
+}"""
+
+LAYER_KERNELS["global_avgpool"] = """static void global_avgpool_forward(const float* input, float* output, size_t channels, size_t size) {
+    for (size_t c = 0; c < channels; c++) {
+        float sum = 0.0f;
+        for (size_t i = 0; i < size; i++) {
+            sum += input[c * size + i];
+        }
+        output[c] = sum / (float)size;
+    }
+}"""
+
+LAYER_KERNELS["global_maxpool"] = _global_maxpool_kernel("global_maxpool", "float")
+
+
+# int8 kernels: activations are int8 with real = scale * (q - zero_point), see quantize_model
+INT8_KERNELS = {
+    "saturate": """static inline int8_t saturate_int8(int32_t x) {
+    return (int8_t)(x < -128 ? -128 : (x > 127 ? 127 : x));
+}""",
+    "requantize": """/* acc * multiplier * 2^(shift - 31), rounded to nearest; multiplier is a Q31 fraction */
+static inline int32_t requantize(int32_t acc, int32_t multiplier, int32_t shift) {
+    int32_t right = 31 - shift;
+    int64_t prod = (int64_t)acc * multiplier;
+    return (int32_t)((prod + ((int64_t)1 << (right - 1))) >> right);
+}""",
+    "quantize": """static void quantize_forward(const float* in, int8_t* out, size_t size, float inv_scale, int32_t zero_point) {
+    for (size_t i = 0; i < size; i++) {
+        out[i] = saturate_int8((int32_t)lrintf(in[i] * inv_scale) + zero_point);
+    }
+}""",
+    "dequantize": """static void dequantize_forward(const int8_t* in, float* out, size_t size, float scale, int32_t zero_point) {
+    for (size_t i = 0; i < size; i++) {
+        out[i] = scale * (float)((int32_t)in[i] - zero_point);
+    }
+}""",
+    "dense_int8_output": """/* a fused Relu clamps at the output zero point, a fused Sigmoid/Tanh is a table lookup */
+static inline int8_t dense_int8_output(int32_t acc, int32_t multiplier, int32_t shift, int32_t zero_point, int32_t activation_min, const int8_t* table) {
+    int32_t q = requantize(acc, multiplier, shift) + zero_point;
+    int8_t v = saturate_int8(q < activation_min ? activation_min : q);
+    return table ? table[(int32_t)v + 128] : v;
+}""",
+    "dense_int8": """static void dense_int8_forward(
+    const int8_t* input,
+    const int8_t* weights,
+    const int32_t* bias,
+    const int32_t* multiplier,
+    const int32_t* shift,
+    int8_t* output,
+    size_t in_features,
+    size_t out_features,
+    int32_t zero_point,
+    int32_t activation_min,
+    const int8_t* table
+) {
+    /* bias already holds -input_zero_point * sum(weights), so raw int8 values are multiplied */
+    for (size_t o = 0; o < out_features; o++) {
+        const int8_t* row = weights + o * in_features;
+        int32_t acc = bias[o];
+        for (size_t i = 0; i < in_features; i++) {
+            acc += (int32_t)input[i] * (int32_t)row[i];
+        }
+        output[o] = dense_int8_output(acc, multiplier[o], shift[o], zero_point, activation_min, table);
+    }
+}""",
+    "lut_int8": """static void lut_int8_forward(const int8_t* in, int8_t* out, size_t size, const int8_t* table) {
+    for (size_t i = 0; i < size; i++) {
+        out[i] = table[(int32_t)in[i] + 128];
+    }
+}""",
+    "requantize_int8": """/* copies rows of inner values into rows out_stride apart, moved from the input's to the output's parameters */
+static void requantize_int8_forward(
+    const int8_t* in,
+    int8_t* out,
+    size_t outer,
+    size_t inner,
+    size_t out_stride,
+    int32_t in_zero_point,
+    int32_t multiplier,
+    int32_t shift,
+    int32_t out_zero_point
+) {
+    for (size_t o = 0; o < outer; o++) {
+        for (size_t i = 0; i < inner; i++) {
+            int32_t q = requantize((int32_t)in[o * inner + i] - in_zero_point, multiplier, shift) + out_zero_point;
+            out[o * out_stride + i] = saturate_int8(q);
+        }
+    }
+}""",
+    "softmax_int8": """static void softmax_int8_forward(const int8_t* in, int8_t* out, size_t size, float in_scale, float out_inv_scale, int32_t out_zero_point) {
+    int8_t max_val = in[0];
+    for (size_t i = 1; i < size; i++) {
+        if (in[i] > max_val) max_val = in[i];
+    }
+
+    float sum = 0.0f;
+    for (size_t i = 0; i < size; i++) {
+        sum += expf(in_scale * (float)(in[i] - max_val));
+    }
+
+    float norm = out_inv_scale / sum;
+    for (size_t i = 0; i < size; i++) {
+        float p = expf(in_scale * (float)(in[i] - max_val));
+        out[i] = saturate_int8((int32_t)lrintf(p * norm) + out_zero_point);
+    }
+}""",
+}
+
+# int8 dense kernels over pack_dense_rows weights, same tiles as the float ones
+for _rows in DENSE_TILE_ROWS:
+    _init = "\n".join(f"        int32_t a{r} = bias[o + {r}];" for r in range(_rows))
+    _accumulate = "\n".join(f"            a{r} += x * (int32_t)w[{r}];" for r in range(_rows))
+    _stores = "\n".join(
+        f"        output[o + {r}] = dense_int8_output(a{r}, multiplier[o + {r}], shift[o + {r}], zero_point, activation_min, table);"
+        for r in range(_rows)
+    )
+    INT8_KERNELS[f"dense_int8_x{_rows}"] = f"""static void dense_int8_x{_rows}_forward(
+    const int8_t* input,
+    const int8_t* weights,
+    const int32_t* bias,
+    const int32_t* multiplier,
+    const int32_t* shift,
+    int8_t* output,
+    size_t in_features,
+    size_t out_features,
+    int32_t zero_point,
+    int32_t activation_min,
+    const int8_t* table
+) {{
+    /* blocks of {_rows} rows interleaved per input, then the leftover rows one by one */
+    const int8_t* w = weights;
+    size_t o = 0;
+    for (; o + {_rows} <= out_features; o += {_rows}) {{
+{_init}
+        for (size_t i = 0; i < in_features; i++) {{
+            int32_t x = input[i];
+{_accumulate}
+            w += {_rows};
+        }}
+{_stores}
+    }}
+    for (; o < out_features; o++, w += in_features) {{
+        int32_t acc = bias[o];
+        for (size_t i = 0; i < in_features; i++) {{
+            acc += (int32_t)input[i] * (int32_t)w[i];
+        }}
+        output[o] = dense_int8_output(acc, multiplier[o], shift[o], zero_point, activation_min, table);
+    }}
+}}"""
+
+# extra fraction bits kept while rescaling Add/Sub operands to the output scale
+INT8_ADD_LEFT_SHIFT = 16
+
+for _prefix, _operator in BINARY_OPS.values():
+    if _prefix == "mul":
+        _body = """int32_t acc = ((int32_t)a[o * inner + i] - a_zero_point) * ((int32_t)b[i] - b_zero_point);
+            out[o * inner + i] = saturate_int8(requantize(acc, multiplier, shift) + out_zero_point);"""
+        _params = "int32_t a_zero_point, int32_t b_zero_point, int32_t multiplier, int32_t shift, int32_t out_zero_point"
+    else:
+        # both operands are rescaled to the output scale with extra fraction bits, then combined and rounded once
+        _body = f"""int32_t x = requantize(((int32_t)a[o * inner + i] - a_zero_point) * (1 << {INT8_ADD_LEFT_SHIFT}), a_multiplier, a_shift);
+            int32_t y = requantize(((int32_t)b[i] - b_zero_point) * (1 << {INT8_ADD_LEFT_SHIFT}), b_multiplier, b_shift);
+            int32_t acc = x {_operator} y;
+            out[o * inner + i] = saturate_int8(((acc + (1 << {INT8_ADD_LEFT_SHIFT - 1})) >> {INT8_ADD_LEFT_SHIFT}) + out_zero_point);"""
+        _params = (
+            "int32_t a_zero_point, int32_t a_multiplier, int32_t a_shift, "
+            "int32_t b_zero_point, int32_t b_multiplier, int32_t b_shift, int32_t out_zero_point"
+        )
+    INT8_KERNELS[f"{_prefix}_int8"] = f"""static void {_prefix}_int8_forward(const int8_t* a, const int8_t* b, int8_t* out, size_t outer, size_t inner, {_params}) {{
+    for (size_t o = 0; o < outer; o++) {{
+        for (size_t i = 0; i < inner; i++) {{
+            {_body}
+        }}
+    }}
+}}"""
+
+# padding is the input zero point (real 0) so the bias correction for the input zero point stays exact
+INT8_KERNELS["conv2d_int8"] = """static void conv2d_int8_forward(
+    const int8_t* input,
+    const int8_t* weights,
+    const int32_t* bias,
+    const int32_t* multiplier,
+    const int32_t* shift,
+    int8_t* output,
+    int8_t* patch,
+    size_t in_channels,
+    size_t out_channels,
+    size_t groups,
+    const window2d_t* win,
+    int32_t input_zero_point,
+    int32_t zero_point,
+    int32_t activation_min,
+    const int8_t* table
+) {
+    const size_t group_in = in_channels / groups, group_out = out_channels / groups;
+    const size_t patch_size = group_in * (size_t)(win->kernel_h * win->kernel_w);
+    const size_t plane = (size_t)(win->in_h * win->in_w), out_plane = (size_t)(win->out_h * win->out_w);
+    for (size_t g = 0; g < groups; g++) {
+        const int8_t* x = input + g * group_in * plane;
+        for (int32_t oy = 0; oy < win->out_h; oy++) {
+            for (int32_t ox = 0; ox < win->out_w; ox++) {
+                int8_t* p = patch;
+                for (size_t c = 0; c < group_in; c++) {
+                    const int8_t* xc = x + c * plane;
+                    for (int32_t ky = 0; ky < win->kernel_h; ky++) {
+                        int32_t iy = oy * win->stride_h + ky * win->dilation_h - win->pad_top;
+                        for (int32_t kx = 0; kx < win->kernel_w; kx++) {
+                            int32_t ix = ox * win->stride_w + kx * win->dilation_w - win->pad_left;
+                            *p++ = (iy >= 0 && iy < win->in_h && ix >= 0 && ix < win->in_w) ? xc[iy * win->in_w + ix] : (int8_t)input_zero_point;
+                        }
+                    }
+                }
+                size_t pos = (size_t)(oy * win->out_w + ox);
+                for (size_t o = g * group_out; o < (g + 1) * group_out; o++) {
+                    const int8_t* w = weights + o * patch_size;
+                    int32_t acc = bias[o];
+                    for (size_t k = 0; k < patch_size; k++) {
+                        acc += (int32_t)patch[k] * (int32_t)w[k];
+                    }
+                    int32_t q = requantize(acc, multiplier[o], shift[o]) + zero_point;
+                    int8_t v = saturate_int8(q < activation_min ? activation_min : q);
+                    output[o * out_plane + pos] = table ? table[(int32_t)v + 128] : v;
+                }
+            }
+        }
+    }
+}"""
+
+INT8_KERNELS["depthwise_conv2d_int8"] = """static void depthwise_conv2d_int8_forward(
+    const int8_t* input,
+    const int8_t* weights,
+    const int32_t* bias,
+    const int32_t* multiplier,
+    const int32_t* shift,
+    int8_t* output,
+    size_t in_channels,
+    size_t depth_multiplier,
+    const window2d_t* win,
+    int32_t input_zero_point,
+    int32_t zero_point,
+    int32_t activation_min,
+    const int8_t* table
+) {
+    const size_t taps = (size_t)(win->kernel_h * win->kernel_w);
+    const size_t plane = (size_t)(win->in_h * win->in_w), out_plane = (size_t)(win->out_h * win->out_w);
+    for (size_t o = 0; o < in_channels * depth_multiplier; o++) {
+        const int8_t* x = input + (o / depth_multiplier) * plane;
+        const int8_t* w = weights + o * taps;
+        int8_t* y = output + o * out_plane;
+        for (int32_t oy = 0; oy < win->out_h; oy++) {
+            for (int32_t ox = 0; ox < win->out_w; ox++) {
+                int32_t acc = bias[o];
+                for (int32_t ky = 0; ky < win->kernel_h; ky++) {
+                    int32_t iy = oy * win->stride_h + ky * win->dilation_h - win->pad_top;
+                    int inside_y = iy >= 0 && iy < win->in_h;
+                    for (int32_t kx = 0; kx < win->kernel_w; kx++) {
+                        int32_t ix = ox * win->stride_w + kx * win->dilation_w - win->pad_left;
+                        int32_t xv = (inside_y && ix >= 0 && ix < win->in_w) ? x[iy * win->in_w + ix] : input_zero_point;
+                        acc += xv * (int32_t)w[ky * win->kernel_w + kx];
+                    }
+                }
+                int32_t q = requantize(acc, multiplier[o], shift[o]) + zero_point;
+                int8_t v = saturate_int8(q < activation_min ? activation_min : q);
+                y[oy * win->out_w + ox] = table ? table[(int32_t)v + 128] : v;
+            }
+        }
+    }
+}"""
+
+# max pooling keeps the input's quantization parameters, so it compares raw int8 values
+INT8_KERNELS["maxpool2d_int8"] = _maxpool_kernel("maxpool2d_int8", "int8_t", "-128")
+
+INT8_KERNELS["avgpool2d_int8"] = """static void avgpool2d_int8_forward(
+    const int8_t* input,
+    int8_t* output,
+    size_t channels,
+    const window2d_t* win,
+    int count_include_pad,
+    int32_t input_zero_point,
+    float rescale,
+    int32_t out_zero_point
+) {
+    const size_t plane = (size_t)(win->in_h * win->in_w), out_plane = (size_t)(win->out_h * win->out_w);
+    for (size_t c = 0; c < channels; c++) {
+        const int8_t* x = input + c * plane;
+        int8_t* y = output + c * out_plane;
+        for (int32_t oy = 0; oy < win->out_h; oy++) {
+            for (int32_t ox = 0; ox < win->out_w; ox++) {
+                int32_t sum = 0, count = 0, padded = 0;
+                for (int32_t ky = 0; ky < win->kernel_h; ky++) {
+                    int32_t iy = oy * win->stride_h + ky * win->dilation_h - win->pad_top;
+                    if (iy < -win->pad_top || iy >= win->in_h + win->pad_bottom) continue;
+                    for (int32_t kx = 0; kx < win->kernel_w; kx++) {
+                        int32_t ix = ox * win->stride_w + kx * win->dilation_w - win->pad_left;
+                        if (ix < -win->pad_left || ix >= win->in_w + win->pad_right) continue;
+                        padded++;
+                        if (iy < 0 || iy >= win->in_h || ix < 0 || ix >= win->in_w) continue;
+                        sum += (int32_t)x[iy * win->in_w + ix] - input_zero_point;
+                        count++;
+                    }
+                }
+                int32_t divisor = count_include_pad ? padded : count;
+                float mean = divisor ? (float)sum / (float)divisor : 0.0f;
+                y[oy * win->out_w + ox] = saturate_int8((int32_t)lrintf(mean * rescale) + out_zero_point);
+            }
+        }
+    }
+}"""
+
+INT8_KERNELS["global_avgpool_int8"] = """static void global_avgpool_int8_forward(
+    const int8_t* input,
+    int8_t* output,
+    size_t channels,
+    size_t size,
+    int32_t input_zero_point,
+    float rescale,
+    int32_t out_zero_point
+) {
+    for (size_t c = 0; c < channels; c++) {
+        int32_t sum = 0;
+        for (size_t i = 0; i < size; i++) {
+            sum += (int32_t)input[c * size + i] - input_zero_point;
+        }
+        output[c] = saturate_int8((int32_t)lrintf((float)sum / (float)size * rescale) + out_zero_point);
+    }
+}"""
+
+INT8_KERNELS["global_maxpool_int8"] = _global_maxpool_kernel("global_maxpool_int8", "int8_t")
+
+
+# codegen-ready form of a model: constants, forward statements and the arena plan
+@dataclass
+class LoweredModel:
+    constants: dict[str, np.ndarray]    # C symbol -> data stored in flash
+    statements: list[str]               # forward pass, one entry per layer
+    kernels: set[str]                   # names of ACTIVATION_KERNELS/LAYER_KERNELS used
+    views: list[str]                    # arena pointer declarations
+    plan: MemoryPlan
+    input_size: int
+    output_size: int
+    quant_io: Optional[tuple[QuantParams, QuantParams]] = None  # int8 input/output parameters
+
+
+def _node_attrs(node: onnx.NodeProto) -> dict:
+    return {attr.name: onnx.helper.get_attribute_value(attr) for attr in node.attribute}
+
+
+def _c_var(name: str) -> str:
+    return "t_" + re.sub(r"[^0-9a-zA-Z_]", "_", name)
+
+
+class _LoweringContext:
+    """State shared by the per-op lowering functions."""
+
+    def __init__(self, index: GraphIndex, plan: MemoryPlan, quantization: Optional[QuantizedModel] = None):
+        model = index.model
+        self.index = index
+        self.shapes = index.shapes
+        self.plan = plan
+        self.quantization = quantization
+        self.c_type = "int8_t" if quantization is not None else "float"
+        self.graph_inputs = {inp.name for inp in model.graph.input if inp.name not in index.initializers}
+        self.constants: dict[str, np.ndarray] = {}
+        self.kernels: set[str] = set()
+        self.views: dict[str, str] = {}
+        opsets = {op.domain: op.version for op in model.opset_import}
+        self.opset = opsets.get("", opsets.get("ai.onnx", 13))
+
+    def shape(self, name: str) -> list[int]:
+        info = self.shapes.get(name)
+        if info is None:
+            raise ValueError(f"Could not infer the shape of tensor '{name}'")
+        return [d if isinstance(d, int) and d > 0 else 1 for d in info['shape']]
+
+    def numel(self, name: str) -> int:
+        return int(np.prod(self.shape(name)))
+
+    def value(self, name: str) -> Optional[np.ndarray]:
+        """Compile-time value of a tensor, or None if it is computed at runtime"""
+        return self.index.get_array(name)
+
+    def constant(self, name: str, data: np.ndarray, suffix: str = "", dtype=np.float32) -> str:
+        """Register data to be stored in flash and return its C symbol"""
+        symbol = _c_symbol(name) + suffix
+        if symbol not in self.constants:
+            self.constants[symbol] = np.ascontiguousarray(data, dtype=dtype)
+        return symbol
+
+    def qparams(self, name: str) -> QuantParams:
+        """int8 parameters of a tensor in a quantized model"""
+        params = self.quantization.activations.get(name)
+        if params is None:
+            raise ValueError(f"Tensor '{name}' has no quantization parameters (was this graph calibrated, with the same optimize setting?)")
+        return params
+
+    def ptr(self, name: str) -> str:
+        """C expression pointing at a runtime tensor"""
+        buffer = self.plan.tensor_buffers[name]
+        if buffer.external is not None:
+            return "input" if buffer.external in self.graph_inputs else "output"
+        return self._view(buffer, ', '.join(buffer.tensors))
+
+    def scratch(self, step: int) -> str:
+        """C expression pointing at the kernel scratch of the node executed at step"""
+        buffer = self.plan.scratch_buffers.get(self.plan.order[step])
+        if buffer is None:
+            raise ValueError(f"No scratch buffer was planned for step {step}")
+        return self._view(buffer, "kernel scratch")
+
+    def _view(self, buffer: BufferAllocation, label: str) -> str:
+        var = _c_var(buffer.name)
+        if var not in self.views:
+            self.views[var] = (
+                f"{self.c_type}* {var} = ({self.c_type}*)(arena + {buffer.offset}); "
+                f"/* {label}: {buffer.size} bytes */"
+            )
+        return var
+
+
+def _lower_dense(ctx: _LoweringContext, i: int, node: onnx.NodeProto) -> str:
+    params = dense_parameters(ctx.index, node)
+    out_features, in_features = params.weight.shape
+    tile = dense_tile(out_features)
+    if tile > 1:
+        weight_sym = ctx.constant(node.input[1], pack_dense_rows(params.weight, tile), f"_x{tile}")
+    else:
+        weight_sym = ctx.constant(node.input[1], params.weight, "_packed" if params.weight_packed else "")
+    bias_sym = "NULL"
+    if params.bias is not None:
+        bias_sym = ctx.constant(node.input[2], params.bias, "_packed" if params.bias_packed else "")
+
+    activation = ctx.index.fused.get(node.output[0])
+    kernel = "_".join(["dense"] + ([f"x{tile}"] if tile > 1 else []) + ([activation.lower()] if activation else []))
+    label = f"{node.op_type} + {activation}" if activation else node.op_type
+    ctx.kernels.add(kernel)
+    x, y = ctx.ptr(node.input[0]), ctx.ptr(node.output[0])
+    rows = ctx.numel(node.input[0]) // in_features
+    if rows == 1:
+        return f"""
+    /* Layer {i}: Dense ({label}) */
+    {kernel}_forward({x}, {weight_sym}, {bias_sym}, {y}, {in_features}, {out_features});"""
+    return f"""
+    /* Layer {i}: Dense ({label}), {rows} rows */
+    for (size_t r = 0; r < {rows}; r++) {{
+        {kernel}_forward({x} + r * {in_features}, {weight_sym}, {bias_sym}, {y} + r * {out_features}, {in_features}, {out_features});
+    }}"""
+
+
+def _lower_activation(ctx: _LoweringContext, i: int, node: onnx.NodeProto) -> str:
+    kernel = node.op_type.lower()
+    ctx.kernels.add(kernel)
+    x, y = ctx.ptr(node.input[0]), ctx.ptr(node.output[0])
+    return f"""
+    /* Layer {i}: {node.op_type} */
+    {kernel}_forward({x}, {y}, {ctx.numel(node.output[0])});"""
+
+
+# (rows, cols) a Softmax normalizes over
+def _softmax_layout(ctx: _LoweringContext, node: onnx.NodeProto) -> tuple[int, int]:
+    shape = ctx.shape(node.input[0])
+    axis = _node_attrs(node).get("axis", -1 if ctx.opset >= 13 else 1)
+    axis = axis + len(shape) if axis < 0 else axis
+    if ctx.opset >= 13 and axis != len(shape) - 1:
+        raise ValueError(f"Layer '{node.name}': Softmax is only supported over the last axis")
+    # opset < 13 flattens to 2D at axis, which is the same row/column split
+    return int(np.prod(shape[:axis])), int(np.prod(shape[axis:]))
+
+
+def _lower_softmax(ctx: _LoweringContext, i: int, node: onnx.NodeProto) -> str:
+    rows, cols = _softmax_layout(ctx, node)
+    ctx.kernels.add("softmax")
+    x, y = ctx.ptr(node.input[0]), ctx.ptr(node.output[0])
+    if rows == 1:
+        return f"""
+    /* Layer {i}: Softmax */
+    softmax_forward({x}, {y}, {cols});"""
+    return f"""
+    /* Layer {i}: Softmax, {rows} rows */
+    for (size_t r = 0; r < {rows}; r++) {{
+        softmax_forward({x} + r * {cols}, {y} + r * {cols}, {cols});
+    }}"""
+
+
+# operand order and broadcast split of a binary op: (full-size operand, other operand, size, inner)
+def _binary_layout(ctx: _LoweringContext, node: onnx.NodeProto) -> tuple[str, str, int, int]:
+    a, b = node.input[0], node.input[1]
+    size = ctx.numel(node.output[0])
+
+    # the full-size operand goes first; only commutative ops may swap
+    if ctx.numel(a) != size and node.op_type != "Sub":
+        a, b = b, a
+    if ctx.numel(a) != size:
+        raise ValueError(f"Layer '{node.name}': unsupported broadcast for {node.op_type}")
+
+    inner = ctx.numel(b)
+    if inner != size:
+        # b must broadcast over leading dimensions only (e.g. a bias over rows)
+        out_shape, b_shape = ctx.shape(node.output[0]), ctx.shape(b)
+        while b_shape and b_shape[0] == 1:
+            b_shape = b_shape[1:]
+        if b_shape and out_shape[len(out_shape) - len(b_shape):] != b_shape and inner != 1:
+            raise ValueError(f"Layer '{node.name}': unsupported broadcast for {node.op_type}")
+    return a, b, size, inner
+
+
+def _lower_binary(ctx: _LoweringContext, i: int, node: onnx.NodeProto) -> str:
+    prefix, _ = BINARY_OPS[node.op_type]
+    a, b, size, inner = _binary_layout(ctx, node)
+
+    operands = []
+    for name in (a, b):
+        data = ctx.value(name)
+        operands.append(ctx.constant(name, data) if data is not None else ctx.ptr(name))
+    y = ctx.ptr(node.output[0])
+
+    if inner == size:
+        ctx.kernels.add(prefix)
+        return f"""
+    /* Layer {i}: {node.op_type} */
+    {prefix}_forward({operands[0]}, {operands[1]}, {y}, {size});"""
+
+    ctx.kernels.add(f"{prefix}_broadcast")
+    return f"""
+    /* Layer {i}: {node.op_type} (broadcast) */
+    {prefix}_broadcast_forward({operands[0]}, {operands[1]}, {y}, {size // inner}, {inner});"""
+
+
+def _lower_view(ctx: _LoweringContext, i: int, node: onnx.NodeProto) -> str:
+    x, y = node.input[0], node.output[0]
+    if ctx.plan.tensor_buffers[x] is ctx.plan.tensor_buffers[y]:
+        return f"""
+    /* Layer {i}: {node.op_type} (view, no data movement) */"""
+    return f"""
+    /* Layer {i}: {node.op_type} (copy) */
+    memcpy({ctx.ptr(y)}, {ctx.ptr(x)}, sizeof({ctx.c_type}) * {ctx.numel(y)});"""
+
+
+# (rows, output row length, [(input, input row length)]) of a Concat, rows being the dims before the axis
+def _concat_layout(ctx: _LoweringContext, node: onnx.NodeProto) -> tuple[int, int, list[tuple[str, int]]]:
+    shape = ctx.shape(node.output[0])
+    axis = _node_attrs(node).get("axis", 0)
+    axis = axis + len(shape) if axis < 0 else axis
+    if not 0 <= axis < len(shape):
+        raise ValueError(f"Layer '{node.name}': Concat axis out of range")
+    outer = int(np.prod(shape[:axis]))
+    return outer, ctx.numel(node.output[0]) // outer, [(name, ctx.numel(name) // outer) for name in node.input if name]
+
+
+# memcpy of each input's rows to its column offset inside the output rows
+def _concat_copies(ctx: _LoweringContext, y: str, outer: int, width: int, copies: list[tuple[str, int, int]]) -> str:
+    if not copies:
+        return ""
+    if outer == 1:
+        return "".join(f"""
+    memcpy({y} + {offset}, {src}, sizeof({ctx.c_type}) * {inner});""" for src, offset, inner in copies)
+    body = "".join(f"""
+        memcpy({y} + r * {width} + {offset}, {src} + r * {inner}, sizeof({ctx.c_type}) * {inner});""" for src, offset, inner in copies)
+    return f"""
+    for (size_t r = 0; r < {outer}; r++) {{{body}
+    }}"""
+
+
+def _lower_concat(ctx: _LoweringContext, i: int, node: onnx.NodeProto) -> str:
+    outer, width, inputs = _concat_layout(ctx, node)
+    copies = []
+    offset = 0
+    for name, inner in inputs:
+        data = ctx.value(name)
+        copies.append((ctx.constant(name, data) if data is not None else ctx.ptr(name), offset, inner))
+        offset += inner
+    return f"""
+    /* Layer {i}: Concat of {len(inputs)} inputs */{_concat_copies(ctx, ctx.ptr(node.output[0]), outer, width, copies)}"""
+
+
+# window geometry of a Conv/pool, checked against the inferred output shape the arena was planned with
+def _window(ctx: _LoweringContext, node: onnx.NodeProto, kernel: Optional[list[int]] = None) -> Window2D:
+    shape = ctx.shape(node.input[0])
+    if len(shape) not in (3, 4):
+        raise ValueError(f"Layer '{node.name}': {node.op_type} is only supported on 1D and 2D inputs")
+    win = window_2d(_node_attrs(node), shape[2:], kernel)
+    spatial = [win.out_w] if len(shape) == 3 else [win.out_h, win.out_w]
+    if ctx.shape(node.output[0])[2:] != spatial:
+        raise ValueError(
+            f"Layer '{node.name}': inferred output shape {ctx.shape(node.output[0])} "
+            f"does not match the {node.op_type} window ({spatial})"
+        )
+    ctx.kernels.add("window2d")
+    return win
+
+
+def _window_label(node: onnx.NodeProto, win: Window2D, activation: Optional[str] = None) -> str:
+    label = f"{node.op_type} {win.kernel_h}x{win.kernel_w}"
+    if (win.stride_h, win.stride_w) != (1, 1):
+        label += f", stride {win.stride_h}x{win.stride_w}"
+    if (win.dilation_h, win.dilation_w) != (1, 1):
+        label += f", dilation {win.dilation_h}x{win.dilation_w}"
+    return f"{label} + {activation}" if activation else label
+
+
+# a windowed kernel call with its geometry in a static struct; call(x, y) formats the call
+def _window_statement(
+    ctx: _LoweringContext,
+    i: int,
+    node: onnx.NodeProto,
+    label: str,
+    win: Window2D,
+    call: Callable[[str, str], str],
+    batch: int = 1
+) -> str:
+    x, y = ctx.ptr(node.input[0]), ctx.ptr(node.output[0])
+    if batch == 1:
+        body = f"{call(x, y)};"
+    else:
+        in_size, out_size = ctx.numel(node.input[0]) // batch, ctx.numel(node.output[0]) // batch
+        label += f", batch {batch}"
+        body = f"""for (size_t n = 0; n < {batch}; n++) {{
+            {call(f"{x} + n * {in_size}", f"{y} + n * {out_size}")};
+        }}"""
+    return f"""
+    /* Layer {i}: {label} */
+    {{
+        static const window2d_t window = {win.c_initializer()};
+        {body}
+    }}"""
+
+
+def _lower_conv(ctx: _LoweringContext, i: int, node: onnx.NodeProto) -> str:
+    weight = ctx.value(node.input[1])
+    if weight is None:
+        raise ValueError(f"Layer '{node.name}': Conv needs a constant weight")
+    win = _window(ctx, node, list(weight.shape[2:]))
+    weight_sym = ctx.constant(node.input[1], weight)
+    bias_sym = "NULL"
+    if len(node.input) > 2 and node.input[2]:
+        bias_sym = ctx.constant(node.input[2], ctx.value(node.input[2]))
+
+    group = _node_attrs(node).get("group", 1)
+    batch, in_channels = ctx.shape(node.input[0])[:2]
+    out_channels = weight.shape[0]
+    activation = ctx.index.fused.get(node.output[0])
+    suffix = f"_{activation.lower()}" if activation else ""
+    label = _window_label(node, win, activation)
+
+    if is_depthwise(list(weight.shape), group):
+        kernel = f"depthwise_conv2d{suffix}"
+        ctx.kernels.add(kernel)
+        multiplier = out_channels // in_channels
+        return _window_statement(ctx, i, node, f"Depthwise {label}", win, lambda x, y: (
+            f"{kernel}_forward({x}, {weight_sym}, {bias_sym}, {y}, {in_channels}, {multiplier}, &window)"
+        ), batch)
+
+    kernel = f"conv2d{suffix}"
+    ctx.kernels.add(kernel)
+    patch = ctx.scratch(i)
+    return _window_statement(ctx, i, node, label, win, lambda x, y: (
+        f"{kernel}_forward({x}, {weight_sym}, {bias_sym}, {y}, {patch}, {in_channels}, {out_channels}, {group}, &window)"
+    ), batch)
+
+
+# batch and channel planes are pooled independently, so the kernels see N * C channels
+def _pool_channels(ctx: _LoweringContext, node: onnx.NodeProto) -> int:
+    if len(node.output) > 1 and node.output[1] and node.output[1] in ctx.index.consumers:
+        raise ValueError(f"Layer '{node.name}': MaxPool indices output is not supported")
+    shape = ctx.shape(node.input[0])
+    return shape[0] * shape[1]
+
+
+def _lower_pool(ctx: _LoweringContext, i: int, node: onnx.NodeProto) -> str:
+    channels = _pool_channels(ctx, node)
+    win = _window(ctx, node)
+    if node.op_type == "MaxPool":
+        ctx.kernels.add("maxpool2d")
+        return _window_statement(ctx, i, node, _window_label(node, win), win, lambda x, y: (
+            f"maxpool2d_forward({x}, {y}, {channels}, &window)"
+        ))
+    count_include_pad = _node_attrs(node).get("count_include_pad", 0)
+    ctx.kernels.add("avgpool2d")
+    return _window_statement(ctx, i, node, _window_label(node, win), win, lambda x, y: (
+        f"avgpool2d_forward({x}, {y}, {channels}, &window, {count_include_pad})"
+    ))
+
+
+def _lower_global_pool(ctx: _LoweringContext, i: int, node: onnx.NodeProto) -> str:
+    channels = _pool_channels(ctx, node)
+    kernel = "global_avgpool" if node.op_type == "GlobalAveragePool" else "global_maxpool"
+    ctx.kernels.add(kernel)
+    x, y = ctx.ptr(node.input[0]), ctx.ptr(node.output[0])
+    return f"""
+    /* Layer {i}: {node.op_type} */
+    {kernel}_forward({x}, {y}, {channels}, {ctx.numel(node.input[0]) // channels});"""
+
+
+# ONNX op -> lowering function returning the C statements for one layer
+LAYER_LOWERINGS = {
+    "Gemm": _lower_dense,
+    "MatMul": _lower_dense,
+    "Relu": _lower_activation,
+    "Sigmoid": _lower_activation,
+    "Tanh": _lower_activation,
+    "Softmax": _lower_softmax,
+    **{op: _lower_binary for op in BINARY_OPS},
+    **{op: _lower_view for op in ALIAS_OPS},
+    "Concat": _lower_concat,
+    "Conv": _lower_conv,
+    "MaxPool": _lower_pool,
+    "AveragePool": _lower_pool,
+    "GlobalAveragePool": _lower_global_pool,
+    "GlobalMaxPool": _lower_global_pool,
+}
+
+
+def _c_float(value: float) -> str:
+    return f"{float(np.float32(value)):.9e}f"
+
+
+# int8 constants of a dense/Conv layer: (layer, "weights, bias, multiplier, shift" symbols, table symbol or NULL)
+def _quantized_layer(ctx: _LoweringContext, node: onnx.NodeProto, tile: int = 1) -> tuple[QuantizedDense, str, str]:
+    layer = ctx.quantization.layers.get(node.output[0])
+    if layer is None:
+        raise ValueError(f"Layer '{node.name or node.output[0]}' has no quantized weights (was this graph calibrated, with the same optimize setting?)")
+    if tile > 1:
+        weight_sym = ctx.constant(node.input[1], pack_dense_rows(layer.weight, tile), f"_q_x{tile}", np.int8)
+    else:
+        weight_sym = ctx.constant(node.input[1], layer.weight, "_q", np.int8)
+    bias_sym = ctx.constant(node.output[0], layer.bias, "_bias_q", np.int32)
+    multiplier_sym = ctx.constant(node.output[0], layer.multiplier, "_multiplier", np.int32)
+    shift_sym = ctx.constant(node.output[0], layer.shift, "_shift", np.int32)
+    table_sym = "NULL"
+    if layer.table is not None:
+        table_sym = ctx.constant(node.output[0], layer.table, "_lut", np.int8)
+    ctx.kernels.update(("saturate", "requantize"))
+    return layer, f"{weight_sym}, {bias_sym}, {multiplier_sym}, {shift_sym}", table_sym
+
+
+def _lower_dense_int8(ctx: _LoweringContext, i: int, node: onnx.NodeProto) -> str:
+    tile = dense_tile(ctx.shape(node.output[0])[-1])
+    layer, args, table_sym = _quantized_layer(ctx, node, tile)
+    out_features, in_features = layer.weight.shape
+    activation = ctx.index.fused.get(node.output[0])
+    label = f"{node.op_type} + {activation}" if activation else node.op_type
+
+    kernel = f"dense_int8_x{tile}" if tile > 1 else "dense_int8"
+    ctx.kernels.update(("dense_int8_output", kernel))
+    x, y = ctx.ptr(node.input[0]), ctx.ptr(node.output[0])
+    tail = f"{in_features}, {out_features}, {layer.zero_point}, {layer.activation_min}, {table_sym}"
+    rows = ctx.numel(node.input[0]) // in_features
+    if rows == 1:
+        return f"""
+    /* Layer {i}: Dense ({label}, int8) */
+    {kernel}_forward({x}, {args}, {y}, {tail});"""
+    return f"""
+    /* Layer {i}: Dense ({label}, int8), {rows} rows */
+    for (size_t r = 0; r < {rows}; r++) {{
+        {kernel}_forward({x} + r * {in_features}, {args}, {y} + r * {out_features}, {tail});
+    }}"""
+
+
+def _lower_conv_int8(ctx: _LoweringContext, i: int, node: onnx.NodeProto) -> str:
+    layer, args, table_sym = _quantized_layer(ctx, node)
+    weight_shape = list(ctx.value(node.input[1]).shape)
+    win = _window(ctx, node, weight_shape[2:])
+    group = _node_attrs(node).get("group", 1)
+    batch, in_channels = ctx.shape(node.input[0])[:2]
+    out_channels = weight_shape[0]
+    label = _window_label(node, win, ctx.index.fused.get(node.output[0])) + ", int8"
+    tail = f"{ctx.qparams(node.input[0]).zero_point}, {layer.zero_point}, {layer.activation_min}, {table_sym}"
+
+    if is_depthwise(weight_shape, group):
+        ctx.kernels.add("depthwise_conv2d_int8")
+        multiplier = out_channels // in_channels
+        return _window_statement(ctx, i, node, f"Depthwise {label}", win, lambda x, y: (
+            f"depthwise_conv2d_int8_forward({x}, {args}, {y}, {in_channels}, {multiplier}, &window, {tail})"
+        ), batch)
+
+    ctx.kernels.add("conv2d_int8")
+    patch = ctx.scratch(i)
+    return _window_statement(ctx, i, node, label, win, lambda x, y: (
+        f"conv2d_int8_forward({x}, {args}, {y}, {patch}, {in_channels}, {out_channels}, {group}, &window, {tail})"
+    ), batch)
+
+
+# MaxPool shares its input's parameters, average pools rescale the mean to the output scale
+def _lower_pool_int8(ctx: _LoweringContext, i: int, node: onnx.NodeProto) -> str:
+    channels = _pool_channels(ctx, node)
+    x_params, y_params = ctx.qparams(node.input[0]), ctx.qparams(node.output[0])
+    win = None if node.op_type in ("GlobalAveragePool", "GlobalMaxPool") else _window(ctx, node)
+    size = ctx.numel(node.input[0]) // channels
+
+    if node.op_type in ("MaxPool", "GlobalMaxPool"):
+        if x_params != y_params:
+            raise ValueError(f"Layer '{node.name}': int8 {node.op_type} needs the same input and output parameters")
+        if win is None:
+            ctx.kernels.add("global_maxpool_int8")
+            return f"""
+    /* Layer {i}: GlobalMaxPool (int8) */
+    global_maxpool_int8_forward({ctx.ptr(node.input[0])}, {ctx.ptr(node.output[0])}, {channels}, {size});"""
+        ctx.kernels.add("maxpool2d_int8")
+        return _window_statement(ctx, i, node, _window_label(node, win) + ", int8", win, lambda x, y: (
+            f"maxpool2d_int8_forward({x}, {y}, {channels}, &window)"
+        ))
+
+    requant = f"{x_params.zero_point}, {_c_float(x_params.scale / y_params.scale)}, {y_params.zero_point}"
+    ctx.kernels.add("saturate")
+    if win is None:
+        ctx.kernels.add("global_avgpool_int8")
+        return f"""
+    /* Layer {i}: GlobalAveragePool (int8) */
+    global_avgpool_int8_forward({ctx.ptr(node.input[0])}, {ctx.ptr(node.output[0])}, {channels}, {size}, {requant});"""
+    count_include_pad = _node_attrs(node).get("count_include_pad", 0)
+    ctx.kernels.add("avgpool2d_int8")
+    return _window_statement(ctx, i, node, _window_label(node, win) + ", int8", win, lambda x, y: (
+        f"avgpool2d_int8_forward({x}, {y}, {channels}, &window, {count_include_pad}, {requant})"
+    ))
+
+
+def _lower_lut_int8(ctx: _LoweringContext, i: int, node: onnx.NodeProto) -> str:
+    table = lut_table(node.op_type, ctx.qparams(node.input[0]), ctx.qparams(node.output[0]))
+    table_sym = ctx.constant(node.output[0], table, "_lut", np.int8)
+    ctx.kernels.add("lut_int8")
+    x, y = ctx.ptr(node.input[0]), ctx.ptr(node.output[0])
+    return f"""
+    /* Layer {i}: {node.op_type} (int8 lookup table) */
+    lut_int8_forward({x}, {y}, {ctx.numel(node.output[0])}, {table_sym});"""
+
+
+def _lower_softmax_int8(ctx: _LoweringContext, i: int, node: onnx.NodeProto) -> str:
+    rows, cols = _softmax_layout(ctx, node)
+    x_params, y_params = ctx.qparams(node.input[0]), ctx.qparams(node.output[0])
+    args = f"{_c_float(x_params.scale)}, {_c_float(1.0 / y_params.scale)}, {y_params.zero_point}"
+
+    ctx.kernels.update(("saturate", "softmax_int8"))
+    x, y = ctx.ptr(node.input[0]), ctx.ptr(node.output[0])
+    if rows == 1:
+        return f"""
+    /* Layer {i}: Softmax (int8) */
+    softmax_int8_forward({x}, {y}, {cols}, {args});"""
+    return f"""
+    /* Layer {i}: Softmax (int8), {rows} rows */
+    for (size_t r = 0; r < {rows}; r++) {{
+        softmax_int8_forward({x} + r * {cols}, {y} + r * {cols}, {cols}, {args});
+    }}"""
+
+
+def _lower_binary_int8(ctx: _LoweringContext, i: int, node: onnx.NodeProto) -> str:
+    prefix, _ = BINARY_OPS[node.op_type]
+    a, b, size, inner = _binary_layout(ctx, node)
+    a_params, b_params, y_params = ctx.qparams(a), ctx.qparams(b), ctx.qparams(node.output[0])
+
+    operands = []
+    for name, params in ((a, a_params), (b, b_params)):
+        data = ctx.value(name)
+        operands.append(ctx.constant(name, params.quantize(data), "_q", np.int8) if data is not None else ctx.ptr(name))
+    y = ctx.ptr(node.output[0])
+
+    if node.op_type == "Mul":
+        multiplier, shift = quantize_multiplier(np.array([a_params.scale * b_params.scale / y_params.scale]))
+        args = f"{a_params.zero_point}, {b_params.zero_point}, {multiplier[0]}, {shift[0]}, {y_params.zero_point}"
+    else:
+        ratios = np.array([a_params.scale / y_params.scale, b_params.scale / y_params.scale])
+        # operands are scaled up by INT8_ADD_LEFT_SHIFT bits, larger ratios would overflow int32
+        if ratios.max() >= 1 << (31 - 8 - INT8_ADD_LEFT_SHIFT):
+            raise ValueError(f"Layer '{node.name}': operand ranges of {node.op_type} are too far apart for int8")
+        multiplier, shift = quantize_multiplier(ratios)
+        args = (
+            f"{a_params.zero_point}, {multiplier[0]}, {shift[0]}, "
+            f"{b_params.zero_point}, {multiplier[1]}, {shift[1]}, {y_params.zero_point}"
+        )
+
+    ctx.kernels.update(("saturate", "requantize", f"{prefix}_int8"))
+    broadcast = " (broadcast)" if inner != size else ""
+    return f"""
+    /* Layer {i}: {node.op_type} (int8){broadcast} */
+    {prefix}_int8_forward({operands[0]}, {operands[1]}, {y}, {size // inner}, {inner}, {args});"""
+
+
+# inputs quantized like the output are copied, the others are requantized to the output's parameters
+def _lower_concat_int8(ctx: _LoweringContext, i: int, node: onnx.NodeProto) -> str:
+    outer, width, inputs = _concat_layout(ctx, node)
+    y_params = ctx.qparams(node.output[0])
+    y = ctx.ptr(node.output[0])
+
+    copies, rescaled = [], []
+    offset = 0
+    for name, inner in inputs:
+        params = ctx.qparams(name)
+        data = ctx.value(name)
+        src = ctx.constant(name, params.quantize(data), "_q", np.int8) if data is not None else ctx.ptr(name)
+        if (params.scale, params.zero_point) == (y_params.scale, y_params.zero_point):
+            copies.append((src, offset, inner))
+        else:
+            multiplier, shift = quantize_multiplier(np.array([params.scale / y_params.scale]))
+            rescaled.append(f"""
+    requantize_int8_forward({src}, {y} + {offset}, {outer}, {inner}, {width}, {params.zero_point}, {multiplier[0]}, {shift[0]}, {y_params.zero_point});""")
+        offset += inner
+
+    if rescaled:
+        ctx.kernels.update(("saturate", "requantize", "requantize_int8"))
+    return f"""
+    /* Layer {i}: Concat of {len(inputs)} inputs (int8) */{_concat_copies(ctx, y, outer, width, copies)}{"".join(rescaled)}"""
+
+
+# ONNX op -> lowering function for int8 models
+INT8_LAYER_LOWERINGS = {
+    "Gemm": _lower_dense_int8,
+    "MatMul": _lower_dense_int8,
+    **{op: _lower_lut_int8 for op in LUT_OPS},
+    "Softmax": _lower_softmax_int8,
+    **{op: _lower_binary_int8 for op in BINARY_OPS},
+    **{op: _lower_view for op in ALIAS_OPS},
+    "Concat": _lower_concat_int8,
+    "Conv": _lower_conv_int8,
+    **{op: _lower_pool_int8 for op in ("MaxPool", "AveragePool", "GlobalAveragePool", "GlobalMaxPool")},
+}
+
+
+# lowers the ONNX graph to kernel calls over a single planned tensor arena
+def lower_model(index: GraphIndex, quantization: Optional[QuantizedModel] = None) -> LoweredModel:
+    """
+    Lower a model to kernel calls over one statically planned arena.
+
+    With quantization, every activation is int8 and layers use the integer
+    kernels; the float input is quantized into the arena first and the
+    final int8 result is dequantized into the caller's output buffer, so
+    both copies are planned as arena tensors.
+    """
+    model = index.model
+    if quantization is None:
+        plan = schedule_nodes(index)
+        lowerings = LAYER_LOWERINGS
+    else:
+        plan = schedule_nodes(index, bytes_per_element=1, external_io=False)
+        lowerings = INT8_LAYER_LOWERINGS
+    ctx = _LoweringContext(index, plan, quantization)
+
+    if len(ctx.graph_inputs) != 1 or len(model.graph.output) != 1:
+        raise ValueError("Only models with exactly one input and one output can be compiled")
+    input_name, output_name = next(iter(ctx.graph_inputs)), model.graph.output[0].name
+
+    nodes = index.nodes
+    statements = []
+    quant_io = None
+    if quantization is not None:
+        quant_io = (ctx.qparams(input_name), ctx.qparams(output_name))
+        ctx.kernels.update(("saturate", "quantize", "dequantize"))
+        statements.append(f"""
+    /* Quantize the float input */
+    quantize_forward(input, {ctx.ptr(input_name)}, {ctx.numel(input_name)}, {_c_float(1.0 / quant_io[0].scale)}, {quant_io[0].zero_point});""")
+
+    for i, idx in enumerate(plan.order):
+        node = nodes[idx]
+        if node.op_type in CONSTANT_OPS:
+            continue
+        lowering = lowerings.get(node.op_type)
+        if lowering is None:
+            raise ValueError(f"Unsupported operator '{node.op_type}' in layer '{node.name or i}'")
+        statements.append(lowering(ctx, i, node))
+
+    if quantization is not None:
+        statements.append(f"""
+    /* Dequantize the int8 output */
+    dequantize_forward({ctx.ptr(output_name)}, output, {ctx.numel(output_name)}, {_c_float(quant_io[1].scale)}, {quant_io[1].zero_point});""")
+
+    return LoweredModel(
+        constants=ctx.constants,
+        statements=statements,
+        kernels=ctx.kernels,
+        views=list(ctx.views.values()),
+        plan=plan,
+        input_size=ctx.numel(input_name),
+        output_size=ctx.numel(output_name),
+        quant_io=quant_io
+    )
+
+
+# writes source file to a stream
+def write_source(
+    out: TextIO,
+    model_name: str,
+    model_info: dict,
+    model: onnx.ModelProto,
+    target_chip: str,
+    timings: Optional[dict[str, float]] = None,
+    blob_tensors: Optional[list[BlobTensor]] = None,
+    lowered: Optional[LoweredModel] = None,
+    progress: Optional[Callable[[str], None]] = None,
+    golden: Optional[GoldenVectors] = None
+) -> None:
+    if lowered is None:
+        lowered = lower_model(build_graph_index(model))
+    input_size = lowered.input_size
+    output_size = lowered.output_size
+
+    layers_code = "\n".join(lowered.statements) if lowered.statements else "    /* No layers */"
+    views_code = ""
+    if lowered.views:
+        views_code = "    /* Tensor views into the arena */\n" + "\n".join(f"    {v}" for v in lowered.views) + "\n\n"
+
+    activation_code = "\n\n".join(src for name, src in ACTIVATION_KERNELS.items() if name in lowered.kernels)
+    kernel_code = "\n\n".join(
+        src for name, src in (*LAYER_KERNELS.items(), *INT8_KERNELS.items()) if name in lowered.kernels
+    )
+
+    arena_code = "/* No intermediate tensors */"
+    if lowered.plan.arena_size:
+        arena_code = f"""#if defined(__GNUC__)
+#define SILICON_ALIGN(n) __attribute__((aligned(n)))
+#else
+#define SILICON_ALIGN(n)
+#endif
+
+/* Intermediate tensors share one arena; offsets come from liveness-based planning */
+static uint8_t arena[{model_name.upper()}_ARENA_SIZE] SILICON_ALIGN({ARENA_ALIGNMENT});"""
+
+    out.write(f"""/**
+ * {model_name}.c - Generated Neural Network Implementation
+ * Target: {target_chip}
+ * Total Parameters: {model_info.get('total_parameters', 0):,}
+ * Arena Size: {lowered.plan.arena_size:,} bytes
+ * Precision: {"int8 (post-training quantized)" if lowered.quant_io else "float32"}
+ * 
+ * Auto-generated by Silicon Edge AI Compiler
+ */
+
+#include "{model_name}.h"
+#include <math.h>
+#include <string.h>
+
+/* ============= Weights and Biases ============= */
+
+""")
+
+    # weights are streamed straight to the output instead of being built as one string
+    start = time.perf_counter()
+    if blob_tensors is not None:
+        write_blob_weights(out, model_name, blob_tensors)
+    else:
+        if progress:
+            progress("emit weights")
+        with stage("compile.weights"):
+            write_weights(out, lowered.constants)
+    if timings is not None:
+        timings["weights"] = time.perf_counter() - start
+    if progress:
+        progress("emit code")
+
+    out.write(f"""
+
+/* ============= Tensor Arena ============= */
+
+{arena_code}
+
+/* ============= Activation Functions ============= */
+
+{activation_code or "/* None used */"}
+
+/* ============= Layer Functions ============= */
+
+{kernel_code or "/* None used */"}
 
 /* ============= Model Functions ============= */
 
@@ -287,13 +1834,8 @@ void {model_name}_init(void) {{
 }}
 
 void {model_name}_forward(const float* input, float* output) {{
-    /* Forward pass through all layers */
-    size_t layer_size = {input_size};
-    (void)layer_size; /* Suppress unused warning if needed */
+{views_code}    /* Forward pass through all layers */
 {layers_code}
-    
-    /* Copy final result to output if not already there */
-    /* memcpy(output, final_layer, sizeof(float) * {output_size}); */
 }}
 
 size_t {model_name}_get_input_size(void) {{
@@ -307,13 +1849,24 @@ size_t {model_name}_get_output_size(void) {{
 /* ============= Python/C Inference Comparison Helper ============= */
 
 #ifdef ENABLE_INFERENCE_TEST
-/*
+""")
+    # the test harness checks against golden vectors from the reference executor when given
+    if golden is not None:
+        if golden.inputs.shape[1] != input_size or golden.outputs.shape[1] != output_size:
+            raise ValueError(
+                f"Golden vectors are {golden.inputs.shape[1]} -> {golden.outputs.shape[1]} values, "
+                f"the model is {input_size} -> {output_size}"
+            )
+        write_golden_test(out, model_name, golden)
+    else:
+        out.write(f"""/*
  * Test inference with known input.
  * Use this to compare Python vs C inference results.
+ * Returns the number of outputs outside tolerance (always 0 without golden vectors).
  */
 #include <stdio.h>
 
-void {model_name}_test_inference(void) {{
+int {model_name}_test_inference(void) {{
     float test_input[{input_size}];
     float test_output[{output_size}];
     
@@ -328,26 +1881,195 @@ void {model_name}_test_inference(void) {{
     for (size_t i = 0; i < {output_size}; i++) {{
         printf("  [%zu] = %.6f\\n", i, test_output[i]);
     }}
+    return 0;
 }}
-#endif
-"""
-    return source
+""")
+    out.write("#endif\n")
+
+
+# test harness that runs the golden vectors through forward() and counts values outside tolerance
+def write_golden_test(out: TextIO, model_name: str, golden: GoldenVectors) -> None:
+    prefix = model_name.upper()
+    samples, input_size = golden.inputs.shape
+    output_size = golden.outputs.shape[1]
+    out.write(f"""/*
+ * Golden vectors from the NumPy reference executor. {model_name}_test_inference
+ * runs every input through {model_name}_forward and checks each output value
+ * against |out - ref| <= ATOL + RTOL * |ref|.
+ * Returns the number of outputs outside tolerance.
+ */
+#include <stdio.h>
+
+#define {prefix}_GOLDEN_COUNT {samples}
+#define {prefix}_GOLDEN_ATOL {_c_float(golden.atol)}
+#define {prefix}_GOLDEN_RTOL {_c_float(golden.rtol)}
+
+""")
+    write_weight_array(out, golden.inputs, f"{model_name}_golden_input")
+    out.write("\n\n")
+    write_weight_array(out, golden.outputs, f"{model_name}_golden_output")
+    out.write(f"""
+
+int {model_name}_test_inference(void) {{
+    static float test_output[{output_size}];
+    int failures = 0;
+    for (size_t s = 0; s < {prefix}_GOLDEN_COUNT; s++) {{
+        const float* expected = {model_name}_golden_output + s * {output_size};
+        float max_abs = 0.0f;
+        {model_name}_forward({model_name}_golden_input + s * {input_size}, test_output);
+        for (size_t i = 0; i < {output_size}; i++) {{
+            float err = fabsf(test_output[i] - expected[i]);
+            if (err > max_abs) max_abs = err;
+            if (err > {prefix}_GOLDEN_ATOL + {prefix}_GOLDEN_RTOL * fabsf(expected[i])) failures++;
+        }}
+        printf("golden %zu: max abs error %g\\n", s, (double)max_abs);
+    }}
+    printf("%d of %d outputs outside tolerance\\n", failures, {prefix}_GOLDEN_COUNT * {output_size});
+    return failures;
+}}
+""")
+
+
+# generates source file
+def generate_source(
+    model_name: str,
+    model_info: dict,
+    model: onnx.ModelProto,
+    target_chip: str,
+    timings: Optional[dict[str, float]] = None,
+    blob_tensors: Optional[list[BlobTensor]] = None,
+    lowered: Optional[LoweredModel] = None,
+    progress: Optional[Callable[[str], None]] = None,
+    golden: Optional[GoldenVectors] = None
+) -> str:
+    buffer = io.StringIO()
+    write_source(buffer, model_name, model_info, model, target_chip, timings, blob_tensors, lowered, progress, golden)
+    return buffer.getvalue()
+
+# C identifier prefix used for a model's files and symbols
+def safe_model_name(model_name: str) -> str:
+    return model_name.replace("-", "_").replace(".", "_").replace(" ", "_").lower()
+
+
+# names of the files generated for a model, in the order emit_model writes them
+def artifact_names(model_name: str, weights_mode: str = "inline") -> list[str]:
+    safe_name = safe_model_name(model_name)
+    names = [f"{safe_name}.h", f"{safe_name}.c"]
+    if weights_mode == "blob":
+        names = [f"{safe_name}_weights.bin", f"{safe_name}_weights.S"] + names
+    return names
+
+
+@instrumented("compile")
+def emit_model(
+    open_text: Callable[[str], ContextManager[TextIO]],
+    open_binary: Callable[[str], ContextManager[BinaryIO]],
+    model: onnx.ModelProto,
+    model_info: dict,
+    model_name: str = "model",
+    target_chip: str = "STM32F401",
+    weights_mode: str = "inline",
+    index: Optional[GraphIndex] = None,
+    progress: Optional[Callable[[str], None]] = None,
+    quantization: Optional[QuantizedModel] = None,
+    optimize: bool = True,
+    golden: Optional[GoldenVectors] = None
+) -> dict[str, float]:
+    """
+    Lower a model and stream every generated file to the caller.
+
+    Each file is written through a stream obtained from open_text(filename)
+    or open_binary(filename), so callers decide whether output is kept in
+    memory, written to disk or packed into an archive as it is produced.
+    Files are emitted in artifact_names order. progress, if given, is called
+    with the name of each stage as it starts: "parse", "optimize", "plan",
+    "emit weights" and "emit code". With optimize, the graph is first
+    rewritten by optimize_graph (skipped if index is already optimized).
+    With quantization (from quantize_model on the same index) the model is
+    compiled to int8 kernels. With golden (see reference.golden_vectors) the
+    ENABLE_INFERENCE_TEST harness checks forward() against those vectors.
+
+    Returns:
+        Per-stage timings in seconds
+    """
+    if weights_mode not in WEIGHTS_MODES:
+        raise ValueError(f"Unknown weights mode '{weights_mode}', expected one of {WEIGHTS_MODES}")
+
+    safe_name = safe_model_name(model_name)
+    
+    if progress:
+        progress("parse")
+    if index is None:
+        index = build_graph_index(model)
+
+    timings = {}
+    if optimize and index.optimization is None:
+        if progress:
+            progress("optimize")
+        start = time.perf_counter()
+        index = optimize_graph(index)
+        timings["optimize"] = time.perf_counter() - start
+
+    if progress:
+        progress("plan")
+    start = time.perf_counter()
+    with stage("compile.plan"):
+        lowered = lower_model(index, quantization)
+    timings["plan"] = time.perf_counter() - start
+
+    blob_tensors = None
+    if weights_mode == "blob":
+        if progress:
+            progress("emit weights")
+        start = time.perf_counter()
+        with stage("compile.blob"):
+            with open_binary(f"{safe_name}_weights.bin") as out:
+                blob_tensors = write_weight_blob(out, lowered.constants)
+            with open_text(f"{safe_name}_weights.S") as out:
+                out.write(generate_weights_stub(safe_name, target_chip))
+        timings["blob"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with stage("compile.header"), open_text(f"{safe_name}.h") as out:
+        out.write(generate_header(
+            safe_name, model_info, target_chip, blob_tensors, lowered.plan.arena_size, lowered.quant_io
+        ))
+    timings["header"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with stage("compile.source"), open_text(f"{safe_name}.c") as out:
+        write_source(out, safe_name, model_info, model, target_chip, timings, blob_tensors, lowered, progress, golden)
+    timings["source"] = time.perf_counter() - start
+    timings["total"] = (
+        timings.get("optimize", 0.0) + timings["plan"] + timings.get("blob", 0.0) + timings["header"] + timings["source"]
+    )
+    return timings
+
 
 # compiles model and returns compiled model object
 def compile_model(
     model: onnx.ModelProto,
     model_info: dict,
     model_name: str = "model",
-    target_chip: str = "STM32F401"
+    target_chip: str = "STM32F401",
+    weights_mode: str = "inline",
+    index: Optional[GraphIndex] = None,
+    progress: Optional[Callable[[str], None]] = None,
+    quantization: Optional[QuantizedModel] = None,
+    optimize: bool = True,
+    golden: Optional[GoldenVectors] = None
 ) -> CompiledModel:
+    files = {}
 
-    safe_name = model_name.replace("-", "_").replace(".", "_").replace(" ", "_").lower()
-    
-    header = generate_header(safe_name, model_info, target_chip)
-    source = generate_source(safe_name, model_info, model, target_chip)
-    
-    return CompiledModel(
-        source_code=source,
-        header_code=header,
-        model_name=safe_name
+    @contextmanager
+    def open_memory(name: str, binary: bool):
+        buffer = io.BytesIO() if binary else io.StringIO()
+        yield buffer
+        files[name] = buffer.getvalue()
+
+    timings = emit_model(
+        lambda name: open_memory(name, False),
+        lambda name: open_memory(name, True),
+        model, model_info, model_name, target_chip, weights_mode, index, progress, quantization, optimize, golden
     )
+    return CompiledModel.from_files(files, model_name, weights_mode, timings)
@@ -0,0 +1,113 @@
+from dataclasses import dataclass
+from typing import Optional
+import math
+
+
+# ops that slide a window over the spatial dimensions of an NCHW (or NCL) tensor
+WINDOW_OPS = {"Conv", "MaxPool", "AveragePool"}
+
+# pooling over the whole spatial extent
+GLOBAL_POOL_OPS = {"GlobalAveragePool", "GlobalMaxPool"}
+
+
+@dataclass
+class Window2D:
+    """Sliding window of a Conv or pool over one [H, W] plane; 1D ops use H = 1."""
+    in_h: int
+    in_w: int
+    out_h: int
+    out_w: int
+    kernel_h: int
+    kernel_w: int
+    stride_h: int = 1
+    stride_w: int = 1
+    pad_top: int = 0
+    pad_left: int = 0
+    pad_bottom: int = 0
+    pad_right: int = 0
+    dilation_h: int = 1
+    dilation_w: int = 1
+
+    def c_initializer(self) -> str:
+        """Positional C initializer matching the window2d_t struct of the generated code"""
+        return "{" + ", ".join(str(v) for v in (
+            self.in_h, self.in_w, self.out_h, self.out_w, self.kernel_h, self.kernel_w,
+            self.stride_h, self.stride_w, self.pad_top, self.pad_left, self.pad_bottom, self.pad_right,
+            self.dilation_h, self.dilation_w
+        )) + "}"
+
+
+# output size and (begin, end) padding of one spatial axis, following ONNX auto_pad rules
+def _axis(size: int, kernel: int, stride: int, dilation: int, pads: tuple[int, int], auto_pad: str, ceil_mode: bool) -> tuple[int, int, int]:
+    extent = dilation * (kernel - 1) + 1
+    if auto_pad in ("SAME_UPPER", "SAME_LOWER"):
+        out = -(-size // stride)
+        total = max((out - 1) * stride + extent - size, 0)
+        small = total // 2
+        begin = small if auto_pad == "SAME_UPPER" else total - small
+        return out, begin, total - begin
+    if auto_pad == "VALID":
+        pads = (0, 0)
+    span = size + pads[0] + pads[1] - extent
+    if span < 0:
+        raise ValueError(f"Kernel extent {extent} is larger than the padded input ({size + pads[0] + pads[1]})")
+    out = (-(-span // stride) if ceil_mode else span // stride) + 1
+    # a ceil-mode window must start inside the input or its left padding
+    if ceil_mode and (out - 1) * stride >= size + pads[0]:
+        out -= 1
+    return out, pads[0], pads[1]
+
+
+def window_2d(attrs: dict, spatial: list[int], kernel: Optional[list[int]] = None) -> Window2D:
+    """
+    Window geometry of a Conv/MaxPool/AveragePool from its ONNX attributes.
+
+    Args:
+        attrs: Node attributes (kernel_shape, strides, pads, dilations, auto_pad, ceil_mode)
+        spatial: Input spatial dimensions, [H, W] or [L]
+        kernel: Kernel spatial dimensions, defaults to the kernel_shape attribute
+
+    Returns:
+        Window2D with 1D windows mapped onto H = 1
+    """
+    rank = len(spatial)
+    if rank not in (1, 2):
+        raise ValueError(f"Only 1D and 2D windows are supported, got {rank} spatial dimensions")
+    kernel = list(kernel if kernel is not None else attrs.get("kernel_shape", []))
+    if len(kernel) != rank:
+        raise ValueError(f"Kernel shape {kernel} does not match {rank} spatial dimensions")
+    strides = list(attrs.get("strides") or [1] * rank)
+    dilations = list(attrs.get("dilations") or [1] * rank)
+    pads = list(attrs.get("pads") or [0] * (2 * rank))
+    auto_pad = attrs.get("auto_pad", b"NOTSET")
+    auto_pad = auto_pad.decode() if isinstance(auto_pad, bytes) else auto_pad
+    ceil_mode = bool(attrs.get("ceil_mode", 0))
+
+    axes = [
+        _axis(spatial[k], kernel[k], strides[k], dilations[k], (pads[k], pads[k + rank]), auto_pad, ceil_mode)
+        for k in range(rank)
+    ]
+    if rank == 1:
+        (out_w, left, right), = axes
+        return Window2D(
+            in_h=1, in_w=spatial[0], out_h=1, out_w=out_w, kernel_h=1, kernel_w=kernel[0],
+            stride_w=strides[0], pad_left=left, pad_right=right, dilation_w=dilations[0]
+        )
+    (out_h, top, bottom), (out_w, left, right) = axes
+    return Window2D(
+        in_h=spatial[0], in_w=spatial[1], out_h=out_h, out_w=out_w, kernel_h=kernel[0], kernel_w=kernel[1],
+        stride_h=strides[0], stride_w=strides[1], pad_top=top, pad_left=left, pad_bottom=bottom, pad_right=right,
+        dilation_h=dilations[0], dilation_w=dilations[1]
+    )
+
+
+# a grouped Conv with one input channel per group runs as a depthwise kernel
+def is_depthwise(weight_shape: list[int], group: int) -> bool:
+    return group > 1 and len(weight_shape) >= 3 and weight_shape[1] == 1
+
+
+# elements of the receptive-field buffer the direct Conv kernel gathers per output pixel (0 for depthwise)
+def conv_patch_size(weight_shape: list[int], group: int) -> int:
+    if is_depthwise(weight_shape, group):
+        return 0
+    return math.prod(weight_shape[1:])
@@ -0,0 +1,218 @@
+from dataclasses import dataclass
+from typing import Callable, Optional
+import math
+import onnx
+
+from services.load_model import GraphIndex
+from services.memory_planner import ALIAS_OPS, CONSTANT_OPS, tensor_bytes
+from services.quantize_model import DENSE_OPS, CONV_OPS, LUT_OPS
+
+
+# ops that only compute shapes or views: no arithmetic and no memory traffic in the generated code
+FREE_OPS = ALIAS_OPS | CONSTANT_OPS | {"Shape"}
+
+# elementwise ops: (flops, transcendental evaluations) per output element
+ELEMENTWISE_COST = {
+    "Relu": (1, 0),
+    "LeakyRelu": (2, 0),        # compare, multiply
+    "Clip": (2, 0),             # two compares
+    "Sigmoid": (3, 1),          # negate, add, divide + exp
+    "Tanh": (0, 1),
+    "Add": (1, 0),
+    "Sub": (1, 0),
+    "Mul": (1, 0),
+    "Div": (1, 0),
+    "Neg": (1, 0),
+    "Abs": (1, 0),
+    "Exp": (0, 1),
+    "Log": (0, 1),
+    "Sqrt": (0, 1),
+    "Erf": (0, 1),
+}
+
+
+@dataclass
+class LayerCost:
+    """Arithmetic and memory traffic of one layer at the graph's batch size."""
+    macs: int = 0                # multiply-accumulates
+    flops: int = 0               # arithmetic ops, a MAC counts as 2; transcendentals are not included
+    transcendentals: int = 0     # exp/tanh/sqrt/... evaluations, each far costlier than a flop on an MCU
+    bytes_read: int = 0          # activations and constants read by the kernel
+    bytes_written: int = 0       # output tensors written by the kernel
+    weight_bytes: int = 0        # part of bytes_read that is constants (weights live in flash)
+
+    def __add__(self, other: "LayerCost") -> "LayerCost":
+        return LayerCost(
+            macs=self.macs + other.macs,
+            flops=self.flops + other.flops,
+            transcendentals=self.transcendentals + other.transcendentals,
+            bytes_read=self.bytes_read + other.bytes_read,
+            bytes_written=self.bytes_written + other.bytes_written,
+            weight_bytes=self.weight_bytes + other.weight_bytes
+        )
+
+
+def _attrs(node: onnx.NodeProto) -> dict:
+    return {attr.name: onnx.helper.get_attribute_value(attr) for attr in node.attribute}
+
+
+# inferred static shape of a tensor, None when shape inference could not resolve it
+def _shape(index: GraphIndex, name: str) -> Optional[list[int]]:
+    info = index.shapes.get(name)
+    if info is None or not all(isinstance(d, int) and d >= 0 for d in info['shape']):
+        return None
+    return info['shape']
+
+
+def _elements(index: GraphIndex, name: str) -> int:
+    shape = _shape(index, name)
+    return math.prod(shape) if shape is not None else 0
+
+
+# ============= Arithmetic per operator: (macs, flops, transcendentals) =============
+
+def _gemm_cost(index, node, attrs):
+    a, b = _shape(index, node.input[0]), _shape(index, node.input[1])
+    if a is None or b is None or len(a) != 2 or len(b) != 2:
+        return 0, 0, 0
+    m, k = (a[1], a[0]) if attrs.get("transA", 0) else (a[0], a[1])
+    n = b[0] if attrs.get("transB", 0) else b[1]
+    macs = m * k * n
+    # alpha and beta scale the product and the bias when they are not 1
+    flops = 2 * macs + (m * n if attrs.get("alpha", 1.0) != 1.0 else 0)
+    if len(node.input) > 2 and node.input[2]:
+        flops += m * n * (2 if attrs.get("beta", 1.0) != 1.0 else 1)
+    return macs, flops, 0
+
+
+def _matmul_cost(index, node, attrs):
+    a = _shape(index, node.input[0])
+    if not a:
+        return 0, 0, 0
+    # every output element is a dot product over A's last axis
+    macs = _elements(index, node.output[0]) * a[-1]
+    return macs, 2 * macs, 0
+
+
+def _conv_cost(index, node, attrs):
+    weight = _shape(index, node.input[1])
+    if weight is None:
+        return 0, 0, 0
+    outputs = _elements(index, node.output[0])
+    # weight is [Cout, Cin / group, k...], so each output reads one weight row
+    macs = outputs * math.prod(weight[1:])
+    bias = outputs if len(node.input) > 2 and node.input[2] else 0
+    return macs, 2 * macs + bias, 0
+
+
+def _pool_cost(index, node, attrs):
+    outputs = _elements(index, node.output[0])
+    window = math.prod(attrs.get("kernel_shape", [1]))
+    if node.op_type == "MaxPool":
+        return 0, outputs * (window - 1), 0
+    # window - 1 adds and one divide per output
+    return 0, outputs * window, 0
+
+
+def _global_pool_cost(index, node, attrs):
+    inputs, outputs = _elements(index, node.input[0]), _elements(index, node.output[0])
+    if node.op_type == "GlobalMaxPool":
+        return 0, inputs - outputs, 0
+    return 0, inputs, 0
+
+
+def _softmax_cost(index, node, attrs):
+    n = _elements(index, node.output[0])
+    # running max, subtract, sum and divide per element plus one exp
+    return 0, 4 * n, n
+
+
+def _batchnorm_cost(index, node, attrs):
+    n = _elements(index, node.output[0])
+    channels = _elements(index, node.input[1])
+    # per-channel scale = gamma / sqrt(var + eps), then a multiply-add per element
+    return 0, 2 * n + 2 * channels, channels
+
+
+def _elementwise_cost(index, node, attrs):
+    flops, transcendentals = ELEMENTWISE_COST[node.op_type]
+    n = _elements(index, node.output[0])
+    return 0, flops * n, transcendentals * n
+
+
+COST_RULES: dict[str, Callable] = {
+    "Gemm": _gemm_cost,
+    "MatMul": _matmul_cost,
+    "Conv": _conv_cost,
+    "MaxPool": _pool_cost,
+    "AveragePool": _pool_cost,
+    "GlobalAveragePool": _global_pool_cost,
+    "GlobalMaxPool": _global_pool_cost,
+    "Softmax": _softmax_cost,
+    "BatchNormalization": _batchnorm_cost,
+    **{op: _elementwise_cost for op in ELEMENTWISE_COST},
+}
+
+
+# (read, written, constant) bytes of a kernel; int8 code keeps activations and weights at one byte and biases as int32
+def _traffic(index: GraphIndex, node: onnx.NodeProto, quantized: bool) -> tuple[int, int, int]:
+    bytes_per_element = 1 if quantized else None
+    read, constant = 0, 0
+    seen = set()
+    for position, name in enumerate(node.input):
+        if not name or name in seen:
+            continue
+        seen.add(name)
+        is_bias = quantized and node.op_type in DENSE_OPS | CONV_OPS and position == 2
+        size = tensor_bytes(index.shapes.get(name), 4 if is_bias else bytes_per_element)
+        read += size
+        if name in index.initializers or name in index.constants:
+            constant += size
+    written = sum(tensor_bytes(index.shapes.get(name), bytes_per_element) for name in node.output if name)
+    return read, written, constant
+
+
+def layer_cost(index: GraphIndex, node: onnx.NodeProto, quantized: bool = False) -> LayerCost:
+    """
+    Cost of one node from the shapes ONNX shape inference resolved.
+
+    MACs count multiply-accumulates of Gemm/MatMul/Conv (Gemm honours transA
+    and transB). FLOPs count every arithmetic op, a MAC being 2, and include
+    pooling, Softmax, BatchNormalization and elementwise ops. Transcendental
+    evaluations are counted separately. An activation fused into the layer
+    by optimize_graph is added to the layer's cost. View and shape ops
+    (Reshape, Flatten, Shape, ...) cost nothing. Tensors whose shape could
+    not be inferred contribute 0.
+
+    Args:
+        index: Graph index with inferred shapes
+        node: Node of index.model
+        quantized: Cost the int8 code: one byte per activation/weight, int32
+            biases, and Relu/Sigmoid/Tanh as table lookups without arithmetic
+
+    Returns:
+        LayerCost of the node
+    """
+    if node.op_type in FREE_OPS:
+        return LayerCost()
+    macs, flops, transcendentals = 0, 0, 0
+    rule = COST_RULES.get(node.op_type)
+    if rule is not None and not (quantized and node.op_type in LUT_OPS):
+        macs, flops, transcendentals = rule(index, node, _attrs(node))
+
+    activation = index.fused.get(node.output[0]) if node.output else None
+    if activation in ELEMENTWISE_COST and not (quantized and activation in LUT_OPS):
+        n = _elements(index, node.output[0])
+        flops += ELEMENTWISE_COST[activation][0] * n
+        transcendentals += ELEMENTWISE_COST[activation][1] * n
+
+    read, written, constant = _traffic(index, node, quantized)
+    return LayerCost(
+        macs=macs, flops=flops, transcendentals=transcendentals,
+        bytes_read=read, bytes_written=written, weight_bytes=constant
+    )
+
+
+# cost of every node, aligned with index.nodes
+def model_costs(index: GraphIndex, quantized: bool = False) -> list[LayerCost]:
+    return [layer_cost(index, node, quantized) for node in index.nodes]
@@ -0,0 +1,74 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+import asyncio
+import contextvars
+import os
+import threading
+
+
+class ExecutorSaturated(Exception):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+class WorkExecutor:
+    """
+    Bounded thread pool for CPU-bound request work (parsing, profiling, codegen).
+
+    At most max_workers jobs run at once and at most max_queue more wait for a
+    worker. Further submissions fail immediately with ExecutorSaturated, so the
+    API can answer 429 instead of letting work pile up. Threads are used
+    rather than processes because jobs operate on parsed models and
+    memory-mapped weights held by the model store.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 32):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="silicon-worker")
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated(f"Server is busy ({self._pending} jobs running or queued), retry later")
+            self._pending += 1
+        try:
+            # jobs see the submitter's context variables (e.g. the request's trace)
+            future = self._pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        except BaseException:
+            self._release(None)
+            raise
+        # released when the job finishes or is cancelled before it starts
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn in the pool and await its result without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "pending": self._pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def _release(self, future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+            if future is not None:
+                self.completed += 1
+
+
+# shared by all routers so the limit applies to the whole process
+work_executor = WorkExecutor(
+    max_workers=int(os.environ.get("SILICON_WORKERS", min(4, os.cpu_count() or 1))),
+    max_queue=int(os.environ.get("SILICON_WORK_QUEUE", 32))
+)
@@ -0,0 +1,323 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, Optional
+import functools
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+
+
+# upper bounds in seconds of the stage and request duration histograms
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# finished request traces kept for GET /metrics/traces/{trace_id}
+MAX_TRACES = int(os.environ.get("SILICON_MAX_TRACES", 32))
+
+# name -> (Prometheus type, help text) of every metric the registry exports
+METRICS = {
+    'silicon_stage_seconds': ('histogram', 'Wall time of pipeline stages'),
+    'silicon_stage_errors_total': ('counter', 'Pipeline stages that raised'),
+    'silicon_stage_memory_peak_bytes': ('gauge', 'Largest Python/NumPy allocation high-water mark of a stage (tracemalloc)'),
+    'silicon_http_request_seconds': ('histogram', 'Wall time of API requests until the last response body chunk is sent'),
+    'silicon_http_requests_total': ('counter', 'API requests by route and status'),
+}
+
+
+class _Histogram:
+    """Cumulative bucket counts, sum and count of one labelled series."""
+
+    def __init__(self):
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters, gauges and histograms rendered in Prometheus text format.
+
+    Series are keyed by metric name and a tuple of (label, value) pairs.
+    Collectors registered with add_collector are called on every render
+    and return extra counter or gauge samples, so components that already
+    keep statistics (executor, caches) are exported without double
+    bookkeeping.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[tuple[str, tuple], float] = {}
+        self._gauges: dict[tuple[str, tuple], float] = {}
+        self._histograms: dict[tuple[str, tuple], _Histogram] = {}
+        self._collectors: list[Callable[[], Iterator[tuple[str, str, str, dict, float]]]] = []
+
+    def inc(self, name: str, labels: dict, value: float = 1.0) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set_max(self, name: str, labels: dict, value: float) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = max(self._gauges.get(key, value), value)
+
+    def observe(self, name: str, labels: dict, value: float) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram()
+            histogram.observe(value)
+
+    def add_collector(self, collector: Callable[[], Iterator[tuple[str, str, str, dict, float]]]) -> None:
+        """Register collector() -> iterable of (name, kind, help, labels, value) samples, kind 'counter' or 'gauge'"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        """Every series in the Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: (list(h.buckets), h.sum, h.count) for key, h in self._histograms.items()}
+            collectors = list(self._collectors)
+
+        series: dict[str, list[str]] = {}
+        for (name, labels), value in sorted(counters.items()) + sorted(gauges.items()):
+            series.setdefault(name, []).append(f"{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+            lines = series.setdefault(name, [])
+            for bound, bucket in zip(DURATION_BUCKETS, buckets):
+                lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {bucket}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+
+        kinds = {name: kind for name, (kind, _) in METRICS.items()}
+        helps = {name: text for name, (_, text) in METRICS.items()}
+        for collector in collectors:
+            for name, kind, text, labels, value in collector():
+                kinds.setdefault(name, kind)
+                helps.setdefault(name, text)
+                series.setdefault(name, []).append(f"{name}{_labels(tuple(sorted(labels.items())))} {_number(value)}")
+
+        out = []
+        for name in sorted(series):
+            out.append(f"# HELP {name} {helps.get(name, name)}")
+            out.append(f"# TYPE {name} {kinds.get(name, 'untyped')}")
+            out.extend(series[name])
+        return "\n".join(out) + "\n"
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+@dataclass
+class Trace:
+    """Chrome trace events ("X" complete events) of one request, viewable in chrome://tracing or Perfetto."""
+    trace_id: str
+    name: str
+    start_ns: int = field(default_factory=time.perf_counter_ns)
+    events: list[dict] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, name: str, category: str, start_ns: int, end_ns: int, args: Optional[dict] = None) -> None:
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start_ns - self.start_ns) / 1000.0,
+            "dur": (end_ns - start_ns) / 1000.0,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self.events.append(event)
+
+    def to_chrome(self) -> dict:
+        with self._lock:
+            events = sorted(self.events, key=lambda event: event["ts"])
+        # thread names so the viewer labels worker threads
+        threads = {event["tid"] for event in events}
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": names.get(tid, str(tid))}}
+            for tid in sorted(threads)
+        ]
+        return {"traceEvents": metadata + events, "displayTimeUnit": "ms", "otherData": {"trace_id": self.trace_id, "name": self.name}}
+
+
+@dataclass
+class _OpenStage:
+    """Allocation bookkeeping of a stage that has not finished yet."""
+    start_bytes: int
+    peak_bytes: int
+
+
+registry = MetricsRegistry()
+
+# trace of the request being served, copied into worker threads with the context (see WorkExecutor.submit)
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("silicon_trace", default=None)
+# stages open in this context, innermost last, for nested memory high-water marks
+_open_stages: ContextVar[tuple[_OpenStage, ...]] = ContextVar("silicon_open_stages", default=())
+
+_memory_tracking = False
+_memory_lock = threading.Lock()
+
+_traces: OrderedDict[str, Trace] = OrderedDict()
+_traces_lock = threading.Lock()
+
+
+def memory_tracking_enabled() -> bool:
+    return _memory_tracking
+
+
+def set_memory_tracking(enabled: bool) -> None:
+    """
+    Turn tracemalloc-based memory high-water marks per stage on or off.
+
+    tracemalloc slows allocation-heavy code down noticeably, so it is off
+    unless SILICON_TRACE_MEMORY=1 or this is called. Peaks are process-wide:
+    stages running concurrently in other threads add to each other's marks.
+    """
+    global _memory_tracking
+    with _memory_lock:
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        _memory_tracking = enabled
+
+
+@contextmanager
+def stage(name: str, **args) -> Iterator[None]:
+    """
+    Time a pipeline stage and record it in the registry and the current trace.
+
+    Durations go to silicon_stage_seconds{stage=name}, failures to
+    silicon_stage_errors_total. With memory tracking on, the stage's
+    allocation high-water mark above what was allocated when it started
+    goes to silicon_stage_memory_peak_bytes (the largest seen). Stages
+    nest; an outer stage's mark includes its inner stages.
+
+    Args:
+        name: Stage label, dotted by component (e.g. "load.parse")
+        args: Extra fields attached to the trace event
+    """
+    tracking = _memory_tracking and tracemalloc.is_tracing()
+    open_stage = token = None
+    if tracking:
+        current, peak = tracemalloc.get_traced_memory()
+        # the peak is reset for this stage, fold it into the stages already open first
+        for outer in _open_stages.get():
+            outer.peak_bytes = max(outer.peak_bytes, peak)
+        tracemalloc.reset_peak()
+        open_stage = _OpenStage(current, current)
+        token = _open_stages.set(_open_stages.get() + (open_stage,))
+
+    start = time.perf_counter_ns()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        end = time.perf_counter_ns()
+        labels = {"stage": name}
+        registry.observe("silicon_stage_seconds", labels, (end - start) / 1e9)
+        if failed:
+            registry.inc("silicon_stage_errors_total", labels)
+
+        memory = None
+        if open_stage is not None:
+            _open_stages.reset(token)
+            if tracemalloc.is_tracing():
+                open_stage.peak_bytes = max(open_stage.peak_bytes, tracemalloc.get_traced_memory()[1])
+            memory = open_stage.peak_bytes - open_stage.start_bytes
+            outer = _open_stages.get()
+            if outer:
+                outer[-1].peak_bytes = max(outer[-1].peak_bytes, open_stage.peak_bytes)
+            registry.set_max("silicon_stage_memory_peak_bytes", labels, memory)
+
+        trace = _current_trace.get()
+        if trace is not None:
+            event_args = dict(args)
+            if memory is not None:
+                event_args["memory_peak_bytes"] = memory
+            if failed:
+                event_args["error"] = True
+            trace.add(name, "stage", start, end, event_args)
+
+
+# decorator form of stage() for whole functions
+def instrumented(name: str):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_trace(name: str) -> tuple[Trace, object]:
+    """
+    Start collecting stage events for the current request.
+
+    Returns:
+        Tuple of (trace, token), pass the token to finish_trace
+    """
+    trace = Trace(trace_id=uuid.uuid4().hex, name=name)
+    token = _current_trace.set(trace)
+    with _traces_lock:
+        _traces[trace.trace_id] = trace
+        while len(_traces) > MAX_TRACES:
+            _traces.popitem(last=False)
+    return trace, token
+
+
+# stops recording into the context's trace, work already handed to other threads keeps adding events
+def finish_trace(token) -> None:
+    _current_trace.reset(token)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def get_trace(trace_id: str) -> Optional[Trace]:
+    with _traces_lock:
+        return _traces.get(trace_id)
+
+
+set_memory_tracking(os.environ.get("SILICON_TRACE_MEMORY", "0") == "1")
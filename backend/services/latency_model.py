@@ -0,0 +1,206 @@
+from dataclasses import dataclass, field
+from typing import Optional
+import math
+import threading
+import onnx
+
+from services.boards import get_board
+from services.conv_geometry import WINDOW_OPS, GLOBAL_POOL_OPS, is_depthwise
+from services.cost_model import FREE_OPS, LayerCost
+from services.load_model import GraphIndex
+from services.quantize_model import DENSE_OPS, CONV_OPS
+
+
+@dataclass
+class LayerLatency:
+    """Estimated execution time of one layer on the target board."""
+    name: str
+    op_type: str
+    kernel: str          # kernel class, the key of cycles_per_mac and of calibration factors
+    cycles: float
+    latency_ms: float
+
+
+@dataclass
+class LatencyEstimate:
+    """Estimated latency and energy of one inference on the target board."""
+    board_name: str
+    precision: str                  # 'float' or 'int8'
+    clock_hz: int
+    total_cycles: float
+    latency_ms: float
+    energy_uj: float
+    layers: list[LayerLatency] = field(default_factory=list)
+    deadline_ms: Optional[float] = None
+    meets_deadline: Optional[bool] = None
+    calibration: dict[str, float] = field(default_factory=dict)  # factors applied, empty when uncalibrated
+
+
+# measured/estimated scale factors per (board, precision), then per kernel class ('*' for all others)
+_calibrations: dict[tuple[str, str], dict[str, float]] = {}
+_calibration_lock = threading.Lock()
+
+
+def get_calibration(board_name: str, quantized: bool = False) -> dict[str, float]:
+    with _calibration_lock:
+        return dict(_calibrations.get((board_name, _precision(quantized)), {}))
+
+
+def set_calibration(board_name: str, quantized: bool, factors: dict[str, float]) -> None:
+    for kernel, factor in factors.items():
+        if not math.isfinite(factor) or factor <= 0:
+            raise ValueError(f"Calibration factor for '{kernel}' must be positive, got {factor}")
+    with _calibration_lock:
+        _calibrations[(board_name, _precision(quantized))] = dict(factors)
+
+
+# drops stored calibrations, of one board or of all boards
+def reset_calibration(board_name: Optional[str] = None) -> None:
+    with _calibration_lock:
+        for key in [key for key in _calibrations if board_name is None or key[0] == board_name]:
+            del _calibrations[key]
+
+
+def _precision(quantized: bool) -> str:
+    return 'int8' if quantized else 'float'
+
+
+# which generated kernel runs a node
+def kernel_class(index: GraphIndex, node: onnx.NodeProto) -> str:
+    if node.op_type in FREE_OPS:
+        return 'view'
+    if node.op_type in DENSE_OPS:
+        return 'dense'
+    if node.op_type in CONV_OPS:
+        weight = index.weights.get(node.input[1])
+        group = next((attr.i for attr in node.attribute if attr.name == "group"), 1)
+        return 'depthwise' if weight is not None and is_depthwise(weight.shape, group) else 'conv'
+    if node.op_type in WINDOW_OPS | GLOBAL_POOL_OPS:
+        return 'pool'
+    return 'elementwise'
+
+
+# raw cycles of one layer: compute or SRAM traffic, whichever dominates, plus flash stalls for its constants
+def _layer_cycles(board: dict, precision: str, kernel: str, cost: LayerCost) -> float:
+    if kernel == 'view':
+        return 0.0
+    mac_cycles = board['cycles_per_mac'][precision].get(kernel, 0.0)
+    compute = (
+        cost.macs * mac_cycles
+        + (cost.flops - 2 * cost.macs) * board['cycles_per_flop']
+        + cost.transcendentals * board['cycles_per_transcendental']
+    )
+    sram_bytes = cost.bytes_read - cost.weight_bytes + cost.bytes_written
+    sram = sram_bytes * board['clock_hz'] / board['memory_bandwidth']
+    flash = math.ceil(cost.weight_bytes / board['flash_line_bytes']) * board['flash_wait_states']
+    return max(compute, sram) + flash + board['layer_overhead_cycles']
+
+
+def estimate_latency(
+    index: GraphIndex,
+    costs: list[LayerCost],
+    board_name: str,
+    quantized: bool = False,
+    deadline_ms: Optional[float] = None,
+    calibrated: bool = True
+) -> LatencyEstimate:
+    """
+    Estimate per-layer and total latency and the energy of one inference.
+
+    Cycles come from the board's per-kernel cycles_per_mac, per-flop and
+    per-transcendental costs, bounded below by SRAM bandwidth, plus flash
+    wait states for reading constants and a fixed per-layer overhead. Views
+    (Reshape/Flatten/...) are free. Energy is active power times latency.
+
+    Args:
+        index: Graph index the costs were computed from
+        costs: Per-node costs aligned with index.nodes (see cost_model.model_costs)
+        board_name: Target board in BOARD_CONSTRAINTS
+        quantized: Estimate the int8 code instead of the float code
+        deadline_ms: Latency budget to check the estimate against
+        calibrated: Apply the factors stored by set_calibration for this board
+
+    Returns:
+        LatencyEstimate with one LayerLatency per node
+    """
+    board = get_board(board_name)
+    precision = _precision(quantized)
+    factors = get_calibration(board_name, quantized) if calibrated else {}
+    clock_hz = board['clock_hz']
+
+    layers = []
+    for idx, (node, cost) in enumerate(zip(index.nodes, costs)):
+        kernel = kernel_class(index, node)
+        cycles = _layer_cycles(board, precision, kernel, cost) * factors.get(kernel, factors.get('*', 1.0))
+        layers.append(LayerLatency(
+            name=node.name or f"{node.op_type}_{idx}",
+            op_type=node.op_type,
+            kernel=kernel,
+            cycles=cycles,
+            latency_ms=cycles / clock_hz * 1000.0
+        ))
+
+    total_cycles = sum(layer.cycles for layer in layers)
+    latency_ms = total_cycles / clock_hz * 1000.0
+    return LatencyEstimate(
+        board_name=board_name,
+        precision=precision,
+        clock_hz=clock_hz,
+        total_cycles=total_cycles,
+        latency_ms=latency_ms,
+        energy_uj=board['active_power_mw'] * latency_ms,  # mW * ms = uJ
+        layers=layers,
+        deadline_ms=deadline_ms,
+        meets_deadline=None if deadline_ms is None else latency_ms <= deadline_ms,
+        calibration=factors
+    )
+
+
+def fit_calibration(
+    estimate: LatencyEstimate,
+    measured_layers: Optional[dict[str, float]] = None,
+    measured_total_ms: Optional[float] = None
+) -> dict[str, float]:
+    """
+    Scale factors that make an uncalibrated estimate match measured latencies.
+
+    Layers measured on the board give one factor per kernel class (measured
+    time over estimated time of the measured layers of that class). A
+    measured total gives a '*' factor for everything not covered by layer
+    measurements.
+
+    Args:
+        estimate: Estimate from estimate_latency(..., calibrated=False)
+        measured_layers: Layer name -> measured latency in ms
+        measured_total_ms: Measured latency of a whole inference in ms
+
+    Returns:
+        Kernel class -> factor, suitable for set_calibration
+    """
+    measured_layers = measured_layers or {}
+    if not measured_layers and measured_total_ms is None:
+        raise ValueError("Calibration needs measured layer latencies or a measured total latency")
+    by_name = {layer.name: layer for layer in estimate.layers}
+    unknown = sorted(set(measured_layers) - set(by_name))
+    if unknown:
+        raise ValueError(f"Unknown layers in measurements: {', '.join(unknown)}")
+
+    measured, estimated = {}, {}
+    for name, ms in measured_layers.items():
+        layer = by_name[name]
+        if layer.latency_ms <= 0:
+            continue
+        measured[layer.kernel] = measured.get(layer.kernel, 0.0) + ms
+        estimated[layer.kernel] = estimated.get(layer.kernel, 0.0) + layer.latency_ms
+    factors = {kernel: measured[kernel] / estimated[kernel] for kernel in measured}
+
+    if measured_total_ms is not None:
+        # the part of the total not explained by the classes calibrated above
+        covered = [layer for layer in estimate.layers if layer.kernel in factors]
+        rest_measured = measured_total_ms - sum(layer.latency_ms * factors[layer.kernel] for layer in covered)
+        rest_estimated = estimate.latency_ms - sum(layer.latency_ms for layer in covered)
+        if rest_estimated > 0:
+            if rest_measured <= 0:
+                raise ValueError("Measured total is smaller than the measured layers it contains")
+            factors['*'] = rest_measured / rest_estimated
+    return factors
@@ -1,9 +1,18 @@
 import onnx
 import numpy as np
-from typing import Optional
+from typing import Any, Optional
 from dataclasses import dataclass, field
+import hashlib
+import heapq
+import mmap
 import tempfile
 import os
+import sys
+from pathlib import Path
+
+# add services, so the module also runs as a script (python services/load_model.py)
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from services.instrumentation import instrumented
 
 # weight info class
 @dataclass
@@ -26,6 +35,48 @@ class LayerInfo:
     params: int = 0
 
 
+# indexed view of a model graph, built once and shared by profile and compile
+@dataclass
+class GraphIndex:
+    model: onnx.ModelProto
+    initializers: dict[str, onnx.TensorProto]          # name -> initializer
+    constants: dict[str, onnx.TensorProto]             # Constant node output -> value
+    weights: dict[str, WeightInfo]                     # name -> initializer metadata
+    producers: dict[str, int]                          # tensor -> index of the node writing it
+    consumers: dict[str, list[int]]                    # tensor -> indices of nodes reading it
+    order: list[int]                                   # node indices in topological order
+    shapes: dict[str, dict] = field(default_factory=dict)  # tensor -> inferred info (see get_tensor_info)
+    external_data: Optional["MappedExternalData"] = field(default=None, repr=False)  # backs EXTERNAL initializers
+    batch_size: int = 1                                # value used for dynamic dimensions in shapes
+    fused: dict[str, str] = field(default_factory=dict)  # layer output -> activation op applied in the same kernel
+    optimization: Optional[Any] = field(default=None, repr=False)  # OptimizationReport once optimize_graph ran
+    simplification: Optional[Any] = field(default=None, repr=False)  # SimplificationReport once simplify_graph ran
+
+    @property
+    def nodes(self):
+        return self.model.graph.node
+
+    def has_value(self, name: str) -> bool:
+        """Whether get_array can return the tensor's value (external data may not be loaded)"""
+        if name in self.constants:
+            return True
+        init = self.initializers.get(name)
+        if init is None:
+            return False
+        return init.data_location != onnx.TensorProto.EXTERNAL or self.external_data is not None
+
+    def get_array(self, name: str) -> Optional[np.ndarray]:
+        """Compile-time value of a tensor (initializer or Constant output), None if computed at runtime"""
+        if name in self.initializers:
+            init = self.initializers[name]
+            if self.external_data is not None and init.data_location == onnx.TensorProto.EXTERNAL:
+                return self.external_data.array(init)
+            return onnx.numpy_helper.to_array(init)
+        if name in self.constants:
+            return onnx.numpy_helper.to_array(self.constants[name])
+        return None
+
+
 # model info class
 @dataclass
 class ModelInfo:
@@ -38,6 +89,7 @@ class ModelInfo:
     model_version: int = 0
     weights: list[WeightInfo] = field(default_factory=list)
     total_parameters: int = 0
+    index: Optional[GraphIndex] = field(default=None, repr=False)
 
 
 ONNX_DTYPE_MAP = {
@@ -75,6 +127,160 @@ def get_tensor_info(tensor):
     }
 
 
+# runs ONNX shape inference and returns tensor name -> tensor info for every tensor in the graph
+@instrumented("load.shape_inference")
+def infer_tensor_shapes(model: onnx.ModelProto, batch_size: int = 1) -> dict[str, dict]:
+    """
+    Infer the shape and dtype of every tensor in the graph.
+
+    Shape inference runs on a lightweight copy of the graph: weight tensors are
+    declared by type and dims only, so external data is never touched. Dynamic
+    input dimensions (dim_param or unknown) are replaced with batch_size.
+
+    Args:
+        model: ONNX model proto (external data may or may not be loaded)
+        batch_size: Value used for dynamic input dimensions
+
+    Returns:
+        Dictionary of tensor name -> {'name', 'shape', 'dtype'} (see get_tensor_info)
+    """
+    graph = model.graph
+    initializer_names = {init.name for init in graph.initializer}
+
+    # graph inputs with dynamic dimensions pinned
+    inputs = []
+    for inp in graph.input:
+        if inp.name in initializer_names:
+            continue
+        info = get_tensor_info(inp)
+        shape = [d if isinstance(d, int) and d > 0 else batch_size for d in info['shape']]
+        inputs.append(onnx.helper.make_tensor_value_info(inp.name, inp.type.tensor_type.elem_type, shape))
+
+    # integer initializers feed Reshape/Slice etc. and are needed by value, weights only by shape
+    initializers = []
+    for init in graph.initializer:
+        is_external = init.data_location == onnx.TensorProto.EXTERNAL
+        if init.data_type == onnx.TensorProto.INT64 and not is_external:
+            initializers.append(init)
+        else:
+            inputs.append(onnx.helper.make_tensor_value_info(init.name, init.data_type, list(init.dims)))
+
+    outputs = [onnx.helper.make_tensor_value_info(out.name, out.type.tensor_type.elem_type, None) for out in graph.output]
+
+    stripped = onnx.helper.make_model(
+        onnx.helper.make_graph(list(graph.node), graph.name, inputs, outputs, initializer=initializers),
+        opset_imports=list(model.opset_import),
+        ir_version=model.ir_version
+    )
+    try:
+        inferred = onnx.shape_inference.infer_shapes(stripped, data_prop=True).graph
+    except Exception:
+        # fall back to whatever shapes the exporter recorded
+        inferred = stripped.graph
+        inferred.value_info.extend(graph.value_info)
+
+    shapes = {}
+    for value in list(inferred.input) + list(inferred.value_info) + list(inferred.output):
+        if value.type.tensor_type.HasField('shape'):
+            shapes[value.name] = get_tensor_info(value)
+    for init in graph.initializer:
+        shapes[init.name] = {
+            'name': init.name,
+            'shape': list(init.dims),
+            'dtype': ONNX_DTYPE_MAP.get(init.data_type, 'float32')
+        }
+    return shapes
+
+
+# topological node order, keeping graph order among ready nodes
+def _topological_order(nodes, producers: dict[str, int], consumers: dict[str, list[int]]) -> list[int]:
+    pending = [
+        len({producers[name] for name in node.input if name in producers})
+        for node in nodes
+    ]
+    ready = [i for i, count in enumerate(pending) if count == 0]
+    heapq.heapify(ready)
+    order = []
+    while ready:
+        idx = heapq.heappop(ready)
+        order.append(idx)
+        for succ in {c for name in nodes[idx].output for c in consumers.get(name, [])}:
+            pending[succ] -= 1
+            if pending[succ] == 0:
+                heapq.heappush(ready, succ)
+    if len(order) != len(nodes):
+        raise ValueError("Model graph contains a cycle")
+    return order
+
+
+# builds the graph index in a single pass over the graph
+@instrumented("load.index")
+def build_graph_index(model: onnx.ModelProto, batch_size: int = 1, external_data: Optional["MappedExternalData"] = None) -> GraphIndex:
+    graph = model.graph
+    initializers = {init.name: init for init in graph.initializer}
+    weights, _ = extract_weights(model)
+
+    producers = {}
+    consumers = {}
+    constants = {}
+    for i, node in enumerate(graph.node):
+        for name in node.input:
+            if name:
+                consumers.setdefault(name, []).append(i)
+        for name in node.output:
+            if name:
+                producers[name] = i
+        if node.op_type == 'Constant':
+            for attr in node.attribute:
+                if attr.name == 'value':
+                    constants[node.output[0]] = attr.t
+
+    return GraphIndex(
+        model=model,
+        initializers=initializers,
+        constants=constants,
+        weights={w.name: w for w in weights},
+        producers=producers,
+        consumers=consumers,
+        order=_topological_order(graph.node, producers, consumers),
+        shapes=infer_tensor_shapes(model, batch_size),
+        external_data=external_data,
+        batch_size=batch_size
+    )
+
+
+# content hash of a model's graph and weights
+@instrumented("load.fingerprint")
+def model_fingerprint(model: onnx.ModelProto, index: Optional[GraphIndex] = None) -> str:
+    """
+    Hash the graph structure and every weight byte of a model.
+
+    Nodes, graph inputs/outputs and opsets are hashed from their serialized
+    protos. Weights are hashed from raw_data when present, otherwise from the
+    decoded array buffer, so models with external data hash the same whether
+    or not the data has been loaded into the proto.
+    """
+    hasher = hashlib.blake2b(digest_size=32)
+    graph = model.graph
+    for opset in model.opset_import:
+        hasher.update(opset.SerializeToString())
+    for node in graph.node:
+        hasher.update(node.SerializeToString())
+    for value in list(graph.input) + list(graph.output):
+        hasher.update(value.SerializeToString())
+
+    for init in graph.initializer:
+        hasher.update(init.name.encode())
+        hasher.update(np.asarray(init.dims, dtype=np.int64).tobytes())
+        hasher.update(init.data_type.to_bytes(4, "little"))
+        if init.raw_data:
+            hasher.update(init.raw_data)
+        else:
+            data = index.get_array(init.name) if index is not None else onnx.numpy_helper.to_array(init)
+            hasher.update(memoryview(np.ascontiguousarray(data)).cast("B"))
+    return hasher.hexdigest()
+
+
 # extracts weights from model
 def extract_weights(model: onnx.ModelProto) -> tuple[list[WeightInfo], int]:
     weights = []
@@ -98,11 +304,11 @@ def extract_weights(model: onnx.ModelProto) -> tuple[list[WeightInfo], int]:
 
 
 # extracts layers from model graph with shape info from weights
-def extract_layers(model: onnx.ModelProto, weights: list[WeightInfo]) -> list[LayerInfo]:
+def extract_layers(model: onnx.ModelProto, weights: list[WeightInfo], weight_map: Optional[dict[str, WeightInfo]] = None) -> list[LayerInfo]:
     layers = []
     
     # Build a map of weight names to their info
-    weight_map = {w.name: w for w in weights}
+    weight_map = weight_map if weight_map is not None else {w.name: w for w in weights}
     
     for node in model.graph.node:
         input_shape = None
@@ -115,12 +321,15 @@ def extract_layers(model: onnx.ModelProto, weights: list[WeightInfo]) -> list[La
                 w = weight_map[inp_name]
                 params += w.size
                 
-                # For Gemm/MatMul (Dense layers): weight shape is [out_features, in_features]
-                if node.op_type in ['Gemm', 'MatMul'] and len(w.shape) == 2:
-                    input_shape = str(w.shape[1])   # in_features
-                    output_shape = str(w.shape[0])  # out_features
-                # For Conv: weight shape is [out_channels, in_channels, kH, kW]
-                elif node.op_type == 'Conv' and len(w.shape) == 4:
+                # For Gemm/MatMul (Dense layers): weight shape is [in_features, out_features],
+                # or [out_features, in_features] for Gemm with transB
+                if node.op_type in ['Gemm', 'MatMul'] and len(w.shape) == 2 and inp_name == node.input[1]:
+                    trans_b = node.op_type == 'Gemm' and any(a.name == 'transB' and a.i for a in node.attribute)
+                    in_features, out_features = (w.shape[1], w.shape[0]) if trans_b else (w.shape[0], w.shape[1])
+                    input_shape = str(in_features)
+                    output_shape = str(out_features)
+                # For Conv: weight shape is [out_channels, in_channels / group, kH, kW] (or [.., kL] in 1D)
+                elif node.op_type == 'Conv' and len(w.shape) in (3, 4) and inp_name == node.input[1]:
                     input_shape = str(w.shape[1])   # in_channels
                     output_shape = str(w.shape[0])  # out_channels
         
@@ -137,20 +346,22 @@ def extract_layers(model: onnx.ModelProto, weights: list[WeightInfo]) -> list[La
 
 
 # calls all extraction functions and returning one ModelInfo object
-def extract_model_info(model: onnx.ModelProto) -> ModelInfo:
+@instrumented("load.extract")
+def extract_model_info(model: onnx.ModelProto, index: Optional[GraphIndex] = None) -> ModelInfo:
     graph = model.graph
+    index = index if index is not None else build_graph_index(model)
     
     # exclude weights
-    initializer_names = {init.name for init in graph.initializer}
-    inputs = [get_tensor_info(inp) for inp in graph.input if inp.name not in initializer_names]
+    inputs = [get_tensor_info(inp) for inp in graph.input if inp.name not in index.initializers]
     outputs = [get_tensor_info(out) for out in graph.output]
     operators = list(set(node.op_type for node in graph.node))
     
-    # extract weights
-    weights, total_params = extract_weights(model)
+    # weights were already extracted while indexing
+    weights = list(index.weights.values())
+    total_params = sum(w.size for w in weights)
     
     # extract layers
-    layers = extract_layers(model, weights)
+    layers = extract_layers(model, weights, index.weights)
     
     # returns all the model info as a modelinfo object
     return ModelInfo(
@@ -162,7 +373,8 @@ def extract_model_info(model: onnx.ModelProto) -> ModelInfo:
         producer_name=model.producer_name or 'Unknown',
         model_version=model.model_version,
         weights=weights,
-        total_parameters=total_params
+        total_parameters=total_params,
+        index=index
     )
 
 # verifies onnx model
@@ -174,6 +386,7 @@ def verify_onnx_model(model_path: str) -> tuple[bool, Optional[str]]:
         return False, str(e)
 
 # verifies onnx model with .data file
+@instrumented("load.verify")
 def verify_onnx_with_data(onnx_bytes: bytes, data_bytes: bytes, data_filename: str) -> tuple[bool, Optional[onnx.ModelProto], Optional[str]]:
     try:
         # create temp directory
@@ -207,20 +420,159 @@ def verify_onnx_with_data(onnx_bytes: bytes, data_bytes: bytes, data_filename: s
             # now load model with external data
             model = onnx.load(onnx_path, load_external_data=True)
             
-            if not model.graph:
-                return False, None, "Model has no graph"
-            
-            if not model.graph.node:
-                return False, None, "Model graph has no nodes"
+            error = _check_graph(model)
+            if error:
+                return False, None, error
             
             return True, model, None
             
     except Exception as e:
         return False, None, str(e)
 
+
+def _check_graph(model: onnx.ModelProto) -> Optional[str]:
+    if not model.graph:
+        return "Model has no graph"
+    if not model.graph.node:
+        return "Model graph has no nodes"
+    return None
+
+
+# bytes a tensor occupies in raw (external data) form, computed from its header
+def tensor_nbytes(tensor: onnx.TensorProto) -> int:
+    itemsize = onnx.helper.tensor_dtype_to_np_dtype(tensor.data_type).itemsize
+    return int(np.prod(tensor.dims, dtype=np.int64)) * itemsize
+
+
+# checks that every external initializer fits inside a data file of data_size bytes
+def check_external_data(model: onnx.ModelProto, data_size: int) -> Optional[str]:
+    for init in model.graph.initializer:
+        if init.data_location != onnx.TensorProto.EXTERNAL:
+            continue
+        entries = {entry.key: entry.value for entry in init.external_data}
+        expected = tensor_nbytes(init)
+        offset = int(entries.get('offset', 0))
+        length = int(entries.get('length', expected))
+        if length != expected:
+            return f"Initializer '{init.name}' needs {expected} bytes but its external data declares {length}"
+        if offset + length > data_size:
+            return f"External data is too small for initializer '{init.name}' (needs {offset + length} bytes, got {data_size})"
+    return None
+
+
+# names of the external data files referenced by a model's initializers
+def external_data_locations(model: onnx.ModelProto) -> set[str]:
+    locations = set()
+    for init in model.graph.initializer:
+        if init.data_location == onnx.TensorProto.EXTERNAL:
+            locations.update(entry.value for entry in init.external_data if entry.key == 'location')
+    return locations
+
+
+class MappedExternalData:
+    """
+    Read-only memory map of an external data file.
+
+    Initializer values are NumPy views into the mapping, located by the
+    offset entry of their TensorProto, so weights are paged in from disk on
+    first access instead of being copied into the protobuf.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self._map = None
+        if self.size:
+            with open(path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def array(self, tensor: onnx.TensorProto) -> np.ndarray:
+        dtype = onnx.helper.tensor_dtype_to_np_dtype(tensor.data_type)
+        count = int(np.prod(tensor.dims, dtype=np.int64))
+        if count == 0 or self._map is None:
+            return np.zeros(tuple(tensor.dims), dtype=dtype)
+        entries = {entry.key: entry.value for entry in tensor.external_data}
+        offset = int(entries.get('offset', 0))
+        return np.frombuffer(self._map, dtype=dtype, count=count, offset=offset).reshape(tuple(tensor.dims))
+
+
+# loads a model saved on disk, memory mapping its external data instead of reading it
+@instrumented("load.parse")
+def load_onnx_mapped(onnx_path: str, data_path: Optional[str] = None) -> tuple[bool, Optional[onnx.ModelProto], Optional[MappedExternalData], Optional[str]]:
+    """
+    Load a model whose weights stay in a memory-mapped external data file.
+
+    The graph is parsed with load_external_data=False and every external
+    initializer is checked against the size of the data file. Weight values
+    are then read through GraphIndex.get_array as views into the mapping.
+
+    Args:
+        onnx_path: Path of the .onnx file
+        data_path: Path of the external data file, if the model has one
+
+    Returns:
+        Tuple of (is_valid, model, mapped external data or None, error_message)
+    """
+    try:
+        model = onnx.load(onnx_path, load_external_data=False)
+    except Exception as e:
+        return False, None, None, str(e)
+
+    error = _check_graph(model)
+    if error:
+        return False, None, None, error
+
+    locations = external_data_locations(model)
+    if not locations:
+        return True, model, None, None
+    if len(locations) > 1:
+        return False, None, None, f"Model references {len(locations)} external data files, only one is supported"
+    if not data_path:
+        return False, None, None, "Data file is required for models with external data"
+
+    try:
+        external_data = MappedExternalData(data_path)
+    except OSError as e:
+        return False, None, None, f"Failed to map data file: {e}"
+    error = check_external_data(model, external_data.size)
+    if error:
+        return False, None, None, error
+    return True, model, external_data, None
+
+
+# parses only the graph and tensor headers, external weight data is never read
+@instrumented("load.metadata")
+def load_onnx_metadata(onnx_bytes: bytes, data_size: Optional[int] = None) -> tuple[bool, Optional[onnx.ModelProto], Optional[str]]:
+    """
+    Load a model for analyses that need shapes and dtypes but not weight values.
+
+    Initializers stored in external data keep their dims, data type and
+    external_data entries but no payload, so parsing costs about the size of
+    the .onnx file. When the size of the .data file is known, the declared
+    offsets and lengths are checked against it without reading the file.
+
+    Args:
+        onnx_bytes: Serialized .onnx file
+        data_size: Size of the external data file in bytes, if one was provided
+
+    Returns:
+        Tuple of (is_valid, model, error_message)
+    """
+    try:
+        model = onnx.load_model_from_string(onnx_bytes)
+    except Exception as e:
+        return False, None, str(e)
+
+    error = _check_graph(model)
+    if error is None and data_size is not None:
+        error = check_external_data(model, data_size)
+    if error:
+        return False, None, error
+    return True, model, None
+
 # test function
 def main():
-    model_path = "../test_models/model.onnx"
+    model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test_models", "model.onnx")
     is_valid, error = verify_onnx_model(model_path)
     
     if is_valid:
@@ -0,0 +1,271 @@
+from dataclasses import dataclass, field
+from typing import Optional
+import math
+import onnx
+
+from services.conv_geometry import conv_patch_size
+from services.load_model import GraphIndex
+
+
+# ops whose output is a view of their first input (no data is moved)
+ALIAS_OPS = {"Flatten", "Reshape", "Dropout", "Identity", "Squeeze", "Unsqueeze"}
+
+# elementwise ops whose output may overwrite an input that dies at that node
+INPLACE_OPS = {"Relu", "Sigmoid", "Tanh", "Softmax", "LeakyRelu", "Clip", "Add", "Sub", "Mul"}
+
+# ops that only produce compile-time constants
+CONSTANT_OPS = {"Constant"}
+
+# byte alignment of every buffer inside the arena
+ARENA_ALIGNMENT = 16
+
+# Byte width per data type
+DTYPE_BYTES = {
+    'float32': 4,
+    'float16': 2,
+    'float64': 8,
+    'int64': 8,
+    'int32': 4,
+    'int16': 2,
+    'int8': 1,
+    'uint8': 1,
+    'bool': 1,
+}
+
+
+@dataclass
+class BufferAllocation:
+    """One region of memory shared by tensors that alias or are computed in place."""
+    name: str                       # first tensor assigned to the buffer
+    tensors: list[str]
+    size: int                       # bytes, rounded up to ARENA_ALIGNMENT
+    start: int                      # first step the buffer is live
+    end: int                        # last step the buffer is live
+    offset: int = 0                 # byte offset inside the arena
+    external: Optional[str] = None  # graph input/output name when the caller owns the memory
+
+
+@dataclass
+class MemoryPlan:
+    """Static arena layout for one execution order of the graph."""
+    arena_size: int
+    peak_bytes: int
+    order: list[int]                         # node indices in execution order
+    buffers: list[BufferAllocation]
+    tensor_buffers: dict[str, BufferAllocation] = field(default_factory=dict)
+    live_bytes: list[int] = field(default_factory=list)   # arena bytes live at each step
+    alignment: int = ARENA_ALIGNMENT
+    scratch_buffers: dict[int, BufferAllocation] = field(default_factory=dict)  # node index -> kernel scratch
+
+    def offset_of(self, tensor: str) -> int:
+        return self.tensor_buffers[tensor].offset
+
+
+def _align(size: int, alignment: int = ARENA_ALIGNMENT) -> int:
+    return (size + alignment - 1) // alignment * alignment
+
+
+# names of all tensors whose values are known at compile time
+def constant_tensor_names(index: GraphIndex) -> set[str]:
+    return set(index.initializers) | set(index.constants)
+
+
+# activation (runtime) inputs of a node, skipping weights and shape operands
+def data_inputs(node: onnx.NodeProto, constants: set[str]) -> list[str]:
+    names = node.input[:1] if node.op_type in ALIAS_OPS else node.input
+    return [name for name in names if name and name not in constants]
+
+
+# size in bytes of a tensor from its inferred shape, dynamic dims count as 1
+def tensor_bytes(info: Optional[dict], bytes_per_element: Optional[int] = None) -> int:
+    if info is None:
+        return 0
+    elements = math.prod(d if isinstance(d, int) and d > 0 else 1 for d in info['shape'])
+    return elements * (bytes_per_element or DTYPE_BYTES.get(info['dtype'], 4))
+
+
+# temporary buffers the generated kernels need: the receptive-field patch of a direct Conv
+def kernel_scratch(index: GraphIndex, bytes_per_element: Optional[int] = None) -> dict[int, int]:
+    scratch = {}
+    for idx, node in enumerate(index.nodes):
+        if node.op_type != "Conv" or len(node.input) < 2 or node.input[1] not in index.weights:
+            continue
+        group = next((attr.i for attr in node.attribute if attr.name == "group"), 1)
+        patch = conv_patch_size(index.weights[node.input[1]].shape, group)
+        if patch:
+            scratch[idx] = patch * (bytes_per_element or 4)
+    return scratch
+
+
+# first-fit placement of a buffer below/between already placed buffers that overlap in time
+def _place(buffer: BufferAllocation, placed: list[BufferAllocation]) -> int:
+    start = max(buffer.start, 0)
+    overlapping = [other for other in placed if max(other.start, 0) <= buffer.end and start <= other.end]
+    offset = 0
+    for other in sorted(overlapping, key=lambda b: b.offset):
+        if offset + buffer.size <= other.offset:
+            break
+        offset = max(offset, other.offset + other.size)
+    return offset
+
+
+def plan_memory(
+    index: GraphIndex,
+    order: Optional[list[int]] = None,
+    bytes_per_element: Optional[int] = None,
+    scratch: Optional[dict[int, int]] = None,
+    external_io: bool = True
+) -> MemoryPlan:
+    """
+    Compute tensor lifetimes and pack them into one statically sized arena.
+
+    Tensors produced by view ops (Reshape, Flatten, ...) share their input's
+    buffer, and elementwise ops write over an input that is not read again.
+    The remaining buffers are placed greedy-by-size: largest first, each at
+    the lowest aligned offset that does not collide with a buffer whose
+    lifetime overlaps. Graph inputs and outputs live in caller-owned memory
+    and are not part of the arena unless external_io is False (e.g. int8
+    code that converts float I/O into arena buffers).
+
+    Args:
+        index: Graph index of the model (provides shapes and use lists)
+        order: Node indices in execution order (topological order if omitted)
+        bytes_per_element: Override element width (e.g. 1 for int8)
+        scratch: Node index -> bytes of temporary scratch the kernel needs (kernel_scratch if omitted)
+        external_io: Keep graph inputs and outputs out of the arena
+
+    Returns:
+        MemoryPlan with per-buffer offsets, arena size and per-step live bytes
+    """
+    graph = index.model.graph
+    nodes = index.nodes
+    shapes = index.shapes
+    order = list(order) if order is not None else list(index.order)
+    scratch = kernel_scratch(index, bytes_per_element) if scratch is None else scratch
+    constants = constant_tensor_names(index)
+
+    graph_inputs = {inp.name for inp in graph.input if inp.name not in constants}
+    graph_outputs = {out.name for out in graph.output}
+    last_step = len(order)
+
+    # definition and last use step of every activation tensor
+    defined = {name: -1 for name in graph_inputs}
+    last_use = {name: -1 for name in graph_inputs}
+    for step, idx in enumerate(order):
+        node = nodes[idx]
+        if node.op_type in CONSTANT_OPS:
+            continue
+        for name in data_inputs(node, constants):
+            last_use[name] = step
+        for k, name in enumerate(node.output):
+            if name and (k == 0 or name in graph_outputs or name in index.consumers):
+                defined[name] = step
+                last_use.setdefault(name, step)
+    for name in graph_outputs:
+        last_use[name] = last_step
+
+    # union tensors into buffers (aliases and in-place ops)
+    parent = {name: name for name in defined}
+
+    def find(name: str) -> str:
+        while parent[name] != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+
+    members = {name: [name] for name in defined}
+    external = {name: name for name in defined if name in graph_inputs or name in graph_outputs} if external_io else {}
+    group_end = dict(last_use)
+
+    def union(keep: str, merge: str) -> None:
+        keep, merge = find(keep), find(merge)
+        parent[merge] = keep
+        members[keep].extend(members.pop(merge))
+        group_end[keep] = max(group_end[keep], group_end[merge])
+        if merge in external:
+            external[keep] = external.pop(merge)
+
+    for step, idx in enumerate(order):
+        node = nodes[idx]
+        if node.op_type in CONSTANT_OPS or not node.output or node.output[0] not in defined:
+            continue
+        out = node.output[0]
+        inputs = data_inputs(node, constants)
+        out_bytes = tensor_bytes(shapes.get(out), bytes_per_element)
+
+        if node.op_type in ALIAS_OPS and inputs:
+            src = find(inputs[0])
+            # a view between two caller-owned buffers has to be materialized as a copy
+            if not (src in external and out in external):
+                union(src, out)
+
+        elif node.op_type in INPLACE_OPS:
+            for name in inputs:
+                src = find(name)
+                if (group_end[src] == step
+                        and tensor_bytes(shapes.get(name), bytes_per_element) == out_bytes
+                        and external.get(src) not in graph_inputs
+                        and not (src in external and out in external)):
+                    if out in external:
+                        union(out, src)
+                    else:
+                        union(src, out)
+                    break
+
+    # one allocation per buffer
+    buffers = []
+    tensor_buffers = {}
+    for root, names in members.items():
+        size = max(tensor_bytes(shapes.get(name), bytes_per_element) for name in names)
+        buffer = BufferAllocation(
+            name=root,
+            tensors=names,
+            size=_align(size),
+            start=min(defined[name] for name in names),
+            end=max(last_use[name] for name in names),
+            external=external.get(root)
+        )
+        buffers.append(buffer)
+        for name in names:
+            tensor_buffers[name] = buffer
+
+    # kernel scratch lives only for the step of its node
+    scratch_buffers = {}
+    for step, idx in enumerate(order):
+        if scratch.get(idx):
+            scratch_buffers[idx] = BufferAllocation(
+                name=f"scratch_{idx}",
+                tensors=[],
+                size=_align(scratch[idx]),
+                start=step,
+                end=step
+            )
+            buffers.append(scratch_buffers[idx])
+
+    # greedy-by-size offset assignment
+    placed = []
+    for buffer in sorted((b for b in buffers if b.external is None), key=lambda b: (-b.size, b.start)):
+        buffer.offset = _place(buffer, placed)
+        placed.append(buffer)
+    arena_size = max((b.offset + b.size for b in placed), default=0)
+
+    # sweep over lifetime boundaries for the bytes live at each step
+    delta = [0] * (len(order) + 2)
+    for buffer in placed:
+        delta[max(buffer.start, 0)] += buffer.size
+        delta[buffer.end + 1] -= buffer.size
+    live_bytes = []
+    running = 0
+    for step in range(len(order)):
+        running += delta[step]
+        live_bytes.append(running)
+
+    return MemoryPlan(
+        arena_size=arena_size,
+        peak_bytes=max(live_bytes, default=0),
+        order=order,
+        buffers=buffers,
+        tensor_buffers=tensor_buffers,
+        live_bytes=live_bytes,
+        scratch_buffers=scratch_buffers
+    )
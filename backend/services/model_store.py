@@ -0,0 +1,139 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+import shutil
+import threading
+import time
+import uuid
+import onnx
+
+from services.load_model import GraphIndex, model_fingerprint
+from services.optimize_graph import optimize_graph
+from services.quantize_model import QuantizedModel
+
+
+@dataclass
+class StoredModel:
+    """A parsed model held by the store together with everything derived from it."""
+    model_id: str
+    model: onnx.ModelProto
+    info: dict                       # model info as returned to the client
+    index: Optional[GraphIndex]
+    nbytes: int                      # approximate memory held by the entry
+    workdir: Optional[str] = None    # directory holding the uploaded files, removed with the entry
+    # int8 parameters from the latest calibration, keyed by whether the optimized graph was calibrated
+    quantization: dict[bool, QuantizedModel] = field(default_factory=dict)
+    created: float = field(default_factory=time.time)
+    _hash: Optional[str] = None      # content hash, computed on first use
+    _optimized: Optional[GraphIndex] = field(default=None, repr=False)  # optimize_graph result, computed on first use
+    _optimize_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def fingerprint(self) -> str:
+        if self._hash is None:
+            self._hash = model_fingerprint(self.model, self.index)
+        return self._hash
+
+    def graph(self, optimize: bool = True) -> Optional[GraphIndex]:
+        """Index to compile from, the optimized graph unless optimize is False"""
+        if not optimize or self.index is None:
+            return self.index
+        # worker threads asking at the same time share one optimize_graph run
+        with self._optimize_lock:
+            if self._optimized is None:
+                self._optimized = optimize_graph(self.index)
+            return self._optimized
+
+    def close(self) -> None:
+        # mapped weights stay readable until the last view is dropped, unlinking is safe
+        if self.workdir is not None:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+# approximate size of a parsed model: the protobuf plus any memory-mapped weight file
+def _model_nbytes(model: onnx.ModelProto, index: Optional[GraphIndex]) -> int:
+    size = model.ByteSize()
+    if index is not None and index.external_data is not None:
+        size += index.external_data.size
+    return size
+
+
+class ModelStore:
+    """
+    Thread-safe store of uploaded models addressed by an opaque model ID.
+
+    Entries are evicted least recently used first once either the entry count
+    or the total byte budget is exceeded. Clients that do not send an ID get
+    the stored model only while it is the only one, so concurrent clients
+    never pick up each other's uploads. Evicted entries delete their upload
+    directory.
+    """
+
+    def __init__(self, max_models: int = 8, max_bytes: int = 1024 * 1024 * 1024):
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, StoredModel] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def add(self, model: onnx.ModelProto, info: dict, index: Optional[GraphIndex] = None, workdir: Optional[str] = None) -> StoredModel:
+        entry = StoredModel(
+            model_id=uuid.uuid4().hex,
+            model=model,
+            info=info,
+            index=index,
+            nbytes=_model_nbytes(model, index),
+            workdir=workdir
+        )
+        evicted = []
+        with self._lock:
+            self._entries[entry.model_id] = entry
+            self._bytes += entry.nbytes
+            # never evict the entry that was just added
+            while len(self._entries) > 1 and (len(self._entries) > self.max_models or self._bytes > self.max_bytes):
+                evicted.append(self._evict_oldest())
+        for old in evicted:
+            old.close()
+        return entry
+
+    def get(self, model_id: Optional[str] = None) -> Optional[StoredModel]:
+        """Look up a model by ID, or the only stored model when no ID is given (None if there are several)"""
+        with self._lock:
+            key = model_id
+            if key is None and len(self._entries) == 1:
+                key = next(iter(self._entries))
+            entry = self._entries.get(key) if key is not None else None
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def remove(self, model_id: str) -> bool:
+        with self._lock:
+            entry = self._entries.pop(model_id, None)
+            if entry is None:
+                return False
+            self._bytes -= entry.nbytes
+        entry.close()
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+            self._bytes = 0
+        for entry in entries:
+            entry.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "models": len(self._entries),
+                "bytes": self._bytes,
+                "max_models": self.max_models,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _evict_oldest(self) -> StoredModel:
+        model_id, entry = self._entries.popitem(last=False)
+        self._bytes -= entry.nbytes
+        return entry
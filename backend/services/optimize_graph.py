@@ -0,0 +1,441 @@
+from dataclasses import dataclass, field
+from typing import Optional
+import numpy as np
+import onnx
+
+from services.load_model import build_graph_index, tensor_nbytes, GraphIndex
+from services.quantize_model import dense_parameters
+from services.reference import REFERENCE_OPS
+from services.instrumentation import instrumented
+
+
+# inference-time no-ops whose output can be replaced by their input
+REMOVABLE_OPS = {"Identity", "Dropout"}
+
+# ops evaluated at compile time when every input is a constant (shape arithmetic and its consumers)
+FOLDABLE_OPS = {
+    "Shape", "Gather", "Concat", "Cast", "Unsqueeze", "Squeeze", "Reshape", "Flatten",
+    "Add", "Sub", "Mul", "Div",
+}
+
+# layers that BatchNormalization can be folded into, and whose kernel can apply an activation
+FOLD_TARGET_OPS = {"Gemm", "MatMul", "Conv"}
+
+# activations fused into the preceding layer's kernel
+FUSABLE_ACTIVATIONS = {"Relu", "Sigmoid", "Tanh"}
+
+
+@dataclass
+class OptimizationReport:
+    """What optimize_graph changed, node names refer to the original graph."""
+    nodes_before: int
+    nodes_after: int = 0
+    removed: list[str] = field(default_factory=list)           # Identity/Dropout nodes bypassed
+    folded_constants: list[str] = field(default_factory=list)  # nodes replaced by initializers
+    folded_batchnorms: list[str] = field(default_factory=list) # BN nodes merged into the previous layer
+    fused: list[str] = field(default_factory=list)             # "layer+activation" pairs
+    dead_nodes: list[str] = field(default_factory=list)        # nodes left without a path to a graph output
+
+    def to_dict(self) -> dict:
+        return {
+            "nodes_before": self.nodes_before,
+            "nodes_after": self.nodes_after,
+            "removed": self.removed,
+            "folded_constants": self.folded_constants,
+            "folded_batchnorms": self.folded_batchnorms,
+            "fused": self.fused,
+            "dead_nodes": self.dead_nodes,
+        }
+
+
+@dataclass
+class SimplificationReport:
+    """What simplify_graph removed from a model as uploaded, node names refer to the original graph."""
+    nodes_before: int
+    nodes_after: int = 0
+    removed: list[str] = field(default_factory=list)               # Identity/Dropout nodes bypassed
+    folded_constants: list[str] = field(default_factory=list)      # constant subexpressions replaced by initializers
+    dead_nodes: list[str] = field(default_factory=list)            # nodes whose outputs reach no graph output
+    dropped_initializers: list[str] = field(default_factory=list)  # initializers nothing reads any more
+    dropped_bytes: int = 0                                         # size of the dropped initializers
+
+    def to_dict(self) -> dict:
+        return {
+            "nodes_before": self.nodes_before,
+            "nodes_after": self.nodes_after,
+            "removed": self.removed,
+            "folded_constants": self.folded_constants,
+            "dead_nodes": self.dead_nodes,
+            "dropped_initializers": self.dropped_initializers,
+            "dropped_bytes": self.dropped_bytes,
+        }
+
+
+def _attrs(node: onnx.NodeProto) -> dict:
+    return {attr.name: onnx.helper.get_attribute_value(attr) for attr in node.attribute}
+
+
+def _layer_name(node: onnx.NodeProto) -> str:
+    return node.name or f"{node.op_type}({node.output[0]})"
+
+
+class _GraphRewriter:
+    """Copy of a graph's nodes with reader/writer maps kept current under renames and removals."""
+
+    def __init__(self, index: GraphIndex):
+        self.index = index
+        graph = index.model.graph
+        self.nodes: list[Optional[onnx.NodeProto]] = []
+        for node in graph.node:
+            copy = onnx.NodeProto()
+            copy.CopyFrom(node)
+            self.nodes.append(copy)
+        self.order = list(index.order)
+        self.graph_inputs = {inp.name for inp in graph.input if inp.name not in index.initializers}
+        self.graph_outputs = {out.name for out in graph.output}
+        self.new_initializers: dict[str, np.ndarray] = {}
+        self.fused: dict[str, str] = {}
+        self.writer = dict(index.producers)
+        self.readers = {name: set(readers) for name, readers in index.consumers.items()}
+        self._names = set(self.writer) | set(index.initializers)
+
+    def live(self) -> list[tuple[int, onnx.NodeProto]]:
+        """(position, node) of the remaining nodes in topological order"""
+        return [(idx, self.nodes[idx]) for idx in self.order if self.nodes[idx] is not None]
+
+    def producer(self, name: str) -> Optional[int]:
+        return self.writer.get(name)
+
+    def consumers(self, name: str) -> set[int]:
+        return self.readers.get(name, set())
+
+    def has_value(self, name: str) -> bool:
+        return name in self.new_initializers or self.index.has_value(name)
+
+    def get_array(self, name: str) -> Optional[np.ndarray]:
+        """Value of a constant, None if it is computed at runtime or its data is not loaded"""
+        if name in self.new_initializers:
+            return self.new_initializers[name]
+        return self.index.get_array(name) if self.index.has_value(name) else None
+
+    def is_constant(self, name: str) -> bool:
+        return (not name) or name in self.new_initializers or name in self.index.initializers or name in self.index.constants
+
+    def rename(self, old: str, new: str) -> None:
+        """Point every reader and the writer of tensor old at tensor new"""
+        for idx in self.readers.pop(old, set()):
+            node = self.nodes[idx]
+            for k, name in enumerate(node.input):
+                if name == old:
+                    node.input[k] = new
+            self.readers.setdefault(new, set()).add(idx)
+        if old in self.writer:
+            idx = self.writer.pop(old)
+            node = self.nodes[idx]
+            for k, name in enumerate(node.output):
+                if name == old:
+                    node.output[k] = new
+            self.writer[new] = idx
+        if old in self.fused:
+            self.fused[new] = self.fused.pop(old)
+
+    def remove(self, idx: int) -> None:
+        node = self.nodes[idx]
+        for name in node.input:
+            self.readers.get(name, set()).discard(idx)
+        for name in node.output:
+            if self.writer.get(name) == idx:
+                del self.writer[name]
+        self.nodes[idx] = None
+
+    def add_initializer(self, hint: str, value: np.ndarray) -> str:
+        name, k = hint, 1
+        while name in self._names:
+            name, k = f"{hint}_{k}", k + 1
+        self._names.add(name)
+        self.new_initializers[name] = value
+        return name
+
+
+# Identity/Dropout: readers of the output read the input instead
+def _remove_noops(rw: _GraphRewriter, report: OptimizationReport) -> None:
+    for idx, node in rw.live():
+        if node.op_type not in REMOVABLE_OPS:
+            continue
+        # Dropout's optional mask output must stay available
+        if len(node.output) > 1 and node.output[1] and (rw.consumers(node.output[1]) or node.output[1] in rw.graph_outputs):
+            continue
+        src, dst = node.input[0], node.output[0]
+        if dst in rw.graph_outputs:
+            # the output name is part of the model's interface, rename the producer instead
+            if rw.producer(src) is None or src in rw.graph_outputs:
+                continue
+            rw.remove(idx)
+            rw.rename(src, dst)
+        else:
+            rw.remove(idx)
+            rw.rename(dst, src)
+        report.removed.append(_layer_name(node))
+
+
+# static shape of a tensor, None if any dimension is unknown
+def _static_shape(rw: _GraphRewriter, name: str) -> Optional[list[int]]:
+    info = rw.index.shapes.get(name)
+    if info is None or not all(isinstance(d, int) and d >= 0 for d in info['shape']):
+        return None
+    return list(info['shape'])
+
+
+# Shape of statically shaped tensors (with fold_shapes) and every op whose inputs are all constants
+def _fold_constants(rw: _GraphRewriter, report: OptimizationReport, fold_shapes: bool = True) -> None:
+    opsets = {op.domain: op.version for op in rw.index.model.opset_import}
+    opset = opsets.get("", opsets.get("ai.onnx", 13))
+    for idx, node in rw.live():
+        # graph outputs stay computed so the compiled interface does not change
+        if node.op_type not in FOLDABLE_OPS or len(node.output) != 1 or node.output[0] in rw.graph_outputs:
+            continue
+        if node.op_type == "Shape":
+            if not fold_shapes:
+                continue
+            shape = _static_shape(rw, node.input[0])
+            if shape is None:
+                continue
+            attrs = _attrs(node)
+            value = np.array(shape, dtype=np.int64)[attrs.get("start", 0):attrs.get("end")]
+        else:
+            if not all(not name or (rw.is_constant(name) and rw.has_value(name)) for name in node.input):
+                continue
+            inputs = [rw.get_array(name) if name else None for name in node.input]
+            value = np.asarray(REFERENCE_OPS[node.op_type](node, inputs, _attrs(node), opset))
+
+        # the tensor keeps its name, it is now an initializer instead of a node output
+        rw.remove(idx)
+        rw.new_initializers[node.output[0]] = value
+        report.folded_constants.append(_layer_name(node))
+
+
+# nodes none of whose outputs is read on the way to a graph output, walked back from the outputs
+def _remove_dead_nodes(rw: _GraphRewriter, report: OptimizationReport) -> None:
+    needed = set(rw.graph_outputs)
+    dead = []
+    for idx, node in reversed(rw.live()):
+        if any(name in needed for name in node.output if name):
+            needed.update(name for name in node.input if name)
+        else:
+            rw.remove(idx)
+            dead.append(_layer_name(node))
+    report.dead_nodes.extend(reversed(dead))
+
+
+# the node that is the only reader of a tensor, None if the tensor is shared or part of the interface
+def _single_consumer(rw: _GraphRewriter, name: str) -> Optional[int]:
+    if name in rw.graph_outputs:
+        return None
+    readers = rw.consumers(name)
+    return next(iter(readers)) if len(readers) == 1 else None
+
+
+# Gemm/MatMul of a 2D input by a 2D weight without transA, the dense layers dense_parameters can pack
+def _is_dense_foldable(rw: _GraphRewriter, node: onnx.NodeProto) -> bool:
+    x_shape = rw.index.shapes.get(node.input[0])
+    w_shape = rw.index.shapes.get(node.input[1])
+    if x_shape is None or w_shape is None or _attrs(node).get("transA", 0):
+        return False
+    return len(x_shape['shape']) == 2 and len(w_shape['shape']) == 2
+
+
+# weights of a 2D Gemm/MatMul as float64 ([out, in] weight, bias), None if it cannot be folded
+def _dense_weights(rw: _GraphRewriter, node: onnx.NodeProto) -> Optional[tuple[np.ndarray, np.ndarray]]:
+    if not _is_dense_foldable(rw, node):
+        return None
+    if not all(rw.has_value(name) for name in node.input[1:] if name):
+        return None
+    try:
+        params = dense_parameters(rw, node)
+    except ValueError:
+        return None
+    bias = params.bias if params.bias is not None else np.zeros(params.weight.shape[0])
+    return np.asarray(params.weight, dtype=np.float64), np.asarray(bias, dtype=np.float64)
+
+
+# weights of a Conv as float64 ([out, in/group, kh, kw] weight, bias), None if they are not loaded
+def _conv_weights(rw: _GraphRewriter, node: onnx.NodeProto) -> Optional[tuple[np.ndarray, np.ndarray]]:
+    if not all(rw.has_value(name) for name in node.input[1:] if name):
+        return None
+    weight = np.asarray(rw.get_array(node.input[1]), dtype=np.float64)
+    has_bias = len(node.input) > 2 and node.input[2]
+    bias = np.asarray(rw.get_array(node.input[2]), dtype=np.float64) if has_bias else np.zeros(weight.shape[0])
+    return weight, bias
+
+
+# BatchNormalization after Gemm/MatMul/Conv becomes a per-channel scale and shift of its weights
+def _fold_batchnorms(rw: _GraphRewriter, report: OptimizationReport) -> None:
+    for bn_idx, bn in rw.live():
+        if bn.op_type != "BatchNormalization" or len(bn.output) != 1:
+            continue
+        layer_idx = rw.producer(bn.input[0])
+        if layer_idx is None or _single_consumer(rw, bn.input[0]) != bn_idx:
+            continue
+        layer = rw.nodes[layer_idx]
+        params = list(bn.input[1:5]) + [name for name in layer.input[1:] if name]
+        if layer.op_type not in FOLD_TARGET_OPS or not all(rw.is_constant(name) for name in params):
+            continue
+
+        if all(rw.has_value(name) for name in params):
+            weights = _conv_weights(rw, layer) if layer.op_type == "Conv" else _dense_weights(rw, layer)
+            if weights is None:
+                continue
+            gamma, beta, mean, var = (np.asarray(rw.get_array(name), dtype=np.float64).reshape(-1) for name in bn.input[1:5])
+            scale = gamma / np.sqrt(var + _attrs(bn).get("epsilon", 1e-5))
+            weight, bias = weights
+            weight = weight * scale.reshape((-1,) + (1,) * (weight.ndim - 1))
+            bias = (bias - mean) * scale + beta
+
+            hint = layer.name or layer.output[0]
+            inputs = [
+                layer.input[0],
+                rw.add_initializer(f"{hint}_bn_weight", weight.astype(np.float32)),
+                rw.add_initializer(f"{hint}_bn_bias", bias.astype(np.float32)),
+            ]
+            # dense weights are now packed [out, in] with alpha and beta applied
+            dense_attributes = [onnx.helper.make_attribute("transB", 1)]
+        else:
+            # weight values not loaded (graph-only upload): fold on shapes alone so analyses see the
+            # graph compile_model builds, the layer keeps its weight and takes the BN shift as bias
+            if layer.op_type != "Conv" and not _is_dense_foldable(rw, layer):
+                continue
+            inputs = [layer.input[0], layer.input[1], bn.input[2]]
+            dense_attributes = None
+        if layer.op_type != "Conv":
+            if dense_attributes is not None:
+                del layer.attribute[:]
+                layer.attribute.extend(dense_attributes)
+            layer.op_type = "Gemm"
+        for name in layer.input:
+            rw.readers.get(name, set()).discard(layer_idx)
+        del layer.input[:]
+        layer.input.extend(inputs)
+        for name in inputs:
+            rw.readers.setdefault(name, set()).add(layer_idx)
+
+        rw.remove(bn_idx)
+        rw.rename(layer.output[0], bn.output[0])
+        report.folded_batchnorms.append(_layer_name(bn))
+
+
+# Gemm/MatMul/Conv + activation become one kernel that applies the activation before storing
+def _fuse_activations(rw: _GraphRewriter, report: OptimizationReport) -> None:
+    for act_idx, act in rw.live():
+        if act.op_type not in FUSABLE_ACTIVATIONS:
+            continue
+        layer_idx = rw.producer(act.input[0])
+        if layer_idx is None or _single_consumer(rw, act.input[0]) != act_idx:
+            continue
+        layer = rw.nodes[layer_idx]
+        if layer.op_type not in FOLD_TARGET_OPS or layer.output[0] in rw.fused:
+            continue
+        rw.remove(act_idx)
+        rw.rename(layer.output[0], act.output[0])
+        rw.fused[act.output[0]] = act.op_type
+        report.fused.append(f"{_layer_name(layer)}+{act.op_type}")
+
+
+# rebuilds the ModelProto from the rewritten nodes, dropping constants nothing reads any more
+def _build_model(rw: _GraphRewriter) -> onnx.ModelProto:
+    source = rw.index.model
+    nodes = [node for _, node in rw.live()]
+    used = {name for node in nodes for name in node.input} | rw.graph_outputs
+    nodes = [node for node in nodes if node.op_type != "Constant" or node.output[0] in used]
+
+    initializers = [init for init in source.graph.initializer if init.name in used]
+    for name, value in rw.new_initializers.items():
+        if name in used:
+            initializers.append(onnx.numpy_helper.from_array(np.ascontiguousarray(value), name))
+    kept = {init.name for init in initializers}
+    present = used | {name for node in nodes for name in node.output}
+
+    graph = onnx.helper.make_graph(
+        nodes,
+        source.graph.name,
+        [inp for inp in source.graph.input if inp.name not in rw.index.initializers or inp.name in kept],
+        list(source.graph.output),
+        initializer=initializers,
+        value_info=[value for value in source.graph.value_info if value.name in present]
+    )
+    model = onnx.helper.make_model(graph, opset_imports=list(source.opset_import), ir_version=source.ir_version)
+    model.producer_name = source.producer_name
+    model.model_version = source.model_version
+    return model
+
+
+@instrumented("optimize")
+def optimize_graph(index: GraphIndex) -> GraphIndex:
+    """
+    Rewrite a model for code generation and return the index of the result.
+
+    Passes run in order: Identity/Dropout removal, constant folding of
+    Shape/Reshape chains (and any op whose inputs are all constants),
+    BatchNormalization folding into the preceding Gemm/MatMul/Conv,
+    fusion of Relu/Sigmoid/Tanh into the preceding Gemm/MatMul/Conv, and
+    removal of nodes the folds left without a path to an output. A fused
+    layer writes the activation's output tensor and is recorded in
+    GraphIndex.fused. Folds that need weight values are skipped when the
+    model was loaded without its external data.
+
+    Shapes are folded with the index's batch size, so the result is specific
+    to it. The original model is not modified.
+
+    Returns:
+        GraphIndex of the optimized model with optimization set to an OptimizationReport
+    """
+    report = OptimizationReport(nodes_before=len(index.nodes))
+    rw = _GraphRewriter(index)
+    _remove_noops(rw, report)
+    _fold_constants(rw, report)
+    _fold_batchnorms(rw, report)
+    _fuse_activations(rw, report)
+    _remove_dead_nodes(rw, report)
+
+    optimized = build_graph_index(_build_model(rw), index.batch_size, index.external_data)
+    optimized.fused = dict(rw.fused)
+    optimized.simplification = index.simplification
+    report.nodes_after = len(optimized.nodes)
+    optimized.optimization = report
+    return optimized
+
+
+@instrumented("load.simplify")
+def simplify_graph(index: GraphIndex) -> GraphIndex:
+    """
+    Strip what an exported model carries but never computes, as it is loaded.
+
+    Identity/Dropout nodes are bypassed, nodes whose inputs are all
+    constants are evaluated with the reference executor into initializers,
+    nodes with no path to a graph output are removed, and initializers
+    nothing reads are dropped. Unlike optimize_graph the result does not
+    depend on the batch size (Shape is only folded there), so it replaces
+    the uploaded graph for every later profile and compile. A model with
+    nothing to remove is returned as is, without re-indexing.
+
+    Returns:
+        GraphIndex of the simplified model with simplification set to a SimplificationReport
+    """
+    report = SimplificationReport(nodes_before=len(index.nodes))
+    rw = _GraphRewriter(index)
+    _remove_noops(rw, report)
+    _fold_constants(rw, report, fold_shapes=False)
+    _remove_dead_nodes(rw, report)
+
+    read = {name for node in index.nodes for name in node.input} | rw.graph_outputs
+    if not (report.removed or report.folded_constants or report.dead_nodes) and read >= set(index.initializers):
+        report.nodes_after = report.nodes_before
+        index.simplification = report
+        return index
+
+    simplified = build_graph_index(_build_model(rw), index.batch_size, index.external_data)
+    report.dropped_initializers = [name for name in index.initializers if name not in simplified.initializers]
+    report.dropped_bytes = sum(tensor_nbytes(index.initializers[name]) for name in report.dropped_initializers)
+    report.nodes_after = len(simplified.nodes)
+    simplified.simplification = report
+    return simplified
+
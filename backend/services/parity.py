@@ -0,0 +1,145 @@
+from dataclasses import dataclass, field, asdict
+from typing import Optional
+import ctypes
+import os
+import tempfile
+import numpy as np
+
+from services.benchmark import find_host_compiler, run_command, BUILD_TIMEOUT, OPT_LEVELS
+from services.compile_model import CompiledModel
+from services.instrumentation import instrumented
+from services.reference import GoldenVectors
+
+
+@dataclass
+class OutputParity:
+    """Error of the compiled C against the reference on one graph output."""
+    name: str
+    max_abs_error: float
+    max_rel_error: float          # over values with |ref| > atol, relative error is meaningless near 0
+    worst_sample: int
+    worst_index: int              # flat index of the worst value in the output
+    failures: int                 # values with |out - ref| > atol + rtol * |ref|
+    per_sample_max_abs: list[float] = field(default_factory=list)
+
+
+@dataclass
+class ParityReport:
+    """Numeric check of generated code run on the host against golden vectors."""
+    model_name: str
+    compiler: str
+    opt_level: str
+    samples: int
+    atol: float
+    rtol: float
+    outputs: list[OutputParity] = field(default_factory=list)
+
+    @property
+    def passed(self) -> bool:
+        return all(output.failures == 0 for output in self.outputs)
+
+
+# unloads a shared library loaded with ctypes, so repeated checks do not accumulate mapped libraries
+def _unload(library: ctypes.CDLL) -> None:
+    try:
+        import _ctypes
+        _ctypes.dlclose(library._handle)
+    except (ImportError, AttributeError, OSError):
+        pass
+
+
+def _output_parity(name: str, got: np.ndarray, golden: GoldenVectors) -> OutputParity:
+    expected = golden.outputs
+    err = np.abs(got - expected)
+    worst_sample, worst_index = np.unravel_index(int(np.argmax(err)), err.shape)
+    significant = np.abs(expected) > golden.atol
+    rel = err[significant] / np.abs(expected[significant])
+    return OutputParity(
+        name=name,
+        max_abs_error=float(err.max()),
+        max_rel_error=float(rel.max()) if rel.size else 0.0,
+        worst_sample=int(worst_sample),
+        worst_index=int(worst_index),
+        failures=int((err > golden.atol + golden.rtol * np.abs(expected)).sum()),
+        per_sample_max_abs=[float(v) for v in err.max(axis=1)]
+    )
+
+
+@instrumented("parity")
+def check_parity(
+    compiled: CompiledModel,
+    golden: GoldenVectors,
+    compiler: Optional[str] = None,
+    opt_level: str = "-O2"
+) -> ParityReport:
+    """
+    Build generated C as a shared library and compare it with golden vectors.
+
+    The model (and its weight blob in "blob" mode) is built with
+    ENABLE_INFERENCE_TEST defined, loaded with ctypes, and every golden
+    input is run through {model}_forward in this process.
+
+    Args:
+        compiled: Output of compile_model for the graph the vectors came from
+        golden: Vectors from reference.golden_vectors
+        compiler: 'gcc', 'clang' or 'cc', defaults to the first one installed
+        opt_level: Optimization flag for the build
+
+    Returns:
+        ParityReport with the error on each output
+    """
+    if opt_level not in OPT_LEVELS:
+        raise ValueError(f"Optimization level must be one of {OPT_LEVELS}, got '{opt_level}'")
+    cc = find_host_compiler(compiler)
+    name = compiled.model_name
+    samples, input_size = golden.inputs.shape
+    output_size = golden.outputs.shape[1]
+
+    with tempfile.TemporaryDirectory(prefix="silicon_parity_") as workdir:
+        for filename, data in compiled.files():
+            with open(os.path.join(workdir, filename), "wb" if isinstance(data, bytes) else "w") as out:
+                out.write(data)
+        sources = [f"{name}.c"] + ([f"{name}_weights.S"] if compiled.weights_blob is not None else [])
+        library_path = os.path.join(workdir, f"lib{name}.so")
+        run_command(
+            [cc, "-std=c99", opt_level, "-shared", "-fPIC", "-DENABLE_INFERENCE_TEST", "-I.", *sources, "-lm", "-o", library_path],
+            workdir, BUILD_TIMEOUT, f"Building {name} as a shared library"
+        )
+
+        library = ctypes.CDLL(library_path)
+        try:
+            forward = getattr(library, f"{name}_forward")
+            forward.argtypes = [ctypes.POINTER(ctypes.c_float), ctypes.POINTER(ctypes.c_float)]
+            forward.restype = None
+            sizes = []
+            for suffix in ("input", "output"):
+                getter = getattr(library, f"{name}_get_{suffix}_size")
+                getter.restype = ctypes.c_size_t
+                sizes.append(getter())
+            if sizes != [input_size, output_size]:
+                raise ValueError(f"Golden vectors are {input_size} -> {output_size} values, {name}_forward is {sizes[0]} -> {sizes[1]}")
+
+            got = np.empty((samples, output_size), dtype=np.float32)
+            for s in range(samples):
+                x = np.ascontiguousarray(golden.inputs[s], dtype=np.float32)
+                y = np.zeros(output_size, dtype=np.float32)
+                forward(x.ctypes.data_as(ctypes.POINTER(ctypes.c_float)), y.ctypes.data_as(ctypes.POINTER(ctypes.c_float)))
+                got[s] = y
+        finally:
+            _unload(library)
+
+    return ParityReport(
+        model_name=name,
+        compiler=os.path.basename(cc),
+        opt_level=opt_level,
+        samples=samples,
+        atol=golden.atol,
+        rtol=golden.rtol,
+        outputs=[_output_parity(golden.output_name or "output", got, golden)]
+    )
+
+
+def parity_to_dict(report: ParityReport) -> dict:
+    result = asdict(report)
+    result["passed"] = report.passed
+    return result
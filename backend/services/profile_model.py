@@ -1,8 +1,18 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Optional
+import numpy as np
 import onnx
 
-from services.load_model import extract_model_info, ModelInfo, LayerInfo
+from services.load_model import extract_model_info, build_graph_index, GraphIndex, ModelInfo, LayerInfo, WeightInfo
+from services.memory_planner import MemoryPlan, DTYPE_BYTES
+from services.scheduler import schedule_nodes
+from services.quantize_model import quantized_constant_bytes
+from services.optimize_graph import optimize_graph
+from services.cost_model import LayerCost, model_costs
+from services.boards import get_board
+from services.latency_model import LatencyEstimate, estimate_latency
+from services.roofline import Roofline, roofline
+from services.instrumentation import instrumented
 
 
 @dataclass
@@ -15,6 +25,29 @@ class LayerProfile:
     param_count: int
     memory_bytes: int
     flops: int
+    macs: int = 0
+    transcendentals: int = 0
+    bytes_read: int = 0
+    bytes_written: int = 0
+    latency_ms: float = 0.0
+
+
+@dataclass
+class MemoryTimelineStep:
+    """Arena usage while one layer executes."""
+    layer: str
+    op_type: str
+    live_bytes: int
+    live_tensors: list[str]
+
+
+@dataclass
+class MemoryTimeline:
+    """Per-layer live memory and exact arena size from the compiler's memory plan."""
+    arena_bytes: int     # statically allocated arena (what the generated C declares)
+    peak_bytes: int      # largest sum of live buffers at any step
+    io_bytes: int        # caller-owned input and output buffers
+    steps: list[MemoryTimelineStep] = field(default_factory=list)
 
 
 @dataclass
@@ -27,30 +60,27 @@ class ModelProfile:
     total_flops: int
     layers: list[LayerProfile]
     board_name: str
+    memory_timeline: Optional[MemoryTimeline] = None
+    optimization: Optional["OptimizationSummary"] = None
+    cost: Optional[LayerCost] = None     # whole-model MACs, FLOPs, transcendentals and memory traffic
+    latency: Optional[LatencyEstimate] = None
+    roofline: Optional[Roofline] = None
 
 
-# Hardcoded board constraints for now - replaced by agent connection to MCP
-BOARD_CONSTRAINTS = {
-    'STM32F401': {
-        'ram_total': 96 * 1024,       # 96KB SRAM
-        'flash_total': 512 * 1024,    # 512KB Flash
-    },
-    'ESP32': {
-        'ram_total': 320 * 1024,      # 320KB SRAM
-        'flash_total': 4 * 1024 * 1024,  # 4MB Flash
-    },
-}
-
-# Byte width per data type
-DTYPE_BYTES = {
-    'float32': 4,
-    'float16': 2,
-    'int32': 4,
-    'int16': 2,
-    'int8': 1,
-    'uint8': 1,
-    'bool': 1,
-}
+@dataclass
+class OptimizationSummary:
+    """Metrics of the graph as loaded versus after optimize_graph, which is what gets compiled."""
+    nodes_before: int
+    nodes_after: int
+    flops_before: int
+    flops_after: int
+    ram_before: int
+    ram_after: int
+    flash_before: int
+    flash_after: int
+    arena_before: int
+    arena_after: int
+    passes: dict         # rewrites applied by each pass (see OptimizationReport)
 
 
 # get the byte width for a data type
@@ -61,6 +91,10 @@ def get_dtype_bytes(dtype: str) -> int:
 def calculate_flash_memory(model_info: ModelInfo, quantized: bool = False) -> int:
     bytes_per_param = 1 if quantized else 4
     
+    # int8 code also stores int32 biases, requantization tables and LUTs
+    if quantized and model_info.index is not None:
+        return quantized_constant_bytes(model_info.index)
+    
     total_flash = 0
     for weight in model_info.weights:
         weight_bytes = get_dtype_bytes(weight.dtype)
@@ -72,139 +106,182 @@ def calculate_flash_memory(model_info: ModelInfo, quantized: bool = False) -> in
     
     return total_flash
 
-# get the output shape for a layer
-def _get_output_shape_for_layer(layer: LayerInfo, model_info: ModelInfo) -> Optional[list]:
-    return None
+# get the output shape for a layer from inferred tensor shapes
+def _get_output_shape_for_layer(layer: LayerInfo, shapes: dict[str, dict]) -> Optional[list]:
+    if not layer.outputs or layer.outputs[0] not in shapes:
+        return None
+    return shapes[layer.outputs[0]]['shape']
+
+
+# size in bytes of the model's input or output buffers (float even for int8 models, which convert in the arena)
+def _io_bytes(tensors: list[dict], batch_size: int, shape_override: Optional[list[int]] = None) -> int:
+    total = 0
+    for tensor in tensors:
+        shape = shape_override or tensor.get('shape', [])
+        bytes_per_element = get_dtype_bytes(tensor.get('dtype', 'float32'))
+        # Replace dynamic dimensions (strings or -1) with batch_size
+        numeric_shape = [batch_size if not isinstance(d, int) or d <= 0 else d for d in shape]
+        if numeric_shape:
+            total += int(np.prod(numeric_shape)) * bytes_per_element
+    return total
+
 
 # calculate ram memory usage for inference
 def calculate_ram_usage(
     model_info: ModelInfo,
+    plan: MemoryPlan,
     input_shape: Optional[list[int]] = None,
-    quantized: bool = False,
     batch_size: int = 1 # batch size var accounts for dynamic shapes
 ) -> int:
     """
-    Calculate RAM (arena) memory usage for inference.
+    Calculate RAM memory usage for inference.
     
-    RAM = max(input_buffer_size, output_buffer_size) + intermediate_activations
+    RAM = input_buffer + output_buffer + tensor_arena
     
-    For a simplified estimation:
-    RAM ≈ input_size + output_size + largest_intermediate_activation
+    The arena size comes from the same memory plan the compiler uses, so it
+    is exactly the size of the arena declared in the generated C code. For
+    int8 models the plan already holds the quantized input and output
+    copies; the caller's buffers stay float.
     
     Args:
         model_info: Extracted model information from load_model
+        plan: Memory plan from plan_memory or schedule_nodes
         input_shape: Optional input shape override, else uses model input
-        quantized: If True, use int8 (1 byte), else float32 (4 bytes)
     
     Returns:
-        Estimated RAM usage in bytes
+        RAM usage in bytes
     """
-    # Calculate input buffer size
-    input_size = 0
-    if model_info.inputs:
-        for inp in model_info.inputs:
-            shape = input_shape or inp.get('shape', [])
-            dtype = inp.get('dtype', 'float32')
-            bytes_per_element = 1 if quantized else get_dtype_bytes(dtype)
-            # Replace dynamic dimensions (strings or -1) with batch_size
-            numeric_shape = [batch_size if not isinstance(d, int) or d <= 0 else d for d in shape]
-            if numeric_shape:
-                import numpy as np
-                input_size += int(np.prod(numeric_shape)) * bytes_per_element
-    
-    # Calculate output buffer size
-    output_size = 0
-    if model_info.outputs:
-        for out in model_info.outputs:
-            shape = out.get('shape', [])
-            dtype = out.get('dtype', 'float32')
-            bytes_per_element = 1 if quantized else get_dtype_bytes(dtype)
-            # Replace dynamic dimensions (strings or -1) with batch_size
-            numeric_shape = [batch_size if not isinstance(d, int) or d <= 0 else d for d in shape]
-            if numeric_shape:
-                import numpy as np
-                output_size += int(np.prod(numeric_shape)) * bytes_per_element
-    
-    # Estimate intermediate activations (heuristic: 2x largest of input/output)
-    # In practice, TFLite Micro uses a tensor arena that holds all intermediate tensors
-    max_buffer = max(input_size, output_size)
-    intermediate_estimate = max_buffer * 2
-    
-    # Total arena size: input + output + intermediates
-    # This is a conservative estimate
-    total_ram = input_size + output_size + intermediate_estimate
-    
-    return total_ram
+    input_size = _io_bytes(model_info.inputs, batch_size, input_shape)
+    output_size = _io_bytes(model_info.outputs, batch_size)
+    return input_size + output_size + plan.arena_size
+
 
+# live memory per layer for an execution plan
+def calculate_memory_timeline(
+    model: onnx.ModelProto,
+    model_info: ModelInfo,
+    plan: MemoryPlan,
+    batch_size: int = 1
+) -> MemoryTimeline:
+    nodes = model.graph.node
+    arena_buffers = [b for b in plan.buffers if b.external is None]
+    starting = {}
+    for buffer in arena_buffers:
+        starting.setdefault(max(buffer.start, 0), []).append(buffer)
+
+    # sweep the schedule, keeping the set of buffers live at each step
+    steps = []
+    live = {}
+    for step, idx in enumerate(plan.order):
+        for buffer in starting.get(step, []):
+            live[id(buffer)] = buffer
+        node = nodes[idx]
+        steps.append(MemoryTimelineStep(
+            layer=node.name or f"{node.op_type}_{idx}",
+            op_type=node.op_type,
+            live_bytes=plan.live_bytes[step],
+            live_tensors=[b.name for b in live.values()]
+        ))
+        live = {key: b for key, b in live.items() if b.end > step}
+
+    return MemoryTimeline(
+        arena_bytes=plan.arena_size,
+        peak_bytes=plan.peak_bytes,
+        io_bytes=_io_bytes(model_info.inputs, batch_size) + _io_bytes(model_info.outputs, batch_size),
+        steps=steps
+    )
+
+
+# weights read by a layer, looked up through the graph index when available
+def _layer_weights(layer: LayerInfo, model_info: ModelInfo) -> list[WeightInfo]:
+    if model_info.index is not None:
+        weight_map = model_info.index.weights
+        return [weight_map[name] for name in layer.inputs if name in weight_map]
+    return [weight for weight in model_info.weights if weight.name in layer.inputs]
 
-def calculate_layer_flops(layer: LayerInfo, model_info: ModelInfo) -> int:
+
+# per-layer cost from the shape-driven cost model, aligned with model_info.layers
+def calculate_layer_costs(model_info: ModelInfo, quantized: bool = False) -> list[LayerCost]:
     """
-    Calculate FLOPs for a single layer.
-    
-    Formulas:
-    - Dense: 2 * input_features * output_features
-    - Conv2D: 2 * Kh * Kw * Cin * Hout * Wout * Cout
-    - MaxPool2D, ReLU, Flatten: 0 (no multiply-add operations)
-    
+    Calculate MACs, FLOPs, transcendentals and memory traffic for every layer.
+
+    Shapes come from ONNX shape inference at the index's batch size, so Conv
+    and pooling costs follow the real output resolution. See
+    cost_model.layer_cost for the counting rules.
+
     Args:
-        layer: Layer information
-        model_info: Full model information for weight lookups
-    
+        model_info: Extracted model information with its graph index
+        quantized: Cost the int8 code compile_model generates
+
     Returns:
-        FLOPs for this layer
+        One LayerCost per layer
     """
-    op_type = layer.op_type.lower()
-    
-    # Find associated weights for this layer
-    layer_weights = []
-    for weight in model_info.weights:
-        # Check if weight is used by this layer
-        if weight.name in layer.inputs:
-            layer_weights.append(weight)
-    
-    if op_type in ['gemm', 'matmul', 'dense', 'fc', 'fullyconnected']:
-        # Dense: 2 * I * O (multiply-add = 2 ops)
-        for weight in layer_weights:
-            if len(weight.shape) == 2:
-                input_features, output_features = weight.shape
-                return 2 * input_features * output_features
-        return 0
-    
-    elif op_type in ['conv', 'conv2d', 'convolution']:
-        # Conv2D: (Kh * Kw * Cin) * (Hout * Wout * Cout)
-        # Weight shape is typically [Cout, Cin, Kh, Kw] or [Kh, Kw, Cin, Cout]
-        for weight in layer_weights:
-            if len(weight.shape) == 4:
-                # Assume OIHW format (PyTorch style): [Cout, Cin, Kh, Kw]
-                cout, cin, kh, kw = weight.shape
-                # Estimate output spatial size (assume same padding, no stride for now)
-                # This is a rough estimate - real impl would need input shape tracking
-                hout, wout = 28, 28  # Placeholder, would be computed from input shape
-                return (kh * kw * cin) * (hout * wout * cout)
-        return 0
-
-    # all other cases have don't count as FLOPS - return 0
-    else:
-        return 0
+    index = model_info.index
+    if index is None:
+        raise ValueError("Model info has no graph index to infer shapes from")
+    return model_costs(index, quantized)
 
 # calculate total FLOPs for the entire model - iterates through layers
-def calculate_total_flops(model_info: ModelInfo) -> tuple[int, list[tuple[str, int]]]:
-    total_flops = 0
-    layer_flops = []
-    
-    for layer in model_info.layers:
-        flops = calculate_layer_flops(layer, model_info)
-        total_flops += flops
-        layer_flops.append((layer.name, flops))
-    
-    return total_flops, layer_flops
+def calculate_total_flops(model_info: ModelInfo, quantized: bool = False) -> tuple[int, list[tuple[str, int]]]:
+    costs = calculate_layer_costs(model_info, quantized)
+    layer_flops = [(layer.name, cost.flops) for layer, cost in zip(model_info.layers, costs)]
+    return sum(cost.flops for cost in costs), layer_flops
+
+# index of the graph at batch_size, keeping the weights of a given index (a stored model's mapped .data)
+def _graph_index(model: onnx.ModelProto, batch_size: int, index: Optional[GraphIndex]) -> GraphIndex:
+    if index is not None and index.batch_size == batch_size:
+        return index
+    return build_graph_index(model, batch_size=batch_size, external_data=index.external_data if index is not None else None)
+
+
+# arena plan the compiler would use for a graph, in the order the scheduler picks
+def _plan(index, quantized: bool) -> MemoryPlan:
+    if quantized:
+        return schedule_nodes(index, bytes_per_element=1, external_io=False)
+    return schedule_nodes(index)
+
+
+# before/after metrics for an optimized graph
+def _optimization_summary(
+    original: ModelInfo,
+    original_plan: MemoryPlan,
+    optimized: ModelInfo,
+    plan: MemoryPlan,
+    quantized: bool,
+    batch_size: int
+) -> OptimizationSummary:
+    report = optimized.index.optimization
+    return OptimizationSummary(
+        nodes_before=report.nodes_before,
+        nodes_after=report.nodes_after,
+        flops_before=calculate_total_flops(original, quantized)[0],
+        flops_after=calculate_total_flops(optimized, quantized)[0],
+        ram_before=calculate_ram_usage(original, original_plan, batch_size=batch_size),
+        ram_after=calculate_ram_usage(optimized, plan, batch_size=batch_size),
+        flash_before=calculate_flash_memory(original, quantized),
+        flash_after=calculate_flash_memory(optimized, quantized),
+        arena_before=original_plan.arena_size,
+        arena_after=plan.arena_size,
+        passes={
+            'removed': report.removed,
+            'folded_constants': report.folded_constants,
+            'folded_batchnorms': report.folded_batchnorms,
+            'fused': report.fused,
+            'dead_nodes': report.dead_nodes
+        }
+    )
+
 
 # profile model - main function to be called by the agent
+@instrumented("profile")
 def profile_model(
     model: onnx.ModelProto,
     board_name: str = 'STM32F401',
     quantized: bool = False,
-    batch_size: int = 1
+    batch_size: int = 1,
+    optimize: bool = True,
+    deadline_ms: Optional[float] = None,
+    index: Optional[GraphIndex] = None
 ) -> ModelProfile:
     """
     Generate complete profiling results for a model on a specific board.
@@ -214,49 +291,77 @@ def profile_model(
     Args:
         model: ONNX model proto
         board_name: Target board name ('STM32F401' or 'ESP32')
-        quantized: Whether to assume int8 quantization
+        quantized: Profile the int8 code compile_model generates for a quantized model
+        optimize: Profile the graph after optimize_graph (as compile_model generates it)
+            and report the metrics before and after the rewrite
+        deadline_ms: Latency budget the estimated inference time is checked against
+        index: Graph index of model with its weights loaded (a stored model's), so the
+            optimizer can fold what compile_model folds; built from model when omitted
     
     Returns:
         ModelProfile with all profiling metrics
     """
-    # Extract model info using existing function
-    model_info = extract_model_info(model)
+    # Index the graph once (shapes inferred for the requested batch size)
+    index = _graph_index(model, batch_size, index)
+    model_info = extract_model_info(model, index)
+    original_info = original_plan = None
+    if optimize:
+        original_info, original_plan = model_info, _plan(index, quantized)
+        index = optimize_graph(index)
+        model = index.model
+        model_info = extract_model_info(model, index)
+    shapes = index.shapes
     
     # Get board constraints
-    board = BOARD_CONSTRAINTS.get(board_name, BOARD_CONSTRAINTS['STM32F401'])
+    board = get_board(board_name)
+    
+    # Plan the arena exactly as the compiler does, a graph the optimizer left unchanged keeps its plan
+    if original_plan is not None and index.optimization.nodes_after == index.optimization.nodes_before:
+        plan = original_plan
+    else:
+        plan = _plan(index, quantized)
     
     # Calculate metrics
     flash_used = calculate_flash_memory(model_info, quantized)
-    ram_used = calculate_ram_usage(model_info, quantized=quantized, batch_size=batch_size)
-    total_flops, layer_flops_list = calculate_total_flops(model_info)
+    ram_used = calculate_ram_usage(model_info, plan, batch_size=batch_size)
+    memory_timeline = calculate_memory_timeline(model, model_info, plan, batch_size)
+    optimization = None
+    if original_info is not None:
+        optimization = _optimization_summary(original_info, original_plan, model_info, plan, quantized, batch_size)
+    layer_costs = calculate_layer_costs(model_info, quantized)
+    cost = sum(layer_costs, LayerCost())
+    latency = estimate_latency(index, layer_costs, board_name, quantized, deadline_ms)
+    layer_roofline = roofline(index, layer_costs, board_name, quantized)
     
     # Build layer profiles
     layers = []
-    for layer in model_info.layers:
+    for layer, layer_cost, layer_latency in zip(model_info.layers, layer_costs, latency.layers):
         # Find weight info for this layer
-        param_count = 0
-        for weight in model_info.weights:
-            if weight.name in layer.inputs:
-                param_count += weight.size
-        
-        # Get layer FLOPs
-        layer_flop = next(
-            (f for name, f in layer_flops_list if name == layer.name), 
-            0
-        )
+        param_count = sum(weight.size for weight in _layer_weights(layer, model_info))
         
         # Estimate memory for this layer's output (simplified)
         bytes_per_elem = 1 if quantized else 4
         memory_bytes = param_count * bytes_per_elem
         
+        # Fall back to the inferred tensor shape for layers without weights
+        output_shape = layer.output_shape
+        if output_shape is None:
+            inferred = _get_output_shape_for_layer(layer, shapes)
+            output_shape = "x".join(str(d) for d in inferred) if inferred else None
+        
         layers.append(LayerProfile(
             name=layer.name,
             op_type=layer.op_type,
             input_shape=layer.input_shape,
-            output_shape=layer.output_shape,
+            output_shape=output_shape,
             param_count=param_count,
             memory_bytes=memory_bytes,
-            flops=layer_flop
+            flops=layer_cost.flops,
+            macs=layer_cost.macs,
+            transcendentals=layer_cost.transcendentals,
+            bytes_read=layer_cost.bytes_read,
+            bytes_written=layer_cost.bytes_written,
+            latency_ms=layer_latency.latency_ms
         ))
     
     return ModelProfile(
@@ -264,12 +369,86 @@ def profile_model(
         ram_total=board['ram_total'],
         flash_used=flash_used,
         flash_total=board['flash_total'],
-        total_flops=total_flops,
+        total_flops=cost.flops,
         layers=layers,
-        board_name=board_name
+        board_name=board_name,
+        memory_timeline=memory_timeline,
+        optimization=optimization,
+        cost=cost,
+        latency=latency,
+        roofline=layer_roofline
     )
 
 
+# latency estimate alone, on the graph profile_model would analyze
+def estimate_model_latency(
+    model: onnx.ModelProto,
+    board_name: str = 'STM32F401',
+    quantized: bool = False,
+    batch_size: int = 1,
+    optimize: bool = True,
+    calibrated: bool = True,
+    index: Optional[GraphIndex] = None
+) -> LatencyEstimate:
+    index = _graph_index(model, batch_size, index)
+    if optimize:
+        index = optimize_graph(index)
+    return estimate_latency(index, model_costs(index, quantized), board_name, quantized, calibrated=calibrated)
+
+
+# latency estimate as returned by the API
+def latency_to_dict(latency: LatencyEstimate) -> dict:
+    board = get_board(latency.board_name)
+    return {
+        'board': {
+            'core': board['core'],
+            'clock_hz': latency.clock_hz,
+            'fpu': board['fpu'],
+            'dsp': board['dsp'],
+            'active_power_mw': board['active_power_mw']
+        },
+        'precision': latency.precision,
+        'total_cycles': round(latency.total_cycles),
+        'latency_ms': latency.latency_ms,
+        'energy_uj': latency.energy_uj,
+        'deadline_ms': latency.deadline_ms,
+        'meets_deadline': latency.meets_deadline,
+        'calibration': latency.calibration,
+        'layers': [
+            {'name': layer.name, 'kernel': layer.kernel, 'cycles': round(layer.cycles), 'latency_ms': layer.latency_ms}
+            for layer in latency.layers
+        ]
+    }
+
+
+# roofline as returned by the API
+def roofline_to_dict(result: Roofline) -> dict:
+    ceilings = result.ceilings
+    return {
+        'precision': result.precision,
+        'ceilings': {
+            'peak_ops_per_s': ceilings.peak_ops_per_s,
+            'sram_bytes_per_s': ceilings.sram_bytes_per_s,
+            'flash_bytes_per_s': ceilings.flash_bytes_per_s,
+            'sram_ridge': ceilings.sram_ridge,
+            'flash_ridge': ceilings.flash_ridge
+        },
+        'points': [
+            {
+                'name': point.name,
+                'type': point.op_type,
+                'ops': point.ops,
+                'bytes': point.bytes_moved,
+                'weight_bytes': point.weight_bytes,
+                'intensity': point.intensity,
+                'attainable_ops_per_s': point.attainable_ops_per_s,
+                'bound': point.bound
+            }
+            for point in result.points
+        ]
+    }
+
+
 # convert ModelProfile to a dictionary for JSON serialization (FastAPI response)
 def profile_to_dict(profile: ModelProfile) -> dict:
     return {
@@ -278,6 +457,10 @@ def profile_to_dict(profile: ModelProfile) -> dict:
         'flash_used': profile.flash_used,
         'flash_total': profile.flash_total,
         'total_flops': profile.total_flops,
+        'total_macs': profile.cost.macs if profile.cost else None,
+        'total_transcendentals': profile.cost.transcendentals if profile.cost else None,
+        'total_bytes_read': profile.cost.bytes_read if profile.cost else None,
+        'total_bytes_written': profile.cost.bytes_written if profile.cost else None,
         'board_name': profile.board_name,
         'layers': [
             {
@@ -287,18 +470,47 @@ def profile_to_dict(profile: ModelProfile) -> dict:
                 'output_shape': layer.output_shape,
                 'param_count': layer.param_count,
                 'memory_bytes': layer.memory_bytes,
-                'flops': layer.flops
+                'flops': layer.flops,
+                'macs': layer.macs,
+                'transcendentals': layer.transcendentals,
+                'bytes_read': layer.bytes_read,
+                'bytes_written': layer.bytes_written,
+                'latency_ms': layer.latency_ms
             }
             for layer in profile.layers
-        ]
+        ],
+        'memory_timeline': {
+            'arena_bytes': profile.memory_timeline.arena_bytes,
+            'peak_bytes': profile.memory_timeline.peak_bytes,
+            'io_bytes': profile.memory_timeline.io_bytes,
+            'steps': [
+                {
+                    'layer': step.layer,
+                    'type': step.op_type,
+                    'live_bytes': step.live_bytes,
+                    'live_tensors': step.live_tensors
+                }
+                for step in profile.memory_timeline.steps
+            ]
+        } if profile.memory_timeline else None,
+        'optimization': {
+            'nodes': {'before': profile.optimization.nodes_before, 'after': profile.optimization.nodes_after},
+            'flops': {'before': profile.optimization.flops_before, 'after': profile.optimization.flops_after},
+            'ram': {'before': profile.optimization.ram_before, 'after': profile.optimization.ram_after},
+            'flash': {'before': profile.optimization.flash_before, 'after': profile.optimization.flash_after},
+            'arena': {'before': profile.optimization.arena_before, 'after': profile.optimization.arena_after},
+            'passes': profile.optimization.passes
+        } if profile.optimization else None,
+        'latency': latency_to_dict(profile.latency) if profile.latency else None,
+        'roofline': roofline_to_dict(profile.roofline) if profile.roofline else None
     }
 
 
 # For testing
 if __name__ == "__main__":
-    import onnx
+    import os
     
-    model_path = "../test_models/simple_nn-2.onnx"
+    model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test_models", "model.onnx")
     try:
         model = onnx.load(model_path)
         
@@ -0,0 +1,370 @@
+from dataclasses import dataclass, field
+from typing import Optional
+import hashlib
+import math
+import numpy as np
+import onnx
+
+from services.load_model import GraphIndex
+from services.memory_planner import ALIAS_OPS, constant_tensor_names
+from services.reference import run_reference, pre_activation_name
+from services.instrumentation import instrumented
+
+
+INT8_MIN = -128
+INT8_MAX = 127
+
+# weights are symmetric so that the zero point drops out of the inner product
+WEIGHT_QMAX = 127
+
+# ops with a known output range get fixed output parameters (same convention as TFLite)
+FIXED_OUTPUT_PARAMS = {
+    "Sigmoid": (1.0 / 256.0, -128),
+    "Softmax": (1.0 / 256.0, -128),
+    "Tanh": (1.0 / 128.0, 0),
+}
+
+# elementwise ops lowered to a 256-entry int8 lookup table, with their float definition
+LUT_OPS = {
+    "Relu": lambda x: np.maximum(x, 0.0),
+    "Sigmoid": lambda x: 1.0 / (1.0 + np.exp(-x)),
+    "Tanh": np.tanh,
+}
+
+DENSE_OPS = {"Gemm", "MatMul"}
+CONV_OPS = {"Conv"}
+BINARY_QUANT_OPS = {"Add", "Sub", "Mul"}
+
+# ops whose output keeps the input's parameters (max pooling selects input values unchanged)
+SHARED_PARAM_OPS = {"MaxPool", "GlobalMaxPool"}
+
+
+@dataclass
+class QuantParams:
+    """Affine int8 quantization: real = scale * (q - zero_point)."""
+    scale: float
+    zero_point: int
+
+    def quantize(self, x: np.ndarray) -> np.ndarray:
+        q = np.round(np.asarray(x, dtype=np.float64) / self.scale) + self.zero_point
+        return np.clip(q, INT8_MIN, INT8_MAX).astype(np.int8)
+
+    def dequantize(self, q: np.ndarray) -> np.ndarray:
+        return (self.scale * (np.asarray(q, dtype=np.float64) - self.zero_point)).astype(np.float32)
+
+
+@dataclass
+class DenseParameters:
+    """Weights of a Gemm/MatMul in [out_features, in_features] layout with alpha and beta folded in."""
+    weight: np.ndarray
+    bias: Optional[np.ndarray]      # [out_features], None if the layer has no bias
+    weight_packed: bool             # weight differs from the initializer (transposed or scaled)
+    bias_packed: bool               # bias differs from the initializer (broadcast or scaled)
+
+
+@dataclass
+class QuantizedDense:
+    """Int8 form of one dense or Conv layer, requantized per output channel."""
+    weight: np.ndarray              # int8 [out_features, in_features] (Conv: [out_channels, in/group * kh * kw])
+    weight_scales: np.ndarray       # float per output channel, zero point 0
+    bias: np.ndarray                # int32 [out_features], input zero point folded in
+    multiplier: np.ndarray          # int32 Q31 fraction in [0.5, 1) per output channel
+    shift: np.ndarray               # int32 power-of-two exponent per output channel
+    zero_point: int = 0             # zero point added after requantization
+    activation_min: int = INT8_MIN  # lower clamp, the output zero point for a fused Relu
+    table: Optional[np.ndarray] = None  # int8 lookup table of a fused Sigmoid/Tanh, indexed by q + 128
+
+
+@dataclass
+class QuantizedModel:
+    """Quantization parameters for every activation and int8 weights for every dense and Conv layer."""
+    activations: dict[str, QuantParams]
+    layers: dict[str, QuantizedDense] = field(default_factory=dict)  # keyed by the layer's output tensor
+    per_channel: bool = True
+    fingerprint: str = ""
+
+
+def dense_parameters(index: GraphIndex, node: onnx.NodeProto) -> DenseParameters:
+    attrs = {attr.name: onnx.helper.get_attribute_value(attr) for attr in node.attribute}
+    weight = index.get_array(node.input[1])
+    if weight is None or weight.ndim != 2:
+        raise ValueError(f"Layer '{node.name}': {node.op_type} needs a constant 2D weight")
+    if attrs.get("transA", 0):
+        raise ValueError(f"Layer '{node.name}': Gemm with transA=1 is not supported")
+
+    # weights are stored [out_features, in_features]; transpose and scale offline
+    is_gemm = node.op_type == "Gemm"
+    trans_b = attrs.get("transB", 0) if is_gemm else 0
+    alpha = attrs.get("alpha", 1.0) if is_gemm else 1.0
+    packed = weight if trans_b else weight.T
+    if alpha != 1.0:
+        packed = packed * alpha
+    out_features = packed.shape[0]
+
+    bias, bias_packed = None, False
+    if is_gemm and len(node.input) > 2 and node.input[2]:
+        raw = index.get_array(node.input[2])
+        if raw is None or raw.size not in (1, out_features):
+            raise ValueError(f"Layer '{node.name}': Gemm bias must be a constant of size 1 or {out_features}")
+        beta = attrs.get("beta", 1.0)
+        bias = np.broadcast_to(raw.reshape(-1) * beta, (out_features,))
+        bias_packed = beta != 1.0 or raw.size != out_features
+
+    return DenseParameters(
+        weight=packed,
+        bias=bias,
+        weight_packed=not trans_b or alpha != 1.0,
+        bias_packed=bias_packed
+    )
+
+
+# Conv weights flattened to [out_channels, in_channels / group * kh * kw], the layout the kernels read
+def conv_parameters(index: GraphIndex, node: onnx.NodeProto) -> DenseParameters:
+    weight = index.get_array(node.input[1])
+    if weight is None or weight.ndim < 3:
+        raise ValueError(f"Layer '{node.name}': Conv needs a constant weight")
+    bias = None
+    if len(node.input) > 2 and node.input[2]:
+        bias = index.get_array(node.input[2])
+        if bias is None:
+            raise ValueError(f"Layer '{node.name}': Conv needs a constant bias")
+    return DenseParameters(
+        weight=weight.reshape(weight.shape[0], -1),
+        bias=bias,
+        weight_packed=False,
+        bias_packed=False
+    )
+
+
+# asymmetric int8 parameters covering [lo, hi] (always including 0 so zero padding is exact)
+def choose_params(lo: float, hi: float) -> QuantParams:
+    lo, hi = min(float(lo), 0.0), max(float(hi), 0.0)
+    if hi == lo:
+        return QuantParams(scale=1.0, zero_point=0)
+    scale = (hi - lo) / (INT8_MAX - INT8_MIN)
+    zero_point = int(round(INT8_MIN - lo / scale))
+    return QuantParams(scale=scale, zero_point=max(INT8_MIN, min(INT8_MAX, zero_point)))
+
+
+# splits real multipliers into Q31 fractions and power-of-two exponents: m = q * 2^(shift - 31)
+def quantize_multiplier(real: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    real = np.asarray(real, dtype=np.float64)
+    mantissa, exponent = np.frexp(real)
+    q = np.round(mantissa * (1 << 31)).astype(np.int64)
+    # rounding can carry the mantissa up to exactly 1.0
+    carry = q == (1 << 31)
+    q[carry] //= 2
+    exponent[carry] += 1
+    if np.any(exponent > 30):
+        raise ValueError("Requantization multiplier is too large for a Q31 fixed-point shift")
+    # multipliers below 2^-32 round every accumulator to zero
+    tiny = (real == 0) | (exponent < -31)
+    q[tiny] = 0
+    exponent[tiny] = 0
+    return q.astype(np.int32), exponent.astype(np.int32)
+
+
+# input feeds for each calibration sample, reshaped to the model's (batch 1) input shape
+def calibration_feeds(index: GraphIndex, data: np.ndarray) -> list[dict[str, np.ndarray]]:
+    constants = constant_tensor_names(index)
+    inputs = [inp.name for inp in index.model.graph.input if inp.name not in constants]
+    if len(inputs) != 1:
+        raise ValueError("Calibration is only supported for models with exactly one input")
+    name = inputs[0]
+    info = index.shapes.get(name)
+    shape = [d if isinstance(d, int) and d > 0 else 1 for d in info['shape']] if info else [-1]
+    numel = math.prod(shape)
+
+    data = np.asarray(data, dtype=np.float32)
+    if data.ndim == 0 or data.size % numel:
+        raise ValueError(f"Calibration data of shape {list(data.shape)} does not split into samples of shape {shape}")
+    samples = data.reshape(-1, numel)
+    return [{name: sample.reshape(shape)} for sample in samples]
+
+
+# min/max of every tensor over the calibration samples
+def calibrate(index: GraphIndex, data: np.ndarray) -> dict[str, tuple[float, float]]:
+    ranges = {}
+
+    def observe(name: str, value: np.ndarray) -> None:
+        if not np.issubdtype(value.dtype, np.floating) or value.size == 0:
+            return
+        lo, hi = float(value.min()), float(value.max())
+        if name in ranges:
+            lo, hi = min(lo, ranges[name][0]), max(hi, ranges[name][1])
+        ranges[name] = (lo, hi)
+
+    feeds = calibration_feeds(index, data)
+    if not feeds:
+        raise ValueError("Calibration data is empty")
+    for feed in feeds:
+        run_reference(index, feed, observe)
+    return ranges
+
+
+def _quantize_dense(params: DenseParameters, x: QuantParams, y: QuantParams, per_channel: bool) -> QuantizedDense:
+    weight = np.asarray(params.weight, dtype=np.float64)
+    absmax = np.abs(weight).max(axis=1) if per_channel else np.full(weight.shape[0], np.abs(weight).max())
+    scales = np.where(absmax > 0, absmax / WEIGHT_QMAX, 1.0)
+    q_weight = np.clip(np.round(weight / scales[:, None]), -WEIGHT_QMAX, WEIGHT_QMAX).astype(np.int8)
+
+    # int32 bias in accumulator units, with -x_zp * sum(w) folded in so the kernel multiplies raw int8 values
+    bias = params.bias if params.bias is not None else np.zeros(weight.shape[0])
+    q_bias = np.round(np.asarray(bias, dtype=np.float64) / (x.scale * scales)).astype(np.int64)
+    q_bias -= x.zero_point * q_weight.astype(np.int64).sum(axis=1)
+    q_bias = np.clip(q_bias, np.iinfo(np.int32).min, np.iinfo(np.int32).max).astype(np.int32)
+
+    multiplier, shift = quantize_multiplier(x.scale * scales / y.scale)
+    return QuantizedDense(
+        weight=q_weight,
+        weight_scales=scales.astype(np.float32),
+        bias=q_bias,
+        multiplier=multiplier,
+        shift=shift,
+        zero_point=y.zero_point
+    )
+
+
+def _fingerprint(quantized: QuantizedModel) -> str:
+    hasher = hashlib.blake2b(digest_size=16)
+    for name in sorted(quantized.activations):
+        params = quantized.activations[name]
+        hasher.update(f"{name}:{params.scale!r}:{params.zero_point};".encode())
+    for name in sorted(quantized.layers):
+        layer = quantized.layers[name]
+        hasher.update(f"{name}:{layer.zero_point}:{layer.activation_min};".encode())
+        for array in (layer.weight, layer.bias, layer.multiplier, layer.shift, layer.table):
+            if array is not None:
+                hasher.update(np.ascontiguousarray(array).tobytes())
+    return hasher.hexdigest()
+
+
+# int8 -> int8 table of an elementwise op, indexed by q + 128
+def lut_table(op_type: str, x: QuantParams, y: QuantParams) -> np.ndarray:
+    q = np.arange(INT8_MIN, INT8_MAX + 1, dtype=np.int32)
+    return y.quantize(LUT_OPS[op_type](x.dequantize(q).astype(np.float64)))
+
+
+def quantize_from_ranges(
+    index: GraphIndex,
+    ranges: dict[str, tuple[float, float]],
+    per_channel: bool = True
+) -> QuantizedModel:
+    """
+    Derive int8 parameters for every activation and dense/Conv layer from tensor ranges.
+
+    Views and max pools share their input's parameters (the values are not
+    changed), ops with a bounded output use FIXED_OUTPUT_PARAMS, and
+    constant operands of elementwise ops get parameters from their own
+    values. A layer with a fused Relu clamps at its output zero point; one
+    with a fused
+    Sigmoid/Tanh requantizes to its pre-activation range and applies a
+    lookup table.
+    """
+    constants = constant_tensor_names(index)
+    graph = index.model.graph
+    activations = {}
+
+    def from_range(name: str) -> QuantParams:
+        lo, hi = ranges.get(name, (-1.0, 1.0))
+        return choose_params(lo, hi)
+
+    for inp in graph.input:
+        if inp.name not in constants:
+            activations[inp.name] = from_range(inp.name)
+
+    layers = {}
+    for idx in index.order:
+        node = index.nodes[idx]
+        if node.op_type == "Constant" or not node.output:
+            continue
+        out = node.output[0]
+        activation = index.fused.get(out)
+        if node.op_type in ALIAS_OPS | SHARED_PARAM_OPS and node.input[0] in activations:
+            activations[out] = activations[node.input[0]]
+        elif (activation or node.op_type) in FIXED_OUTPUT_PARAMS:
+            scale, zero_point = FIXED_OUTPUT_PARAMS[activation or node.op_type]
+            activations[out] = QuantParams(scale=scale, zero_point=zero_point)
+        else:
+            activations[out] = from_range(out)
+
+        # constant operands are quantized with their own range
+        if node.op_type in BINARY_QUANT_OPS | {"Concat"}:
+            for name in node.input:
+                value = index.get_array(name)
+                if value is not None and name not in activations:
+                    activations[name] = choose_params(value.min(), value.max())
+        elif node.op_type in DENSE_OPS | CONV_OPS:
+            params = conv_parameters(index, node) if node.op_type in CONV_OPS else dense_parameters(index, node)
+            x, y = activations[node.input[0]], activations[out]
+            if activation in LUT_OPS and activation != "Relu":
+                pre = from_range(pre_activation_name(out))
+                layers[out] = _quantize_dense(params, x, pre, per_channel)
+                layers[out].table = lut_table(activation, pre, y)
+            else:
+                layers[out] = _quantize_dense(params, x, y, per_channel)
+                if activation == "Relu":
+                    layers[out].activation_min = y.zero_point
+
+    quantized = QuantizedModel(activations=activations, layers=layers, per_channel=per_channel)
+    quantized.fingerprint = _fingerprint(quantized)
+    return quantized
+
+
+@instrumented("quantize")
+def quantize_model(index: GraphIndex, calibration_data: np.ndarray, per_channel: bool = True) -> QuantizedModel:
+    """
+    Post-training int8 quantization of a model.
+
+    Runs the NumPy reference executor over the calibration samples to
+    record the range of every tensor, then picks asymmetric per-tensor
+    parameters for activations and symmetric per-channel (or per-tensor)
+    int8 weights with int32 biases for dense and Conv layers.
+
+    Args:
+        index: Graph index of the model
+        calibration_data: Samples stacked along a leading axis, each reshaped to the input shape
+        per_channel: Scale weights per output channel instead of per tensor
+
+    Returns:
+        QuantizedModel consumed by compile_model(quantization=...)
+    """
+    return quantize_from_ranges(index, calibrate(index, calibration_data), per_channel)
+
+
+# bytes of flash the int8 code generator emits for constants, computed from shapes only
+def quantized_constant_bytes(index: GraphIndex) -> int:
+    """
+    Flash needed by the int8 code for weights, biases, requantization tables and LUTs.
+
+    Only tensor shapes are used, so this works on models loaded without
+    their weight data. Initializers of ops the int8 code generator does not
+    handle are counted at one byte per element.
+    """
+    total = 0
+    counted = set()
+    for node in index.nodes:
+        if node.op_type in DENSE_OPS | CONV_OPS and len(node.input) > 1 and node.input[1] in index.weights:
+            out_features = _dense_out_features(index, node)
+            in_features = index.weights[node.input[1]].size // max(out_features, 1)
+            # int8 weights + int32 bias, multiplier and shift per output channel
+            total += out_features * in_features + 3 * 4 * out_features
+            counted.update(node.input[1:])
+            if index.fused.get(node.output[0]) in ("Sigmoid", "Tanh"):
+                total += 256
+        elif node.op_type in LUT_OPS:
+            total += 256
+        elif node.op_type not in ALIAS_OPS:
+            for name in node.input:
+                if name in index.weights and name not in counted:
+                    total += index.weights[name].size
+                    counted.add(name)
+    return total
+
+
+def _dense_out_features(index: GraphIndex, node: onnx.NodeProto) -> int:
+    shape = index.weights[node.input[1]].shape
+    if node.op_type in CONV_OPS:
+        return shape[0]
+    trans_b = any(a.name == "transB" and a.i for a in node.attribute) if node.op_type == "Gemm" else False
+    return shape[0] if trans_b else shape[-1]
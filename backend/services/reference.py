@@ -0,0 +1,346 @@
+from dataclasses import dataclass
+from typing import Callable, Optional
+import numpy as np
+import onnx
+
+from services.conv_geometry import Window2D, window_2d
+from services.load_model import GraphIndex
+from services.instrumentation import instrumented
+
+
+# ============= Reference kernels: ONNX semantics in NumPy (float32) =============
+
+def _attrs(node: onnx.NodeProto) -> dict:
+    return {attr.name: onnx.helper.get_attribute_value(attr) for attr in node.attribute}
+
+
+def _gemm(node, inputs, attrs, opset):
+    a, b = inputs[0], inputs[1]
+    if attrs.get("transA", 0):
+        a = a.T
+    if attrs.get("transB", 0):
+        b = b.T
+    y = attrs.get("alpha", 1.0) * (a @ b)
+    if len(inputs) > 2 and inputs[2] is not None:
+        y = y + attrs.get("beta", 1.0) * inputs[2]
+    return y
+
+
+def _softmax(node, inputs, attrs, opset):
+    x = inputs[0]
+    if opset < 13:
+        # older opsets flatten to 2D at axis and normalize each row
+        axis = attrs.get("axis", 1)
+        axis = axis + x.ndim if axis < 0 else axis
+        flat = x.reshape(int(np.prod(x.shape[:axis])), -1)
+        e = np.exp(flat - flat.max(axis=1, keepdims=True))
+        return (e / e.sum(axis=1, keepdims=True)).reshape(x.shape)
+    axis = attrs.get("axis", -1)
+    e = np.exp(x - x.max(axis=axis, keepdims=True))
+    return e / e.sum(axis=axis, keepdims=True)
+
+
+def _flatten(node, inputs, attrs, opset):
+    x = inputs[0]
+    axis = attrs.get("axis", 1)
+    axis = axis + x.ndim if axis < 0 else axis
+    return x.reshape(int(np.prod(x.shape[:axis])), -1)
+
+
+def _reshape(node, inputs, attrs, opset):
+    x, shape = inputs[0], [int(d) for d in inputs[1]]
+    if not attrs.get("allowzero", 0):
+        shape = [x.shape[k] if d == 0 else d for k, d in enumerate(shape)]
+    return x.reshape(shape)
+
+
+def _axes(inputs, attrs) -> Optional[list[int]]:
+    if len(inputs) > 1 and inputs[1] is not None:
+        return [int(a) for a in inputs[1]]
+    return attrs.get("axes")
+
+
+def _squeeze(node, inputs, attrs, opset):
+    axes = _axes(inputs, attrs)
+    return np.squeeze(inputs[0], axis=tuple(axes) if axes is not None else None)
+
+
+def _unsqueeze(node, inputs, attrs, opset):
+    x, axes = inputs[0], _axes(inputs, attrs)
+    rank = x.ndim + len(axes)
+    for axis in sorted(a + rank if a < 0 else a for a in axes):
+        x = np.expand_dims(x, axis)
+    return x
+
+
+def _batchnorm(node, inputs, attrs, opset):
+    x, scale, bias, mean, var = inputs[:5]
+    shape = (1, -1) + (1,) * (x.ndim - 2)
+    inv = scale / np.sqrt(var + attrs.get("epsilon", 1e-5))
+    return (x - mean.reshape(shape)) * inv.reshape(shape) + bias.reshape(shape)
+
+
+def _cast(node, inputs, attrs, opset):
+    return inputs[0].astype(onnx.helper.tensor_dtype_to_np_dtype(attrs["to"]))
+
+
+def _div(node, inputs, attrs, opset):
+    a, b = inputs
+    if np.issubdtype(a.dtype, np.integer) and np.issubdtype(b.dtype, np.integer):
+        # integer Div truncates toward zero
+        return (np.abs(a) // np.abs(b) * np.sign(a) * np.sign(b)).astype(a.dtype)
+    return a / b
+
+
+# input as [N, C, H, W] padded with fill so that every window of the geometry is in bounds
+def _pad_windows(x: np.ndarray, win: Window2D, fill: float, pad_fill: Optional[float] = None) -> np.ndarray:
+    x = x.reshape(x.shape[0], x.shape[1], win.in_h, win.in_w)
+    # ceil-mode windows may run past the end padding
+    extra_h = max((win.out_h - 1) * win.stride_h + win.dilation_h * (win.kernel_h - 1) + 1 - (win.in_h + win.pad_top + win.pad_bottom), 0)
+    extra_w = max((win.out_w - 1) * win.stride_w + win.dilation_w * (win.kernel_w - 1) + 1 - (win.in_w + win.pad_left + win.pad_right), 0)
+    pads = ((0, 0), (0, 0), (win.pad_top, win.pad_bottom), (win.pad_left, win.pad_right))
+    x = np.pad(x, pads, constant_values=fill if pad_fill is None else pad_fill)
+    return np.pad(x, ((0, 0), (0, 0), (0, extra_h), (0, extra_w)), constant_values=fill)
+
+
+# (ky, kx, [N, C, out_h, out_w] input values under that kernel tap)
+def _window_taps(padded: np.ndarray, win: Window2D):
+    for ky in range(win.kernel_h):
+        for kx in range(win.kernel_w):
+            y0, x0 = ky * win.dilation_h, kx * win.dilation_w
+            yield ky, kx, padded[
+                :, :,
+                y0:y0 + (win.out_h - 1) * win.stride_h + 1:win.stride_h,
+                x0:x0 + (win.out_w - 1) * win.stride_w + 1:win.stride_w
+            ]
+
+
+def _window_output(y: np.ndarray, x: np.ndarray, win: Window2D) -> np.ndarray:
+    spatial = (win.out_w,) if x.ndim == 3 else (win.out_h, win.out_w)
+    return y.reshape(y.shape[:2] + spatial)
+
+
+def _conv(node, inputs, attrs, opset):
+    x, w = inputs[0], inputs[1]
+    group = attrs.get("group", 1)
+    win = window_2d(attrs, list(x.shape[2:]), list(w.shape[2:]))
+    n, channels = x.shape[:2]
+    out_channels = w.shape[0]
+    w = w.reshape(group, out_channels // group, channels // group, win.kernel_h, win.kernel_w)
+
+    y = np.zeros((n, group, out_channels // group, win.out_h, win.out_w), dtype=np.float32)
+    for ky, kx, taps in _window_taps(_pad_windows(x, win, 0.0), win):
+        taps = taps.reshape(n, group, channels // group, win.out_h, win.out_w)
+        y += np.einsum("goc,ngchw->ngohw", w[:, :, :, ky, kx], taps)
+    y = y.reshape(n, out_channels, win.out_h, win.out_w)
+    if len(inputs) > 2 and inputs[2] is not None:
+        y = y + inputs[2].reshape(1, -1, 1, 1)
+    return _window_output(y, x, win)
+
+
+def _max_pool(node, inputs, attrs, opset):
+    x = inputs[0]
+    win = window_2d(attrs, list(x.shape[2:]))
+    taps = [t for _, _, t in _window_taps(_pad_windows(x, win, -np.inf), win)]
+    return _window_output(np.max(taps, axis=0), x, win)
+
+
+def _average_pool(node, inputs, attrs, opset):
+    x = inputs[0]
+    win = window_2d(attrs, list(x.shape[2:]))
+    total = sum(t for _, _, t in _window_taps(_pad_windows(x, win, 0.0), win))
+    # divide by the taps inside the input, or inside input and padding with count_include_pad
+    ones = np.ones(x.shape[:2] + (win.in_h, win.in_w), dtype=np.float32)
+    pad_fill = 1.0 if attrs.get("count_include_pad", 0) else 0.0
+    count = sum(t for _, _, t in _window_taps(_pad_windows(ones, win, 0.0, pad_fill), win))
+    return _window_output(total / count, x, win)
+
+
+def _constant(node, inputs, attrs, opset):
+    if "value" in attrs:
+        return onnx.numpy_helper.to_array(attrs["value"])
+    for name, dtype in (("value_float", np.float32), ("value_floats", np.float32), ("value_int", np.int64), ("value_ints", np.int64)):
+        if name in attrs:
+            return np.asarray(attrs[name], dtype=dtype)
+    raise ValueError(f"Constant '{node.name}' has no supported value attribute")
+
+
+# ONNX op -> fn(node, inputs, attrs, opset) returning the first output
+REFERENCE_OPS: dict[str, Callable] = {
+    "Gemm": _gemm,
+    "MatMul": lambda node, inputs, attrs, opset: np.matmul(inputs[0], inputs[1]),
+    "Relu": lambda node, inputs, attrs, opset: np.maximum(inputs[0], 0),
+    "Sigmoid": lambda node, inputs, attrs, opset: 1.0 / (1.0 + np.exp(-inputs[0])),
+    "Tanh": lambda node, inputs, attrs, opset: np.tanh(inputs[0]),
+    "Softmax": _softmax,
+    "Add": lambda node, inputs, attrs, opset: inputs[0] + inputs[1],
+    "Sub": lambda node, inputs, attrs, opset: inputs[0] - inputs[1],
+    "Mul": lambda node, inputs, attrs, opset: inputs[0] * inputs[1],
+    "Div": _div,
+    "BatchNormalization": _batchnorm,
+    "Flatten": _flatten,
+    "Reshape": _reshape,
+    "Dropout": lambda node, inputs, attrs, opset: inputs[0],
+    "Identity": lambda node, inputs, attrs, opset: inputs[0],
+    "Squeeze": _squeeze,
+    "Unsqueeze": _unsqueeze,
+    "Constant": _constant,
+    "Shape": lambda node, inputs, attrs, opset: np.array(inputs[0].shape, dtype=np.int64)[attrs.get("start", 0):attrs.get("end")],
+    "Gather": lambda node, inputs, attrs, opset: np.take(inputs[0], inputs[1], axis=attrs.get("axis", 0)),
+    "Concat": lambda node, inputs, attrs, opset: np.concatenate(inputs, axis=attrs["axis"]),
+    "Cast": _cast,
+    "Conv": _conv,
+    "MaxPool": _max_pool,
+    "AveragePool": _average_pool,
+    "GlobalAveragePool": lambda node, inputs, attrs, opset: inputs[0].mean(axis=tuple(range(2, inputs[0].ndim)), keepdims=True),
+    "GlobalMaxPool": lambda node, inputs, attrs, opset: inputs[0].max(axis=tuple(range(2, inputs[0].ndim)), keepdims=True),
+}
+
+# activation op applied to the output of a layer it was fused into
+def pre_activation_name(name: str) -> str:
+    """Name under which observers see a fused layer's output before its activation"""
+    return f"{name}/pre_activation"
+
+
+def run_reference(
+    index: GraphIndex,
+    feeds: dict[str, np.ndarray],
+    observer: Optional[Callable[[str, np.ndarray], None]] = None
+) -> dict[str, np.ndarray]:
+    """
+    Execute a model with NumPy, node by node in the index's topological order.
+
+    Intermediate values are dropped after their last reader. observer, if
+    given, is called with every tensor as it is produced (graph inputs
+    included), which is how calibration collects activation ranges. Layers
+    with a fused activation (see optimize_graph) also report their output
+    before the activation under pre_activation_name.
+
+    Args:
+        index: Graph index of the model
+        feeds: Graph input name -> array
+        observer: Optional callback (tensor name, value)
+
+    Returns:
+        Graph output name -> array
+    """
+    graph = index.model.graph
+    opsets = {op.domain: op.version for op in index.model.opset_import}
+    opset = opsets.get("", opsets.get("ai.onnx", 13))
+    outputs = [out.name for out in graph.output]
+
+    values = {}
+    for name, value in feeds.items():
+        values[name] = np.asarray(value)
+        if observer:
+            observer(name, values[name])
+    remaining = {name: len(readers) for name, readers in index.consumers.items()}
+
+    def read(name: str) -> Optional[np.ndarray]:
+        if not name:
+            return None
+        if name in values:
+            return values[name]
+        value = index.get_array(name)
+        if value is None:
+            raise ValueError(f"Tensor '{name}' has no value (missing graph input?)")
+        return value
+
+    for idx in index.order:
+        node = index.nodes[idx]
+        kernel = REFERENCE_OPS.get(node.op_type)
+        if kernel is None:
+            raise ValueError(f"Unsupported operator '{node.op_type}' in layer '{node.name or idx}'")
+        result = kernel(node, [read(name) for name in node.input], _attrs(node), opset)
+        result = np.asarray(result)
+        if not np.issubdtype(result.dtype, np.integer):
+            result = result.astype(np.float32, copy=False)
+        activation = index.fused.get(node.output[0])
+        if activation is not None:
+            if observer:
+                observer(pre_activation_name(node.output[0]), result)
+            result = np.asarray(REFERENCE_OPS[activation](node, [result], {}, opset), dtype=np.float32)
+        values[node.output[0]] = result
+        if observer:
+            observer(node.output[0], result)
+
+        # free values nobody reads any more
+        for name in node.input:
+            if name in remaining:
+                remaining[name] -= 1
+                if remaining[name] == 0 and name not in outputs:
+                    values.pop(name, None)
+
+    return {name: values[name] for name in outputs}
+
+
+@dataclass
+class GoldenVectors:
+    """Reference inputs and outputs of a model, flattened per sample, with the tolerance C output must meet."""
+    inputs: np.ndarray     # [samples, input size] float32
+    outputs: np.ndarray    # [samples, output size] float32
+    atol: float
+    rtol: float
+    output_name: str = ""  # graph output the vectors were taken from
+
+
+# tolerances of the generated code against the reference: float code differs only in summation order
+FLOAT_ATOL = 1e-4
+FLOAT_RTOL = 1e-3
+
+# int8 code: a few output quantization steps plus this fraction of the output range
+INT8_STEPS = 2
+INT8_RANGE_FRACTION = 0.05
+
+
+@instrumented("reference.golden")
+def golden_vectors(
+    index: GraphIndex,
+    samples: int = 4,
+    seed: int = 0,
+    output_scale: Optional[float] = None
+) -> GoldenVectors:
+    """
+    Run the reference executor on seeded random inputs to get golden vectors.
+
+    Inputs are standard normal samples shaped like the graph's first input
+    (dynamic dimensions at the index's batch size); outputs are the first
+    graph output. The same index and seed always give the same vectors.
+
+    Args:
+        index: Graph index of the model that is compiled
+        samples: Number of input/output pairs
+        seed: Seed of the random inputs
+        output_scale: Output quantization scale of an int8 model, widens the tolerance
+
+    Returns:
+        GoldenVectors with float32 inputs and outputs
+    """
+    if samples < 1:
+        raise ValueError(f"Golden vectors need at least one sample, got {samples}")
+    graph = index.model.graph
+    inputs = [inp.name for inp in graph.input if inp.name not in index.initializers]
+    if not inputs or not graph.output:
+        raise ValueError("Model has no graph input or output to generate golden vectors for")
+    info = index.shapes.get(inputs[0])
+    if info is None:
+        raise ValueError(f"Shape of input '{inputs[0]}' could not be inferred")
+    shape = [d if isinstance(d, int) and d > 0 else index.batch_size for d in info['shape']]
+
+    rng = np.random.default_rng(seed)
+    golden_in, golden_out = [], []
+    for _ in range(samples):
+        x = rng.standard_normal(shape).astype(np.float32)
+        y = run_reference(index, {inputs[0]: x})[graph.output[0].name]
+        golden_in.append(x.reshape(-1))
+        golden_out.append(np.asarray(y, dtype=np.float32).reshape(-1))
+    outputs = np.stack(golden_out)
+
+    atol, rtol = FLOAT_ATOL, FLOAT_RTOL
+    if output_scale is not None:
+        atol = INT8_STEPS * output_scale + INT8_RANGE_FRACTION * float(np.abs(outputs).max())
+        rtol = 0.0
+    return GoldenVectors(
+        inputs=np.stack(golden_in), outputs=outputs, atol=atol, rtol=rtol, output_name=graph.output[0].name
+    )
+
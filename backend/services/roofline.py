@@ -0,0 +1,106 @@
+from dataclasses import dataclass, field
+
+from services.boards import get_board
+from services.cost_model import LayerCost
+from services.load_model import GraphIndex
+
+
+@dataclass
+class RooflineCeilings:
+    """Compute and bandwidth ceilings of a board for one precision."""
+    peak_ops_per_s: float        # best kernel's arithmetic rate (2 ops per MAC)
+    sram_bytes_per_s: float      # activations
+    flash_bytes_per_s: float     # constants, read through the flash wait states
+    sram_ridge: float            # intensity (ops/byte) where the SRAM roof meets the compute roof
+    flash_ridge: float           # same for the flash roof
+
+
+@dataclass
+class RooflinePoint:
+    """One layer placed on the roofline."""
+    name: str
+    op_type: str
+    ops: int                     # FLOPs of the layer (integer ops for int8 code)
+    bytes_moved: int             # weights plus activations read and written
+    weight_bytes: int
+    intensity: float             # ops per byte moved
+    attainable_ops_per_s: float  # rate the slower of compute and memory allows
+    bound: str                   # 'compute' or 'memory'
+
+
+@dataclass
+class Roofline:
+    """Roofline of a model on a board: the ceilings and one point per layer that does work."""
+    board_name: str
+    precision: str
+    ceilings: RooflineCeilings
+    points: list[RooflinePoint] = field(default_factory=list)
+
+
+def board_ceilings(board_name: str, quantized: bool = False) -> RooflineCeilings:
+    board = get_board(board_name)
+    clock_hz = board['clock_hz']
+    best_mac = min(board['cycles_per_mac']['int8' if quantized else 'float'].values())
+    peak = 2.0 * clock_hz / best_mac
+    # one flash line per wait states + 1 cycles
+    flash = board['flash_line_bytes'] * clock_hz / (board['flash_wait_states'] + 1)
+    sram = float(board['memory_bandwidth'])
+    return RooflineCeilings(
+        peak_ops_per_s=peak,
+        sram_bytes_per_s=sram,
+        flash_bytes_per_s=flash,
+        sram_ridge=peak / sram,
+        flash_ridge=peak / flash
+    )
+
+
+def roofline(
+    index: GraphIndex,
+    costs: list[LayerCost],
+    board_name: str,
+    quantized: bool = False
+) -> Roofline:
+    """
+    Place every layer against the board's compute and bandwidth ceilings.
+
+    Arithmetic intensity is the layer's ops over all bytes it moves (weights
+    plus activations read and written). A layer is memory-bound when moving
+    its activations through SRAM and its weights through flash takes longer
+    than its arithmetic at the peak rate: such layers gain from int8 weights
+    and activations, compute-bound ones from better kernels or tiling.
+    Layers that move no data (views, constants) are left out.
+
+    Args:
+        index: Graph index the costs were computed from
+        costs: Per-node costs aligned with index.nodes (see cost_model.model_costs)
+        board_name: Target board in BOARD_CONSTRAINTS
+        quantized: Use the int8 kernels' compute ceiling
+
+    Returns:
+        Roofline with the board's ceilings and one RooflinePoint per layer
+    """
+    ceilings = board_ceilings(board_name, quantized)
+    points = []
+    for idx, (node, cost) in enumerate(zip(index.nodes, costs)):
+        moved = cost.bytes_read + cost.bytes_written
+        if moved == 0:
+            continue
+        compute_s = cost.flops / ceilings.peak_ops_per_s
+        memory_s = (moved - cost.weight_bytes) / ceilings.sram_bytes_per_s + cost.weight_bytes / ceilings.flash_bytes_per_s
+        points.append(RooflinePoint(
+            name=node.name or f"{node.op_type}_{idx}",
+            op_type=node.op_type,
+            ops=cost.flops,
+            bytes_moved=moved,
+            weight_bytes=cost.weight_bytes,
+            intensity=cost.flops / moved,
+            attainable_ops_per_s=cost.flops / max(compute_s, memory_s) if cost.flops else 0.0,
+            bound='compute' if compute_s >= memory_s else 'memory'
+        ))
+    return Roofline(
+        board_name=board_name,
+        precision='int8' if quantized else 'float',
+        ceilings=ceilings,
+        points=points
+    )
+
@@ -0,0 +1,233 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from services.load_model import GraphIndex
+from services.memory_planner import (
+    ALIAS_OPS,
+    INPLACE_OPS,
+    CONSTANT_OPS,
+    constant_tensor_names,
+    data_inputs,
+    kernel_scratch,
+    plan_memory,
+    tensor_bytes,
+    MemoryPlan,
+)
+from services.instrumentation import instrumented
+
+
+# partial schedules kept per step; graphs whose branches allow more orderings are searched as a beam
+MAX_FRONTIER = 128
+# candidate steps one search may evaluate; wide graphs get a narrower beam, down to a greedy walk
+MAX_SEARCH_STEPS = 400_000
+
+
+@dataclass
+class _State:
+    """Best way found to execute one set of nodes."""
+    peak: int               # largest live bytes at any step so far
+    live: int               # bytes live after the last node
+    parent: int             # executed-set mask before the last node
+    node: int               # last node executed, -1 for the empty schedule
+    ready: tuple[int, ...]  # nodes whose inputs are all computed, most recently enabled last
+
+
+class _MemoryModel:
+    """
+    Order-independent part of plan_memory's accounting.
+
+    Tensors that share a buffer through view ops form one group whose size is
+    its largest member; a group is live from the node producing it until every
+    node reading one of its members has run. Caller-owned graph inputs and
+    outputs cost nothing (unless external_io is False), and graph outputs are
+    never freed.
+    """
+
+    def __init__(self, index: GraphIndex, bytes_per_element: Optional[int], external_io: bool):
+        nodes = index.nodes
+        shapes = index.shapes
+        constants = constant_tensor_names(index)
+        graph = index.model.graph
+        graph_inputs = {inp.name for inp in graph.input if inp.name not in constants}
+        graph_outputs = {out.name for out in graph.output}
+
+        self.count = len(nodes)
+        self.free = [node.op_type in CONSTANT_OPS for node in nodes]
+        self.preds = [0] * self.count
+        self.succs: list[list[int]] = [[] for _ in range(self.count)]
+        for v, node in enumerate(nodes):
+            for name in node.input:
+                producer = index.producers.get(name)
+                if name and producer is not None and producer != v and not self.preds[v] >> producer & 1:
+                    self.preds[v] |= 1 << producer
+                    self.succs[producer].append(v)
+
+        # view outputs join their input's group unless both are caller-owned
+        external = (graph_inputs | graph_outputs) if external_io else set()
+        group = {}
+        for name in graph_inputs:
+            group[name] = name
+        for v in index.order:
+            node = nodes[v]
+            if self.free[v]:
+                continue
+            inputs = data_inputs(node, constants)
+            for k, name in enumerate(node.output):
+                if not name:
+                    continue
+                if k == 0 and node.op_type in ALIAS_OPS and inputs and not (group.get(inputs[0], inputs[0]) in external and name in external):
+                    group[name] = group.get(inputs[0], inputs[0])
+                else:
+                    group[name] = name
+
+        self.size: dict[str, int] = {}
+        self.external: set[str] = set()
+        self.persistent: set[str] = set()
+        for name, root in group.items():
+            self.size[root] = max(self.size.get(root, 0), tensor_bytes(shapes.get(name), bytes_per_element))
+            if name in external:
+                self.external.add(root)
+            if name in graph_outputs:
+                self.persistent.add(root)
+
+        consumed = set(index.consumers)
+        self.readers: dict[str, int] = {root: 0 for root in self.size}
+        self.reads: list[list[str]] = []
+        self.creates: list[list[str]] = []
+        for v, node in enumerate(nodes):
+            read = [] if self.free[v] else list(dict.fromkeys(group[name] for name in data_inputs(node, constants) if name in group))
+            for root in read:
+                self.readers[root] |= 1 << v
+            self.reads.append(read)
+            # unused secondary outputs are never written to the arena
+            self.creates.append([
+                name for k, name in enumerate(node.output)
+                if name and group.get(name) == name and not self.free[v]
+                and (k == 0 or name in consumed or name in graph_outputs)
+            ])
+
+        self.inplace = [node.op_type in INPLACE_OPS for node in nodes]
+        scratch = kernel_scratch(index, bytes_per_element)
+        self.scratch = [scratch.get(v, 0) for v in range(self.count)]
+        self.initial = sum(self.size[name] for name in graph_inputs if name not in self.external)
+
+    def cost(self, root: str) -> int:
+        return 0 if root in self.external else self.size[root]
+
+    def step(self, v: int, done: int, live: int) -> tuple[int, int]:
+        """(bytes live while v runs, bytes live after it) when v runs after the nodes in done"""
+        after_done = done | (1 << v)
+        created = sum(self.cost(root) for root in self.creates[v])
+        freed = 0
+        reusable = False
+        for root in self.reads[v]:
+            if root in self.persistent or self.readers[root] & ~after_done:
+                continue
+            freed += self.cost(root)
+            # an elementwise op may write over an input of its size that dies here
+            if self.inplace[v] and root not in self.external and self.cost(root) == created and created:
+                reusable = True
+        during = live + self.scratch[v] + (0 if reusable else created)
+        return during, live - freed + created
+
+
+# nodes to try next from a state: a constant, a node that cannot make the schedule worse, or every ready node
+def _expand(model: _MemoryModel, done: int, state: _State) -> list[tuple[int, int, int]]:
+    for v in state.ready:
+        if model.free[v]:
+            return [(v, state.live, state.live)]
+    steps = []
+    for v in reversed(state.ready):
+        during, live = model.step(v, done, state.live)
+        # running it now stays under the peak and leaves no more live bytes, so no order does better by delaying it
+        if during <= state.peak and live <= state.live:
+            return [(v, during, live)]
+        steps.append((v, during, live))
+    return steps
+
+
+# execution order with the lowest peak found, layer by layer over sets of executed nodes, None past max_steps
+def _search(model: _MemoryModel, max_frontier: int, max_steps: int) -> Optional[list[int]]:
+    full = (1 << model.count) - 1
+    ready = tuple(v for v in range(model.count) if not model.preds[v])
+    layers: list[dict[int, _State]] = [{0: _State(model.initial, model.initial, -1, -1, ready)}]
+    steps = 0
+    while full not in layers[-1]:
+        successors: dict[int, _State] = {}
+        for done, state in layers[-1].items():
+            steps += len(state.ready)
+            for v, during, live in _expand(model, done, state):
+                mask = done | (1 << v)
+                peak = max(state.peak, during)
+                best = successors.get(mask)
+                if best is not None and (best.peak, best.live) <= (peak, live):
+                    continue
+                # holds the parent's ready nodes until the state survives pruning
+                successors[mask] = _State(peak, live, done, v, state.ready)
+        if not successors:
+            raise ValueError("Model graph contains a cycle")
+        # each kept state costs up to its ready count per remaining step, keep what the budget pays for
+        remaining = model.count - len(layers)
+        width = max(len(state.ready) for state in successors.values())
+        frontier = min(max_frontier, (max_steps - steps) // max(width * remaining, 1))
+        if frontier < 1:
+            return None
+        if len(successors) > frontier:
+            successors = dict(sorted(successors.items(), key=lambda item: (item[1].peak, item[1].live))[:frontier])
+        for mask, state in successors.items():
+            enabled = tuple(u for u in model.succs[state.node] if not model.preds[u] & ~mask)
+            state.ready = tuple(u for u in state.ready if u != state.node) + enabled
+        layers.append(successors)
+
+    order = []
+    mask = full
+    for layer in reversed(layers[1:]):
+        state = layer[mask]
+        order.append(state.node)
+        mask = state.parent
+    return order[::-1]
+
+
+@instrumented("schedule")
+def schedule_nodes(
+    index: GraphIndex,
+    bytes_per_element: Optional[int] = None,
+    external_io: bool = True,
+    max_frontier: int = MAX_FRONTIER,
+    max_steps: int = MAX_SEARCH_STEPS
+) -> MemoryPlan:
+    """
+    Choose the execution order with the smallest arena and plan memory for it.
+
+    Any topological order computes the same result, but on graphs with
+    branches (residual blocks, Inception/SqueezeNet-style fan-outs) the
+    order decides which activations are live together. The search walks
+    the sets of executed nodes step by step, keeping for each set the order
+    with the lowest peak of live bytes (accounting for views, in-place
+    elementwise ops, kernel scratch and caller-owned I/O as plan_memory
+    does), which is exact when at most max_frontier sets are reachable at
+    a step and a beam search beyond that. The work is bounded by max_steps
+    candidate evaluations: wide graphs (many parallel branches) keep fewer
+    sets per step, down to a greedy walk, and fall back to the topological
+    order when even that would exceed the budget. The result is packed with
+    plan_memory and kept only if its arena is smaller than the graph's own
+    topological order, so chains and already good orders compile unchanged.
+
+    Args:
+        index: Graph index of the model
+        bytes_per_element: Element width override, 1 for int8 code
+        external_io: Graph inputs and outputs live in caller-owned buffers
+        max_frontier: Partial schedules kept per step
+        max_steps: Candidate steps the search may evaluate
+
+    Returns:
+        MemoryPlan of the chosen order (plan.order)
+    """
+    baseline = plan_memory(index, bytes_per_element=bytes_per_element, external_io=external_io)
+    if len(index.nodes) < 3:
+        return baseline
+    order = _search(_MemoryModel(index, bytes_per_element, external_io), max_frontier, max_steps)
+    if order is None or order == baseline.order:
+        return baseline
+    scheduled = plan_memory(index, order=order, bytes_per_element=bytes_per_element, external_io=external_io)
+    return scheduled if scheduled.arena_size < baseline.arena_size else baseline
@@ -121,14 +121,14 @@ export const useProfilingStore = create<ProfilingState>((set) => ({
         set({ profilingStatus: 'loading', profilingError: null });
 
         try {
+            // Profiling only needs the graph, the weight file's size is enough to validate it
             const formData = new FormData();
             formData.append('file', onnxFile);
 
+            const url = new URL(`${API_URL}/profile-model/profile`);
             if (dataFile) {
-                formData.append('data_file', dataFile);
+                url.searchParams.append('data_size', String(dataFile.size));
             }
-
-            const url = new URL(`${API_URL}/profile-model/profile`);
             url.searchParams.append('board_name', boardName);
             url.searchParams.append('quantized', String(quantized));
             url.searchParams.append('batch_size', String(batchSize));
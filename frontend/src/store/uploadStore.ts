@@ -37,6 +37,7 @@ interface UploadState {
     uploadStatus: UploadStatus;
     uploadError: string | null;
     modelInfo: ModelInfo | null;
+    modelId: string | null;     // Backend handle for the uploaded model
     onnxFileName: string | null;
     dataFileName: string | null;
     onnxFile: File | null;      // Store file for profiling
@@ -64,6 +65,7 @@ export const useUploadStore = create<UploadState>((set, get) => ({
     uploadStatus: 'idle',
     uploadError: null,
     modelInfo: null,
+    modelId: null,
     onnxFileName: null,
     dataFileName: null,
     onnxFile: null,
@@ -80,6 +82,7 @@ export const useUploadStore = create<UploadState>((set, get) => ({
         set({
             uploadStatus: 'uploading',
             uploadError: null,
+            modelId: null,
             onnxFileName: onnxFile.name,
             dataFileName: dataFile?.name || null,
             onnxFile: onnxFile,
@@ -122,6 +125,7 @@ export const useUploadStore = create<UploadState>((set, get) => ({
             set({
                 uploadStatus: 'success',
                 modelInfo: data.model_info,
+                modelId: data.model_id,
                 uploadError: null,
             });
         } catch (error) {
@@ -138,6 +142,7 @@ export const useUploadStore = create<UploadState>((set, get) => ({
             uploadStatus: 'idle',
             uploadError: null,
             modelInfo: null,
+            modelId: null,
             onnxFileName: null,
             dataFileName: null,
             onnxFile: null,
@@ -151,7 +156,7 @@ export const useUploadStore = create<UploadState>((set, get) => ({
     },
 
     compileModel: async (modelName: string, targetChip: string) => {
-        const { modelInfo } = get();
+        const { modelInfo, modelId } = get();
 
         if (!modelInfo) {
             set({
@@ -173,6 +178,7 @@ export const useUploadStore = create<UploadState>((set, get) => ({
                     'Content-Type': 'application/json',
                 },
                 body: JSON.stringify({
+                    model_id: modelId,
                     model_name: modelName,
                     target_chip: targetChip,
                 }),
@@ -219,6 +225,8 @@ export const useUploadStore = create<UploadState>((set, get) => ({
     },
 
     downloadCompiledFiles: async (modelName: string, targetChip: string) => {
+        const { modelId } = get();
+
         try {
             const response = await fetch(`${API_URL}/compile-model/download`, {
                 method: 'POST',
@@ -226,6 +234,7 @@ export const useUploadStore = create<UploadState>((set, get) => ({
                     'Content-Type': 'application/json',
                 },
                 body: JSON.stringify({
+                    model_id: modelId,
                     model_name: modelName,
                     target_chip: targetChip,
                 }),